@@ -0,0 +1,114 @@
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+
+/**
+ * Keeps bundletool loaded in one JVM and runs the commands read from stdin.
+ *
+ * Started by aab_installer/bundletool.py as
+ *
+ *     java -cp bundletool-all.jar BundletoolWorker.java
+ *
+ * It answers "READY" once bundletool is loaded (or "FAILED <reason>"). Each
+ * request is one line of tab-separated bundletool arguments; the reply is a
+ * header line "DONE <exit code> <stdout bytes> <stderr bytes>" followed by the
+ * captured stdout and stderr of the command. System.exit() calls made by
+ * bundletool are trapped so the JVM survives them.
+ */
+public class BundletoolWorker {
+
+    static final class ExitTrapped extends SecurityException {
+        final int status;
+
+        ExitTrapped(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    public static void main(String[] args) throws IOException {
+        OutputStream protocol = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+
+        Method bundletoolMain;
+        try {
+            bundletoolMain = Class.forName("com.android.tools.build.bundletool.BundleToolMain")
+                    .getMethod("main", String[].class);
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkPermission(Permission perm, Object context) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrapped(status);
+                }
+            });
+        } catch (Throwable t) {
+            writeLine(protocol, "FAILED " + t.toString().replace('\n', ' '));
+            return;
+        }
+        writeLine(protocol, "READY");
+
+        BufferedReader requests = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String line;
+        while ((line = requests.readLine()) != null) {
+            String[] command = line.isEmpty() ? new String[0] : line.split("\t", -1);
+            ByteArrayOutputStream out = new ByteArrayOutputStream();
+            ByteArrayOutputStream err = new ByteArrayOutputStream();
+            PrintStream savedOut = System.out;
+            PrintStream savedErr = System.err;
+            System.setOut(new PrintStream(out, true, "UTF-8"));
+            System.setErr(new PrintStream(err, true, "UTF-8"));
+
+            int status = 0;
+            try {
+                bundletoolMain.invoke(null, (Object) command);
+            } catch (InvocationTargetException e) {
+                status = exitStatus(e.getCause());
+            } catch (Throwable t) {
+                status = exitStatus(t);
+            } finally {
+                System.out.flush();
+                System.err.flush();
+                System.setOut(savedOut);
+                System.setErr(savedErr);
+            }
+
+            byte[] stdout = out.toByteArray();
+            byte[] stderr = err.toByteArray();
+            writeLine(protocol, "DONE " + status + " " + stdout.length + " " + stderr.length);
+            protocol.write(stdout);
+            protocol.write(stderr);
+            protocol.flush();
+        }
+    }
+
+    private static int exitStatus(Throwable thrown) {
+        for (Throwable t = thrown; t != null; t = t.getCause()) {
+            if (t instanceof ExitTrapped) {
+                return ((ExitTrapped) t).status;
+            }
+        }
+        thrown.printStackTrace();
+        return 1;
+    }
+
+    private static void writeLine(OutputStream protocol, String line) throws IOException {
+        protocol.write((line + "\n").getBytes(StandardCharsets.UTF_8));
+        protocol.flush();
+    }
+}
@@ -0,0 +1,8 @@
+"""
+Shared helpers for the AAB installer scripts.
+
+The package does not import PyQt5; the GUI lives in the top-level scripts and
+`python -m aab_installer` is the headless entry point.
+"""
+
+from .core import build_and_install_apks, build_apks, generate_keystore, get_connected_devices
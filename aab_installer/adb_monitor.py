@@ -0,0 +1,172 @@
+"""
+Live device table from the adb server's `host:track-devices` service.
+
+Talks the adb host protocol directly over the local server socket: each
+request is a 4-digit hex length plus payload, answered by OKAY or FAIL.
+track-devices then pushes the full device list every time a device
+changes state. Reading the table never spawns a process.
+"""
+
+import os
+import socket
+import threading
+
+
+ADB_HOST = "127.0.0.1"
+ADB_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", "5037"))
+READY_STATE = "device"
+
+
+class AdbProtocolError(Exception):
+    pass
+
+
+def _read_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("adb server closed the connection")
+        data += chunk
+    return data
+
+
+def _read_message(sock):
+    length = int(_read_exactly(sock, 4), 16)
+    return _read_exactly(sock, length).decode("utf-8", "replace")
+
+
+def send_request(sock, payload):
+    """Send one host request and consume the OKAY/FAIL status."""
+    data = payload.encode("utf-8")
+    sock.sendall(b"%04x" % len(data) + data)
+    status = _read_exactly(sock, 4)
+    if status == b"FAIL":
+        raise AdbProtocolError(_read_message(sock))
+    if status != b"OKAY":
+        raise AdbProtocolError(f"unexpected adb status {status!r}")
+
+
+def adb_command(adb, device_id, *args):
+    """[adb, "-s", device_id, *args]; `adb` may also be a list such as [adb, "-H", host, "-P", port]."""
+    return [*([adb] if isinstance(adb, str) else adb), "-s", device_id, *args]
+
+
+def parse_device_list(text):
+    """{serial: state} from the `serial<TAB>state` lines adb sends."""
+    devices = {}
+    for line in text.splitlines():
+        parts = line.strip().split("\t")
+        if len(parts) >= 2 and parts[0]:
+            devices[parts[0]] = parts[1]
+    return devices
+
+
+def query_devices(host=ADB_HOST, port=ADB_PORT, timeout=5.0):
+    """One-shot `host:devices` query; raises OSError when no server is listening."""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        send_request(sock, "host:devices")
+        return parse_device_list(_read_message(sock))
+
+
+class DeviceMonitor:
+    """Keeps {serial: state} up to date from a `host:track-devices` connection.
+
+    Reconnects after `reconnect_delay` seconds when the server goes away;
+    while disconnected the table is empty. Listeners are called as
+    listener(serial, old_state, new_state) from the monitor thread, with
+    None standing for "not connected".
+    """
+
+    def __init__(self, host=ADB_HOST, port=ADB_PORT, reconnect_delay=1.0):
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+        self._table = {}
+        self._listeners = []
+        self._cond = threading.Condition()
+        self._ready = False
+        self._attempted = False
+        self._stopped = threading.Event()
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"adb-monitor-{self.port}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def add_listener(self, listener):
+        with self._cond:
+            self._listeners.append(listener)
+
+    def wait_ready(self, timeout=None):
+        """Wait for the first connection attempt; True if the table is live."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._attempted, timeout)
+            return self._ready
+
+    def table(self):
+        with self._cond:
+            return dict(self._table)
+
+    def devices(self, state=READY_STATE):
+        with self._cond:
+            return sorted(serial for serial, device_state in self._table.items() if device_state == state)
+
+    def wait_for(self, predicate, timeout=None):
+        """Block until predicate(table) is true, e.g. a device coming back online."""
+        with self._cond:
+            return self._cond.wait_for(lambda: predicate(dict(self._table)), timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=5.0) as sock:
+                    send_request(sock, "host:track-devices")
+                    sock.settimeout(None)
+                    self._sock = sock
+                    while not self._stopped.is_set():
+                        self._update(parse_device_list(_read_message(sock)))
+            except (OSError, AdbProtocolError, ValueError):
+                pass
+            finally:
+                self._sock = None
+            self._update({}, connected=False)
+            self._stopped.wait(self.reconnect_delay)
+
+    def _update(self, table, connected=True):
+        with self._cond:
+            old = self._table
+            self._table = table
+            self._ready = connected
+            self._attempted = True
+            changes = [(serial, old.get(serial), table.get(serial))
+                       for serial in sorted(set(old) | set(table)) if old.get(serial) != table.get(serial)]
+            listeners = list(self._listeners)
+            self._cond.notify_all()
+        for serial, old_state, new_state in changes:
+            for listener in listeners:
+                listener(serial, old_state, new_state)
+
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+
+def get_device_monitor(host=ADB_HOST, port=ADB_PORT):
+    """Shared, already started monitor for one adb server."""
+    with _monitors_lock:
+        if (host, port) not in _monitors:
+            _monitors[(host, port)] = DeviceMonitor(host, port).start()
+        return _monitors[(host, port)]
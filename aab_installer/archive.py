@@ -0,0 +1,484 @@
+"""
+Read AAB and .apks metadata in-process, without bundletool or extraction.
+
+Archives are memory-mapped and opened with zipfile, so only the entries that
+are needed get read: `toc.pb` (bundletool's BuildApksResult) and the binary
+AndroidManifest.xml of the base APK for an .apks, and the protobuf
+`<module>/manifest/AndroidManifest.xml` files for an AAB. Both protobufs are
+decoded with a minimal wire-format reader, so there is no protobuf
+dependency. read_signing_certificates() takes the certificates from the APK
+Signature Scheme v3/v2 block of the base APK, read in place from the map.
+Results are cached per (path, size, mtime).
+"""
+
+import functools
+import io
+import mmap
+import os
+import struct
+import zipfile
+from contextlib import contextmanager
+
+
+ABI_ALIASES = {1: "armeabi", 2: "armeabi-v7a", 3: "arm64-v8a", 4: "x86", 5: "x86_64", 6: "mips", 7: "mips64",
+               8: "riscv64"}
+DENSITY_ALIASES = {1: "nodpi", 2: "ldpi", 3: "mdpi", 4: "tvdpi", 5: "hdpi", 6: "xhdpi", 7: "xxhdpi", 8: "xxxhdpi"}
+DELIVERY_TYPES = {1: "install-time", 2: "on-demand", 3: "fast-follow"}
+ANDROID_NS = "http://schemas.android.com/apk/res/android"
+APK_SIG_BLOCK_MAGIC = b"APK Sig Block 42"
+# APK Signature Scheme v3 and v2 block ids, newest first
+SIGNATURE_SCHEMES = (0xF05368C0, 0x7109871A)
+
+
+# --- protobuf wire format -------------------------------------------------------------------------------------
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def proto_fields(data):
+    """Yield (field_number, value) of a protobuf message; value is an int or bytes."""
+    pos, end = 0, len(data)
+    while pos < end:
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = struct.unpack_from("<Q", data, pos)[0], pos + 8
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = bytes(data[pos:pos + length]), pos + length
+        elif wire_type == 5:
+            value, pos = struct.unpack_from("<I", data, pos)[0], pos + 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire_type}")
+        yield number, value
+
+
+def _fields(data, number):
+    return [value for field, value in proto_fields(data) if field == number]
+
+
+def _field(data, number, default=None):
+    values = _fields(data, number)
+    return values[-1] if values else default
+
+
+# --- android binary XML (compiled AndroidManifest.xml inside APKs) -------------------------------------------
+
+_RES_STRING_POOL = 0x0001
+_RES_XML_START_ELEMENT = 0x0102
+_TYPE_STRING = 0x03
+_TYPE_INT_DEC = 0x10
+_TYPE_INT_HEX = 0x11
+
+
+def _string_pool(data, offset):
+    header_size, chunk_size = struct.unpack_from("<HI", data, offset + 2)
+    count, _, flags, strings_start, _ = struct.unpack_from("<IIIII", data, offset + 8)
+    utf8 = bool(flags & (1 << 8))
+    offsets = struct.unpack_from(f"<{count}I", data, offset + header_size)
+    strings = []
+    for string_offset in offsets:
+        pos = offset + strings_start + string_offset
+        if utf8:
+            pos += 2 if data[pos] & 0x80 else 1  # length in UTF-16 units
+            length = data[pos]
+            if length & 0x80:
+                length = ((length & 0x7F) << 8) | data[pos + 1]
+                pos += 1
+            pos += 1
+            strings.append(bytes(data[pos:pos + length]).decode("utf-8", "replace"))
+        else:
+            length = struct.unpack_from("<H", data, pos)[0]
+            if length & 0x8000:
+                length = ((length & 0x7FFF) << 16) | struct.unpack_from("<H", data, pos + 2)[0]
+                pos += 2
+            pos += 2
+            strings.append(bytes(data[pos:pos + length * 2]).decode("utf-16-le", "replace"))
+    return strings
+
+
+def binary_manifest_attributes(data):
+    """Attributes of the <manifest> and <uses-sdk> elements of a binary AndroidManifest.xml.
+
+    Returns {"manifest": {name: value}, "uses-sdk": {name: value}}; integer
+    attributes come back as int.
+    """
+    strings = []
+    found = {}
+    offset = struct.unpack_from("<H", data, 2)[0]
+    while offset + 8 <= len(data) and len(found) < 2:
+        chunk_type, header_size, chunk_size = struct.unpack_from("<HHI", data, offset)
+        if chunk_type == _RES_STRING_POOL:
+            strings = _string_pool(data, offset)
+        elif chunk_type == _RES_XML_START_ELEMENT:
+            name_index = struct.unpack_from("<I", data, offset + 20)[0]
+            attr_start, attr_size, attr_count = struct.unpack_from("<HHH", data, offset + 24)
+            element = strings[name_index]
+            if element in ("manifest", "uses-sdk"):
+                attributes = {}
+                for index in range(attr_count):
+                    pos = offset + 16 + attr_start + index * attr_size
+                    _, name, raw, _, _, data_type, value = struct.unpack_from("<IIIHBBI", data, pos)
+                    if data_type in (_TYPE_INT_DEC, _TYPE_INT_HEX):
+                        attributes[strings[name]] = value
+                    elif data_type == _TYPE_STRING or raw != 0xFFFFFFFF:
+                        attributes[strings[name]] = strings[raw if raw != 0xFFFFFFFF else value]
+                found[element] = attributes
+        offset += chunk_size
+    return found
+
+
+# --- aapt2 protobuf XML (AndroidManifest.xml inside AABs) ----------------------------------------------------
+
+def proto_manifest_attributes(data):
+    """Same as binary_manifest_attributes, for the protobuf XmlNode manifests of an AAB module."""
+    found = {}
+
+    def visit(element):
+        name = _field(element, 3, b"").decode("utf-8")
+        if name in ("manifest", "uses-sdk"):
+            attributes = {}
+            for attribute in _fields(element, 4):
+                attr_name = _field(attribute, 2, b"").decode("utf-8")
+                value = _field(attribute, 3, b"").decode("utf-8")
+                item = _field(attribute, 6)
+                primitive = _field(item, 7) if item else None
+                number = _field(primitive, 6) if primitive else None
+                if number is not None:
+                    attributes[attr_name] = number
+                elif value:
+                    attributes[attr_name] = int(value) if value.isdigit() else value
+            found[name] = attributes
+        for child in _fields(element, 5):
+            child_element = _field(child, 1)
+            if child_element is not None:
+                visit(child_element)
+
+    root = _field(data, 1)
+    if root is not None:
+        visit(root)
+    return found
+
+
+# --- archives ------------------------------------------------------------------------------------------------
+
+class _MappedFile:
+    """Seekable read-only file over part of a mapping, so zipfile can open it (and stored inner zips) in place."""
+
+    def __init__(self, buffer, start, length):
+        self._view = memoryview(buffer)[start:start + length]
+        self._pos = 0
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        data = bytes(self._view[self._pos:end])
+        self._pos = max(self._pos, end)
+        return data
+
+    def close(self):
+        self._view.release()
+
+
+@contextmanager
+def open_mapped_zip(mapped):
+    """Yield a ZipFile that reads the archive in `mapped` (an mmap or other buffer) in place."""
+    view = _MappedFile(mapped, 0, len(mapped))
+    try:
+        with zipfile.ZipFile(view) as archive:
+            yield archive
+    finally:
+        view.close()
+
+
+@contextmanager
+def _open_zip(path):
+    """Yield (mmap, ZipFile) for `path`."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with open_mapped_zip(mapped) as archive:
+            yield mapped, archive
+
+
+def _read_inner_manifest(mapped, archive, name):
+    """Manifest attributes of the APK `name` inside an open .apks, or {} if it is not a readable APK."""
+    info = archive.getinfo(name)
+    inner = None
+    try:
+        if info.compress_type == zipfile.ZIP_STORED:
+            name_length, extra_length = struct.unpack_from("<HH", mapped, info.header_offset + 26)
+            inner = _MappedFile(mapped, info.header_offset + 30 + name_length + extra_length, info.file_size)
+        else:
+            inner = archive.open(info)
+        with zipfile.ZipFile(inner) as apk:
+            return binary_manifest_attributes(apk.read("AndroidManifest.xml"))
+    except (zipfile.BadZipFile, KeyError, IndexError, struct.error):
+        return {}
+    finally:
+        if inner is not None:
+            inner.close()
+
+
+class ApkEntry:
+    def __init__(self, path, module, split_id, master, abis, languages, densities, min_sdk, size, variant=0,
+                 variant_min_sdk=None, standalone=False):
+        self.path = path
+        self.module = module
+        self.split_id = split_id
+        self.master = master
+        self.abis = abis
+        self.languages = languages
+        self.densities = densities
+        self.min_sdk = min_sdk
+        self.size = size
+        # variant number and the minimum SDK it targets; standalone APKs are for devices without split support
+        self.variant = variant
+        self.variant_min_sdk = variant_min_sdk
+        self.standalone = standalone
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class ApksInfo:
+    def __init__(self, path, package, version_code, version_name, min_sdk, apks, modules):
+        self.path = path
+        self.package = package
+        self.version_code = version_code
+        self.version_name = version_name
+        self.min_sdk = min_sdk
+        self.apks = apks
+        self.modules = modules
+
+    @property
+    def total_size(self):
+        return sum(apk.size for apk in self.apks)
+
+    @property
+    def abis(self):
+        return sorted({abi for apk in self.apks for abi in apk.abis})
+
+    def summary(self):
+        return (f"{self.package} {self.version_name or ''} (versionCode {self.version_code}): "
+                f"{len(self.apks)} APKs in {len(self.modules)} modules, {self.total_size / 2 ** 20:.1f} MB"
+                + (f", ABIs {', '.join(self.abis)}" if self.abis else ""))
+
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "package": self.package,
+            "version_code": self.version_code,
+            "version_name": self.version_name,
+            "min_sdk": self.min_sdk,
+            "total_size": self.total_size,
+            "modules": self.modules,
+            "apks": [apk.to_dict() for apk in self.apks],
+        }
+
+
+class AabInfo:
+    def __init__(self, path, package, version_code, version_name, min_sdk, modules, size):
+        self.path = path
+        self.package = package
+        self.version_code = version_code
+        self.version_name = version_name
+        self.min_sdk = min_sdk
+        self.modules = modules
+        self.size = size
+
+    def summary(self):
+        return (f"{self.package} {self.version_name or ''} (versionCode {self.version_code}): "
+                f"{len(self.modules)} modules, {self.size / 2 ** 20:.1f} MB")
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def _targeting(targeting):
+    abis, languages, densities, min_sdk = [], [], [], None
+    if targeting:
+        for abi_targeting in _fields(targeting, 1):
+            abis.extend(ABI_ALIASES.get(_field(abi, 1, 0), "unknown") for abi in _fields(abi_targeting, 1))
+        for language_targeting in _fields(targeting, 3):
+            languages.extend(value.decode("utf-8") for value in _fields(language_targeting, 1))
+        for density_targeting in _fields(targeting, 4):
+            for density in _fields(density_targeting, 1):
+                alias, dpi = _field(density, 1), _field(density, 2)
+                densities.append(DENSITY_ALIASES.get(alias, "unknown") if alias is not None else str(dpi))
+        min_sdk = _min_sdk(_fields(targeting, 5))
+    return abis, languages, densities, min_sdk
+
+
+def _min_sdk(sdk_targetings):
+    """Minimum SDK of a list of SdkVersionTargeting messages, or None."""
+    min_sdk = None
+    for sdk_targeting in sdk_targetings:
+        for sdk in _fields(sdk_targeting, 1):
+            minimum = _field(sdk, 1)
+            if minimum is not None:
+                min_sdk = _field(minimum, 1, 0)
+    return min_sdk
+
+
+def _parse_toc(toc, sizes):
+    """(package, [ApkEntry], {module: delivery type}) from a BuildApksResult."""
+    package = _field(toc, 4, b"").decode("utf-8")
+    apks, modules = [], {}
+    for variant in _fields(toc, 1):
+        number = _field(variant, 3, 0)
+        variant_min_sdk = _min_sdk(_fields(_field(variant, 1, b""), 1))
+        for apk_set in _fields(variant, 2):
+            metadata = _field(apk_set, 1, b"")
+            module = _field(metadata, 1, b"").decode("utf-8")
+            modules[module] = DELIVERY_TYPES.get(_field(metadata, 6, 0), "install-time")
+            for description in _fields(apk_set, 2):
+                path = _field(description, 2, b"").decode("utf-8")
+                split = _field(description, 3)
+                split_id = _field(split, 1, b"").decode("utf-8") if split is not None else ""
+                master = bool(_field(split, 2, 0)) if split is not None else True
+                abis, languages, densities, min_sdk = _targeting(_field(description, 1))
+                apks.append(ApkEntry(path, module, split_id, master, abis, languages, densities, min_sdk,
+                                     sizes.get(path, 0), number, variant_min_sdk, _field(description, 4) is not None))
+    return package, apks, modules
+
+
+def _base_apk(apks, names):
+    """Path of the base module's master APK (the split one when there are standalone APKs too), or None."""
+    bases = sorted((not apk.path.startswith("splits/"), not apk.path.endswith("-master.apk"), apk.path)
+                   for apk in apks if apk.module == "base" and apk.master and apk.path in names)
+    return bases[0][-1] if bases else None
+
+
+@functools.lru_cache(maxsize=64)
+def _read_apks(path, size, mtime_ns):
+    with _open_zip(path) as (mapped, archive):
+        sizes = {info.filename: info.file_size for info in archive.infolist()}
+        package, apks, modules = _parse_toc(archive.read("toc.pb"), sizes) if "toc.pb" in sizes else ("", [], {})
+        if not apks:
+            apks = [ApkEntry(name, "base", "", True, [], [], [], None, file_size)
+                    for name, file_size in sizes.items() if name.endswith(".apk")]
+        base = _base_apk(apks, sizes)
+        attributes = _read_inner_manifest(mapped, archive, base) if base else {}
+    manifest = attributes.get("manifest", {})
+    return ApksInfo(path, package or manifest.get("package", ""), manifest.get("versionCode"),
+                    manifest.get("versionName"), attributes.get("uses-sdk", {}).get("minSdkVersion"), apks,
+                    modules or {"base": "install-time"})
+
+
+def aab_info(archive, path, size):
+    """AabInfo from an AAB already opened as a ZipFile."""
+    modules = sorted({name.split("/", 1)[0] for name in archive.namelist()
+                      if name.endswith("/manifest/AndroidManifest.xml")})
+    attributes = proto_manifest_attributes(archive.read("base/manifest/AndroidManifest.xml"))
+    manifest = attributes.get("manifest", {})
+    return AabInfo(path, manifest.get("package", ""), manifest.get("versionCode"), manifest.get("versionName"),
+                   attributes.get("uses-sdk", {}).get("minSdkVersion"), modules, size)
+
+
+@functools.lru_cache(maxsize=64)
+def _read_aab(path, size, mtime_ns):
+    with _open_zip(path) as (_, archive):
+        return aab_info(archive, path, size)
+
+
+def _length_prefixed(data, pos):
+    length = struct.unpack_from("<I", data, pos)[0]
+    return data[pos + 4:pos + 4 + length], pos + 4 + length
+
+
+def _length_prefixed_items(data):
+    items, pos = [], 0
+    while pos < len(data):
+        item, pos = _length_prefixed(data, pos)
+        items.append(item)
+    return items
+
+
+def apk_signing_certificates(data):
+    """DER certificates of the first signer in the v3 (or v2) APK signature block of APK bytes, or []."""
+    tail_start = max(0, len(data) - 0xFFFF - 22)
+    eocd = bytes(data[tail_start:]).rfind(b"PK\x05\x06")
+    if eocd < 0:
+        return []
+    central_directory = struct.unpack_from("<I", data, tail_start + eocd + 16)[0]
+    if central_directory < 32 or bytes(data[central_directory - 16:central_directory]) != APK_SIG_BLOCK_MAGIC:
+        return []
+    block_size = struct.unpack_from("<Q", data, central_directory - 24)[0]
+    # size, (length, id, value) pairs, size again, magic; the first size is not counted in block_size
+    pos, blocks = central_directory - block_size, {}
+    while pos < central_directory - 24:
+        length, block_id = struct.unpack_from("<QI", data, pos)
+        blocks[block_id] = data[pos + 12:pos + 8 + length]
+        pos += 8 + length
+    for scheme in SIGNATURE_SCHEMES:
+        if scheme in blocks:
+            signers = _length_prefixed_items(_length_prefixed(blocks[scheme], 0)[0])
+            signed_data = _length_prefixed(signers[0], 0)[0]
+            _, pos = _length_prefixed(signed_data, 0)  # digests
+            return [bytes(cert) for cert in _length_prefixed_items(_length_prefixed(signed_data, pos)[0])]
+    return []
+
+
+@functools.lru_cache(maxsize=64)
+def _read_certificates(path, size, mtime_ns):
+    info = _read_apks(path, size, mtime_ns)
+    with _open_zip(path) as (mapped, archive):
+        base = _base_apk(info.apks, set(archive.namelist()))
+        if base is None:
+            return ()
+        entry = archive.getinfo(base)
+        if entry.compress_type != zipfile.ZIP_STORED:
+            return tuple(apk_signing_certificates(archive.read(base)))
+        name_length, extra_length = struct.unpack_from("<HH", mapped, entry.header_offset + 26)
+        start = entry.header_offset + 30 + name_length + extra_length
+        view = memoryview(mapped)[start:start + entry.file_size]
+        try:
+            return tuple(apk_signing_certificates(view))
+        finally:
+            view.release()
+
+
+def read_signing_certificates(path):
+    """Signing certificates (DER) of the base APK of an .apks; empty when it has no v2/v3 signature."""
+    st = os.stat(path)
+    try:
+        return list(_read_certificates(os.path.abspath(path), st.st_size, st.st_mtime_ns))
+    except (zipfile.BadZipFile, KeyError, IndexError, struct.error, ValueError) as e:
+        raise ValueError(f"cannot read {path}: {e}")
+
+
+def read_apks(path):
+    """ApksInfo for an .apks built by bundletool. Raises ValueError for unreadable archives."""
+    st = os.stat(path)
+    try:
+        return _read_apks(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    except (zipfile.BadZipFile, KeyError, IndexError, struct.error, ValueError) as e:
+        raise ValueError(f"cannot read {path}: {e}")
+
+
+def read_aab(path):
+    """AabInfo for an Android App Bundle. Raises ValueError for unreadable archives."""
+    st = os.stat(path)
+    try:
+        return _read_aab(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    except (zipfile.BadZipFile, KeyError, IndexError, struct.error, ValueError) as e:
+        raise ValueError(f"cannot read {path}: {e}")
@@ -0,0 +1,234 @@
+"""
+Install many AABs on every connected device in one run.
+
+Builds run on a pool sized by CPU count and available memory. Each device
+has its own install queue: as soon as an AAB's .apks is built, it is queued
+on every device, so devices start installing while later AABs are still
+building. A device installs one .apks at a time, and at most `max_workers`
+installs run across the rack. With endpoints (aab_installer.farm), the
+devices of several adb servers are used, each through its own server. Each
+.apks stays pinned in the cache until every device has installed it.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .cache import release
+from .core import build_apks, get_connected_devices
+from .farm import discover_devices, farm_installer
+from .parallel import DEFAULT_MAX_WORKERS, DeviceResult, install_on_device, install_with_retry
+from .preflight import check_aab, check_keystore
+from .workspace import export_artifacts
+
+
+# Rough resident size of one bundletool build-apks JVM.
+BUILD_MEMORY_BYTES = 1536 * 1024 ** 2
+
+
+def discover_aabs(source):
+    """AAB paths from a directory, a JSON manifest (list of paths or {"aab": path}) or a text manifest."""
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(".aab"))
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        content = f.read()
+    if source.lower().endswith(".json"):
+        entries = [entry["aab"] if isinstance(entry, dict) else entry for entry in json.loads(content)]
+    else:
+        entries = [line.strip() for line in content.splitlines()]
+        entries = [entry for entry in entries if entry and not entry.startswith("#")]
+    return [os.path.join(base_dir, entry) for entry in entries]
+
+
+def _available_memory():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_build_workers():
+    workers = os.cpu_count() or 1
+    memory = _available_memory()
+    if memory:
+        workers = min(workers, memory // BUILD_MEMORY_BYTES)
+    return max(1, workers)
+
+
+class BatchReport:
+    def __init__(self, aab_paths, device_ids):
+        self.aab_paths = aab_paths
+        self.device_ids = device_ids
+        self.builds = {}
+        self.results = {aab_path: {} for aab_path in aab_paths}
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, aab_path, result):
+        with self._lock:
+            self.results[aab_path][result.device_id] = result
+
+    @property
+    def ok(self):
+        """True when every AAB was built and installed on every device."""
+        with self._lock:
+            return all(self.builds.get(aab_path) for aab_path in self.aab_paths) and all(
+                device_id in self.results[aab_path] and self.results[aab_path][device_id].ok
+                for aab_path in self.aab_paths for device_id in self.device_ids)
+
+    def __bool__(self):
+        return self.ok
+
+    def to_dict(self):
+        return {
+            "ok": self.ok,
+            "elapsed": round(self.elapsed, 3),
+            "devices": self.device_ids,
+            "aabs": [
+                {
+                    "aab": aab_path,
+                    "apks": self.builds.get(aab_path),
+                    "devices": [result.to_dict() for result in self.results[aab_path].values()],
+                }
+                for aab_path in self.aab_paths
+            ],
+        }
+
+    def format_matrix(self):
+        """Plain-text AAB x device table."""
+        names = [os.path.basename(aab_path) for aab_path in self.aab_paths]
+        first_width = max([len("AAB")] + [len(name) for name in names])
+        widths = [max(len(device_id), 6) for device_id in self.device_ids]
+        lines = ["  ".join(["AAB".ljust(first_width)] + [d.ljust(w) for d, w in zip(self.device_ids, widths)])]
+        for aab_path, name in zip(self.aab_paths, names):
+            cells = []
+            for device_id, width in zip(self.device_ids, widths):
+                result = self.results[aab_path].get(device_id)
+                if not self.builds.get(aab_path):
+                    cell = "build"
+                elif result is None:
+                    cell = "-"
+                else:
+                    cell = f"{result.duration:.1f}s" if result.ok else "FAIL"
+                cells.append(cell.ljust(width))
+            lines.append("  ".join([name.ljust(first_width)] + cells))
+        return "\n".join(line.rstrip() for line in lines)
+
+
+def run_batch(bundletool_path, aab_paths, keystore_path, alias, storepass, keypass,
+              build_workers=None, max_workers=DEFAULT_MAX_WORKERS, java="java", adb="adb", profile=None,
+              endpoints=None, export_dir=None):
+    """Build every AAB of `aab_paths` and install each on every device; returns a BatchReport.
+
+    With `export_dir`, each .apks is also placed there as <aab name>.apks
+    (workspace.export_artifacts) as soon as it is built. Builds are not per
+    device spec: a `profile` with per_device_spec raises ValueError. A build
+    that raises fails that AAB on every device; the other AABs go on.
+    """
+    if profile is not None and profile.per_device_spec:
+        raise ValueError(f"profile {profile.name} builds per device spec, which batch does not support")
+    started = time.monotonic()
+    if endpoints:
+        device_ids, install = discover_devices(endpoints), farm_installer(endpoints, adb)
+    else:
+        device_ids, install = get_connected_devices(adb), install_on_device
+    report = BatchReport(aab_paths, device_ids)
+    install_slots = threading.Semaphore(max(1, max_workers))
+    device_queues = {device_id: queue.Queue() for device_id in device_ids}
+    # aab_path -> devices that have not installed its .apks yet
+    pending_installs = {}
+    pending_lock = threading.Lock()
+
+    def installed(aab_path, apks_path):
+        with pending_lock:
+            pending_installs[aab_path] -= 1
+            done = pending_installs[aab_path] == 0
+        if done:
+            release(apks_path)
+
+    def device_loop(device_id):
+        while True:
+            item = device_queues[device_id].get()
+            if item is None:
+                return
+            aab_path, apks_path = item
+            started = time.monotonic()
+            try:
+                with install_slots:
+                    result = install_with_retry(install, bundletool_path, apks_path, device_id, java)
+            except Exception as e:
+                # the device keeps taking the next AABs
+                result = DeviceResult(device_id, None, "", str(e) or type(e).__name__, started, time.monotonic(),
+                                      apks_path, error="unknown")
+            finally:
+                installed(aab_path, apks_path)
+            status = "ok" if result.ok else f"failed ({result.error}): {result.stderr.strip()}"
+            print(f"[{os.path.basename(aab_path)}] {device_id}: {status}")
+            report.record(aab_path, result)
+
+    device_threads = [threading.Thread(target=device_loop, args=(device_id,), daemon=True)
+                      for device_id in device_ids]
+    for thread in device_threads:
+        thread.start()
+
+    # 密钥库只检查一次；每个 AAB 在构建前单独检查
+    keystore_check = check_keystore(keystore_path, alias, storepass, keypass)
+    keystore_check.print_problems()
+
+    def build(aab_path):
+        """(apks_path, None) or (None, reason)."""
+        aab_check = check_aab(aab_path)
+        aab_check.print_problems(prefix=f"[{os.path.basename(aab_path)}] ")
+        if not (keystore_check.ok and aab_check.ok):
+            return None, "preflight failed"
+        apks_path = build_apks(bundletool_path, aab_path, keystore_path, alias, storepass, keypass, java=java,
+                               profile=profile)
+        return apks_path, None if apks_path else "build-apks failed"
+
+    try:
+        with ThreadPoolExecutor(max_workers=build_workers or default_build_workers()) as builds:
+            futures = {builds.submit(build, aab_path): aab_path for aab_path in aab_paths}
+            for future in as_completed(futures):
+                aab_path = futures[future]
+                try:
+                    apks_path, reason = future.result()
+                except Exception as e:
+                    print(f"[{os.path.basename(aab_path)}] Error: build raised: {e}")
+                    apks_path, reason = None, f"build raised: {str(e) or type(e).__name__}"
+                report.builds[aab_path] = apks_path
+                if not apks_path:
+                    now = time.monotonic()
+                    for device_id in device_ids:
+                        report.record(aab_path, DeviceResult(device_id, None, "", reason, now, now))
+                    continue
+                if export_dir:
+                    export_artifacts(export_dir, [(aab_path, apks_path)])
+                if not device_ids:
+                    release(apks_path)
+                    continue
+                with pending_lock:
+                    pending_installs[aab_path] = len(device_ids)
+                for device_id in device_ids:
+                    device_queues[device_id].put((aab_path, apks_path))
+    finally:
+        # the device threads finish the queued installs, then stop
+        for device_id in device_ids:
+            device_queues[device_id].put(None)
+        for thread in device_threads:
+            thread.join()
+
+    report.elapsed = time.monotonic() - started
+    return report
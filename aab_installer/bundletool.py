@@ -0,0 +1,234 @@
+"""
+Run bundletool commands, reusing warm JVMs where possible.
+
+`java -jar bundletool.jar ...` pays JVM startup and bundletool class loading
+on every call. A BundletoolRunner keeps a few long-lived BundletoolWorker.java
+processes per jar and hands commands to an idle one. When no worker can be
+started (no java source launcher, or a JDK without SecurityManager support)
+or every worker is busy, the command runs as a plain subprocess instead, so
+results are the same either way.
+
+Commands that talk to adb always run as a subprocess: bundletool keeps one
+process-wide adb bridge and closes it when an adb command finishes, so a
+second adb command in the same JVM fails with "Android Debug Bridge has been
+closed".
+
+Subprocess output is streamed (aab_installer.process); worker output arrives
+in one piece when the command is done. Both can be cancelled.
+"""
+
+import atexit
+import os
+import queue
+import subprocess
+import threading
+
+from .process import CANCELLED_RETURNCODE, popen, run_streaming, terminate, terminate_on_cancel
+
+WORKER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BundletoolWorker.java")
+DEFAULT_POOL_SIZE = 2
+STARTUP_TIMEOUT = 60
+
+# JDK 12-23 need this flag before System.setSecurityManager is allowed;
+# JDK 11 rejects it, so startup retries without it.
+_SECURITY_MANAGER_FLAGS = (["-Djava.security.manager=allow"], [])
+ADB_COMMANDS = {"install-apks", "install-multi-apks", "get-device-spec"}
+
+
+def uses_adb(args):
+    """True when `bundletool <args>` connects to adb (and so closes bundletool's adb bridge)."""
+    return bool(args) and (args[0] in ADB_COMMANDS or any(
+        arg == "--connected-device" or arg.startswith("--device-id=") for arg in args[1:]))
+
+
+class WorkerError(Exception):
+    pass
+
+
+class BundletoolWorker:
+    def __init__(self, bundletool_path, java="java", cwd=None, env=None, jvm_options=()):
+        self.bundletool_path = bundletool_path
+        self.java = java
+        self.cwd = cwd
+        self.env = env
+        self.jvm_options = list(jvm_options)
+        self.process = None
+
+    def start(self, timeout=STARTUP_TIMEOUT):
+        reasons = []
+        for flags in _SECURITY_MANAGER_FLAGS:
+            try:
+                self.process = popen(
+                    [self.java, *flags, *self.jvm_options, "-cp", self.bundletool_path, WORKER_SOURCE],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    cwd=self.cwd,
+                    env=self.env,
+                )
+            except OSError as e:
+                raise WorkerError(f"cannot start {self.java}: {e}")
+
+            status = self._read_startup_line(timeout)
+            if status == "READY":
+                return
+            reasons.append(status or "worker exited during startup")
+            self.stop()
+        raise WorkerError("; ".join(reasons))
+
+    def _read_startup_line(self, timeout):
+        lines = queue.Queue()
+        reader = threading.Thread(target=lambda: lines.put(self.process.stdout.readline()), daemon=True)
+        reader.start()
+        try:
+            return lines.get(timeout=timeout).decode("utf-8", "replace").strip()
+        except queue.Empty:
+            return f"no answer within {timeout}s"
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, args, cancel=None):
+        """Run one command. Setting `cancel` kills the worker (and what it started)."""
+        if any("\t" in arg or "\n" in arg for arg in args):
+            raise ValueError("bundletool worker arguments cannot contain tabs or newlines")
+        if not self.alive:
+            raise WorkerError("worker is not running")
+
+        try:
+            with terminate_on_cancel(self.process, cancel):
+                self.process.stdin.write(("\t".join(args) + "\n").encode("utf-8"))
+                self.process.stdin.flush()
+                header = self.process.stdout.readline().decode("utf-8").split()
+                if len(header) != 4 or header[0] != "DONE":
+                    raise WorkerError(f"unexpected worker reply: {header!r}")
+                returncode, stdout_len, stderr_len = (int(value) for value in header[1:])
+                stdout = self._read_exactly(stdout_len)
+                stderr = self._read_exactly(stderr_len)
+        except (OSError, ValueError) as e:
+            self.stop()
+            raise WorkerError(str(e))
+        return subprocess.CompletedProcess(args, returncode, stdout, stderr)
+
+    def _read_exactly(self, size):
+        data = self.process.stdout.read(size)
+        if len(data) != size:
+            raise WorkerError("worker closed its output mid-reply")
+        return data
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            terminate(self.process)
+        self.process = None
+
+
+class BundletoolRunner:
+    def __init__(self, bundletool_path, java="java", cwd=None, env=None, pool_size=DEFAULT_POOL_SIZE, jvm_options=()):
+        self.bundletool_path = bundletool_path
+        self.java = java
+        self.cwd = cwd
+        self.env = env
+        self.pool_size = pool_size
+        # e.g. ["-Xmx4g"]; passed to workers and to `java -jar` alike
+        self.jvm_options = list(jvm_options)
+        self._idle = []
+        self._started = 0
+        self._disabled = pool_size <= 0
+        self._lock = threading.Lock()
+
+    def run(self, args, on_line=None, cancel=None):
+        """Run `bundletool <args>`; returns a CompletedProcess with bytes stdout/stderr.
+
+        Commands that use adb (uses_adb()) always get their own `java -jar`.
+
+        `on_line(stream, line)` receives the output line by line and `cancel`
+        (a threading.Event) stops the command, see aab_installer.process.
+        """
+        args = [str(arg) for arg in args]
+        if cancel is not None and cancel.is_set():
+            return subprocess.CompletedProcess(args, CANCELLED_RETURNCODE, b"", b"cancelled")
+        worker = None if uses_adb(args) else self._acquire_worker()
+        if worker is not None:
+            try:
+                result = worker.run(args, cancel)
+                if on_line is not None:
+                    for stream, output in (("stdout", result.stdout), ("stderr", result.stderr)):
+                        for line in output.decode("utf-8", "replace").splitlines():
+                            on_line(stream, line)
+                return result
+            except ValueError:
+                pass
+            except WorkerError as e:
+                worker.stop()
+                if cancel is not None and cancel.is_set():
+                    return subprocess.CompletedProcess(args, CANCELLED_RETURNCODE, b"", b"cancelled")
+                print(f"bundletool worker failed, falling back to java -jar: {e}")
+            finally:
+                self._release_worker(worker)
+        return self.run_subprocess(args, on_line, cancel)
+
+    def run_subprocess(self, args, on_line=None, cancel=None):
+        return run_streaming([self.java, *self.jvm_options, "-jar", self.bundletool_path, *args], on_line, cancel,
+                             cwd=self.cwd, env=self.env)
+
+    def _acquire_worker(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if self._disabled or self._started >= self.pool_size:
+                return None
+            self._started += 1
+
+        worker = BundletoolWorker(self.bundletool_path, self.java, self.cwd, self.env, self.jvm_options)
+        try:
+            worker.start()
+        except WorkerError as e:
+            print(f"bundletool worker unavailable, using java -jar: {e}")
+            with self._lock:
+                self._disabled = True
+                self._started -= 1
+            return None
+        return worker
+
+    def _release_worker(self, worker):
+        with self._lock:
+            if worker.alive:
+                self._idle.append(worker)
+            else:
+                self._started -= 1
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+def get_runner(bundletool_path, java="java", cwd=None, env=None, jvm_options=()):
+    """Shared runner per (jar, java, cwd, env, JVM options) so warm workers survive between calls."""
+    key = (os.path.abspath(bundletool_path), java, cwd, tuple(sorted(env.items())) if env else None,
+           tuple(jvm_options))
+    with _runners_lock:
+        if key not in _runners:
+            pool_size = 0 if os.environ.get("AAB_INSTALLER_NO_WORKER") else DEFAULT_POOL_SIZE
+            _runners[key] = BundletoolRunner(bundletool_path, java, cwd, env, pool_size, jvm_options)
+        return _runners[key]
+
+
+@atexit.register
+def close_runners():
+    with _runners_lock:
+        runners = list(_runners.values())
+        _runners.clear()
+    for runner in runners:
+        runner.close()
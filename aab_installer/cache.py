@@ -0,0 +1,250 @@
+"""
+Content-addressed cache for .apks archives built by `bundletool build-apks`.
+
+An entry is keyed on everything that changes the build output: the AAB
+contents, the bundletool jar, the keystore contents, the key alias and any
+extra build flags. Builds go to the cache's tmp directory and are renamed
+into place once complete. The splits `extract-apks` produced for a device
+spec are kept next to the .apks entries (see aab_installer.incremental).
+Hits refresh an entry's mtime; once the cache grows past `max_bytes`, or its
+disk has less than `min_free_bytes` left, the least recently used entries
+are removed. See aab_installer.workspace for the environment variables.
+
+get(), commit(), get_extracted() and commit_extracted() pin the entry they
+return: eviction skips it until every caller has passed the path to
+release(), so an install never loses its .apks to another build's eviction.
+Pins are per process.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "AAB_INSTALLER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "aab_installer", "apks"))
+DEFAULT_MAX_BYTES = int(os.environ.get("AAB_INSTALLER_CACHE_MAX_BYTES", 4 * 1024 ** 3))
+DEFAULT_MIN_FREE_BYTES = int(os.environ.get("AAB_INSTALLER_MIN_FREE_BYTES", 1024 ** 3))
+# tmp files older than this were left by a crashed run
+STALE_SECONDS = 6 * 3600
+
+_digest_memo = {}
+_digest_lock = threading.Lock()
+# entry path -> number of holders; eviction runs under the lock too
+_pins = {}
+_pins_lock = threading.RLock()
+
+
+def _memo_key(path, st):
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def remember_digest(path, st, value):
+    """Record a sha256 of `path` computed elsewhere (aab_installer.preflight) for file_digest to reuse.
+
+    `st` is the os.stat_result the digest belongs to.
+    """
+    with _digest_lock:
+        _digest_memo[_memo_key(path, st)] = value
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Streamed sha256 of a file, remembered per (path, size, mtime) for this process."""
+    memo_key = _memo_key(path, os.stat(path))
+    with _digest_lock:
+        if memo_key in _digest_memo:
+            return _digest_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[memo_key] = value
+    return value
+
+
+def _pin(path):
+    _pins[path] = _pins.get(path, 0) + 1
+    return path
+
+
+def pin(path):
+    """Take one more pin on an entry that is already pinned, e.g. for another thread that will release it."""
+    with _pins_lock:
+        return _pin(path)
+
+
+def release(path):
+    """Give back an entry returned by ApksCache.get/commit/get_extracted/commit_extracted; None is ignored."""
+    if path is None:
+        return
+    with _pins_lock:
+        count = _pins.get(path, 0) - 1
+        if count > 0:
+            _pins[path] = count
+        else:
+            _pins.pop(path, None)
+
+
+def _tree_size(path):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(path) for name in names)
+
+
+def remove_stale(root, max_age=STALE_SECONDS):
+    """Remove files and directories in `root` untouched for `max_age` seconds."""
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return
+    cutoff = time.time() - max_age
+    for name in names:
+        path = os.path.join(root, name)
+        try:
+            if os.lstat(path).st_mtime >= cutoff:
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class ApksCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, min_free_bytes=DEFAULT_MIN_FREE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self._tmp_dir = os.path.join(root, "tmp")
+        self._extracted_dir = os.path.join(root, "extracted")
+
+    def key(self, aab_path, bundletool_path, keystore_path, alias, flags=()):
+        parts = [
+            "aab=" + file_digest(aab_path),
+            "bundletool=" + file_digest(bundletool_path),
+            "keystore=" + file_digest(keystore_path),
+            "alias=" + alias,
+        ]
+        parts.extend("flag=" + flag for flag in sorted(flags))
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.root, key + ".apks")
+
+    def get(self, key):
+        """Return the cached .apks for `key` (pinned, see release()), or None on a miss."""
+        path = self.entry_path(key)
+        with _pins_lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+            return _pin(path)
+
+    def temp_path(self):
+        """A fresh path to build into; pass it to `commit` once the build succeeded."""
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        return os.path.join(self._tmp_dir, f"{uuid.uuid4().hex}.apks")
+
+    def temp_dir(self):
+        """A fresh directory to extract into; pass it to `commit_extracted` once complete."""
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        path = os.path.join(self._tmp_dir, uuid.uuid4().hex)
+        os.mkdir(path)
+        return path
+
+    def commit(self, key, built_path):
+        """Move a finished build into place; returns the entry path, pinned like get()."""
+        path = self.entry_path(key)
+        with _pins_lock:
+            os.replace(built_path, path)
+            _pin(path)
+        self.evict()
+        return path
+
+    def discard(self, built_path):
+        if os.path.isdir(built_path):
+            shutil.rmtree(built_path, ignore_errors=True)
+        elif os.path.exists(built_path):
+            os.remove(built_path)
+
+    def get_extracted(self, key):
+        """Directory of APKs extracted under `key` (pinned, see release()), or None on a miss."""
+        path = os.path.join(self._extracted_dir, key)
+        with _pins_lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+            return _pin(path)
+
+    def commit_extracted(self, key, built_dir):
+        os.makedirs(self._extracted_dir, exist_ok=True)
+        path = os.path.join(self._extracted_dir, key)
+        with _pins_lock:
+            try:
+                os.rename(built_dir, path)
+            except OSError:
+                # another thread committed the same extraction first
+                if not os.path.isdir(path):
+                    raise
+                self.discard(built_dir)
+            _pin(path)
+        self.evict()
+        return path
+
+    def _entries(self):
+        """[(mtime, size, path)] of the .apks entries and extracted directories."""
+        paths = [os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith(".apks")]
+        if os.path.isdir(self._extracted_dir):
+            paths.extend(os.path.join(self._extracted_dir, name) for name in os.listdir(self._extracted_dir))
+        entries = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                entries.append((st.st_mtime, _tree_size(path) if os.path.isdir(path) else st.st_size, path))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def free_bytes(self):
+        return shutil.disk_usage(self.root).free
+
+    def evict(self, reserve=0):
+        """Drop least recently used entries until the cache fits in `max_bytes`.
+
+        Entries also go while the disk has less than `min_free_bytes` plus
+        `reserve` free. Pinned entries count towards the size but are never
+        removed.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        remove_stale(self._tmp_dir)
+        with _pins_lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            free = self.free_bytes()
+
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes and free >= self.min_free_bytes + reserve:
+                    break
+                if path in _pins:
+                    continue
+                try:
+                    self.discard(path)
+                except OSError:
+                    # still open elsewhere (Windows); it goes on a later pass
+                    continue
+                total -= size
+                free += size
+
+    def make_room(self, needed):
+        """Evict until `needed` bytes fit on the cache's disk. Returns False if they still do not."""
+        self.evict(reserve=needed)
+        return self.free_bytes() >= needed
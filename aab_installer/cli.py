@@ -0,0 +1,265 @@
+"""
+Headless command line for installing AABs, e.g. from CI agents:
+
+    python -m aab_installer install --bundletool bundletool-all.jar app.aab
+    python -m aab_installer batch --bundletool bundletool-all.jar nightly/
+    python -m aab_installer daemon --bundletool bundletool-all.jar app.aab
+    python -m aab_installer devices
+    python -m aab_installer --adb-server rack-1:5037@40 --adb-server rack-2:5037 install app.aab
+    python -m aab_installer inspect app.apks
+    python -m aab_installer keystore --rotate
+
+Without --keystore, builds are signed with the managed debug key from
+aab_installer.keystore_pool.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from . import archive, batch, core, trace
+from .daemon import InstallDaemon
+from .farm import AdbEndpoint, discover_devices
+from .keystore_pool import KeystorePool
+from .parallel import DEFAULT_MAX_WORKERS
+from .profiles import BUILD_PROFILES, DEFAULT_PROFILE, get_profile
+from .retry import DEFAULT_ATTEMPT_TIMEOUT, DEFAULT_ATTEMPTS, RetryPolicy
+
+
+def _resolve_keystore(args):
+    """Fill in args.keystore/alias from the managed pool when no keystore was given."""
+    if args.keystore:
+        if not args.alias:
+            print("Error: --alias is required with --keystore", file=sys.stderr)
+            return False
+        return True
+    pool = KeystorePool(keytool=args.keytool)
+    try:
+        args.keystore, args.alias = pool.current(prefill=False)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return False
+    args.storepass, args.keypass = pool.storepass, pool.keypass
+    return True
+
+
+def _profile(args):
+    profile = get_profile(args.profile)
+    return profile.with_cpus(args.build_cpus) if args.build_cpus else profile
+
+
+def cmd_devices(args):
+    endpoints = args.endpoints
+    for device_id in discover_devices(endpoints) if endpoints else core.get_connected_devices(args.adb):
+        print(device_id)
+    return 0
+
+
+def cmd_inspect(args):
+    reader = archive.read_aab if args.path.lower().endswith(".aab") else archive.read_apks
+    try:
+        info = reader(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(info.to_dict(), indent=2))
+        return 0
+    print(info.summary())
+    for apk in getattr(info, "apks", []):
+        targeting = ", ".join(apk.abis + apk.languages + apk.densities)
+        print(f"  {apk.path}  {apk.module}  {apk.size}" + (f"  [{targeting}]" if targeting else ""))
+    return 0
+
+
+def cmd_keystore(args):
+    if args.keystore:
+        if not args.alias:
+            print("Error: --alias is required with --keystore", file=sys.stderr)
+            return 2
+        os.makedirs(os.path.dirname(os.path.abspath(args.keystore)), exist_ok=True)
+        res = core.generate_keystore(args.keystore, args.alias, args.storepass, args.keypass, args.keytool)
+        return 0 if res else 1
+
+    pool = KeystorePool(keytool=args.keytool)
+    try:
+        keystore_path, alias = pool.rotate(prefill=False) if args.rotate else pool.current(prefill=False)
+        print(f"{keystore_path}\t{alias}")
+        pool.prefill()
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_install(args):
+    if not args.bundletool:
+        print("Error: pass --bundletool or set BUNDLETOOL_PATH", file=sys.stderr)
+        return 2
+    if not _resolve_keystore(args):
+        return 1
+
+    report = core.build_and_install_apks(
+        args.bundletool, args.aab, args.keystore, args.alias, args.storepass, args.keypass,
+        max_workers=args.max_workers, per_device_spec=args.per_device_spec, java=args.java, adb=args.adb,
+        skip_installed=not args.reinstall, incremental=not args.no_incremental, direct=args.direct,
+        retry=RetryPolicy(attempts=args.attempts, timeout=args.timeout), endpoints=args.endpoints,
+        profile=_profile(args), uninstall_conflicts=not args.no_uninstall, launch_iterations=args.launch,
+        export_dir=args.export)
+    if args.json:
+        print(json.dumps(report.to_dict() if report is not False else {"ok": False}, indent=2))
+    return 0 if report else 1
+
+
+def cmd_batch(args):
+    if not args.bundletool:
+        print("Error: pass --bundletool or set BUNDLETOOL_PATH", file=sys.stderr)
+        return 2
+    if not _resolve_keystore(args):
+        return 1
+
+    profile = _profile(args)
+    if profile.per_device_spec:
+        print(f"Error: profile {profile.name} builds per device spec, which batch does not support; "
+              f"use install or another --profile", file=sys.stderr)
+        return 2
+    aab_paths = batch.discover_aabs(args.source)
+    if not aab_paths:
+        print(f"Error: no AAB files found in {args.source}", file=sys.stderr)
+        return 2
+    report = batch.run_batch(
+        args.bundletool, aab_paths, args.keystore, args.alias, args.storepass, args.keypass,
+        build_workers=args.build_workers, max_workers=args.max_workers, java=args.java, adb=args.adb,
+        profile=profile, endpoints=args.endpoints, export_dir=args.export)
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        print(report.format_matrix())
+    return 0 if report else 1
+
+
+def cmd_daemon(args):
+    if args.endpoints:
+        print("Error: daemon only watches the local adb server, --adb-server is not supported", file=sys.stderr)
+        return 2
+    if not args.bundletool:
+        print("Error: pass --bundletool or set BUNDLETOOL_PATH", file=sys.stderr)
+        return 2
+    if not _resolve_keystore(args):
+        return 1
+
+    daemon = InstallDaemon(args.bundletool, args.aab, args.keystore, args.alias, args.storepass, args.keypass,
+                           max_workers=args.max_workers, java=args.java, adb=args.adb,
+                           poll_interval=args.poll_interval)
+    print(f"Watching {args.aab}, press Ctrl+C to stop")
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="aab_installer", description="Install Android App Bundles on devices.")
+    parser.add_argument("--adb", default="adb")
+    parser.add_argument("--java", default="java")
+    parser.add_argument("--keytool", default="keytool")
+    parser.add_argument("--adb-server", action="append", metavar="HOST:PORT[@MB/s]",
+                        help="use the devices of this adb server; repeat for a multi-host farm")
+    parser.add_argument("--trace", metavar="FILE.jsonl", default=os.environ.get("AAB_INSTALLER_TRACE"),
+                        help="append timing spans to this file as JSON lines")
+    parser.add_argument("--chrome-trace", metavar="FILE.json",
+                        help="write the timing spans as a Chrome trace (chrome://tracing, Perfetto)")
+    parser.add_argument("--timings", action="store_true", help="print a phase timing table to stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    devices = commands.add_parser("devices", help="list connected devices")
+    devices.set_defaults(func=cmd_devices)
+
+    inspect = commands.add_parser("inspect", help="show the package, version and splits of an .apks or .aab")
+    inspect.add_argument("path")
+    inspect.add_argument("--json", action="store_true")
+    inspect.set_defaults(func=cmd_inspect)
+
+    def add_build_args(sub):
+        sub.add_argument("--profile", choices=list(BUILD_PROFILES), default=DEFAULT_PROFILE,
+                         help="bundletool flags and JVM options of the build (see aab_installer.profiles)")
+        sub.add_argument("--build-cpus", type=int, help="processors the bundletool JVM may use")
+        sub.add_argument("--export", metavar="DIR",
+                         help="also put each built .apks in DIR as <aab name>.apks (linked from the cache)")
+
+    def add_signing_args(sub):
+        sub.add_argument("--keystore", help="default: the managed debug keystore")
+        sub.add_argument("--alias")
+        sub.add_argument("--storepass", default=core.DEFAULT_STOREPASS)
+        sub.add_argument("--keypass", default=core.DEFAULT_KEYPASS)
+
+    keystore = commands.add_parser(
+        "keystore", help="show the managed debug key, or generate a keystore at --keystore")
+    add_signing_args(keystore)
+    keystore.add_argument("--rotate", action="store_true", help="replace the managed debug key")
+    keystore.set_defaults(func=cmd_keystore)
+
+    install = commands.add_parser("install", help="build an AAB and install it on all devices")
+    install.add_argument("aab")
+    install.add_argument("--bundletool", default=os.environ.get("BUNDLETOOL_PATH"))
+    add_signing_args(install)
+    add_build_args(install)
+    install.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS)
+    install.add_argument("--per-device-spec", action="store_true",
+                         help="build one targeted .apks per distinct device spec")
+    install.add_argument("--reinstall", action="store_true",
+                         help="install even on devices that already have this exact build")
+    install.add_argument("--no-incremental", action="store_true",
+                         help="always push every split instead of only the changed ones")
+    install.add_argument("--direct", action="store_true",
+                         help="stream the matching splits into a pm install session instead of using install-apks")
+    install.add_argument("--no-uninstall", action="store_true",
+                         help="fail devices whose installed app has another signing key instead of uninstalling it")
+    install.add_argument("--attempts", type=int, default=DEFAULT_ATTEMPTS,
+                         help="install attempts per device for transient failures (device offline, timeouts)")
+    install.add_argument("--timeout", type=float, default=DEFAULT_ATTEMPT_TIMEOUT,
+                         help="seconds before an install attempt on one device is aborted (0: no limit)")
+    install.add_argument("--launch", type=int, default=0, metavar="N",
+                         help="start the app N times cold and hot on each device and report the startup times")
+    install.add_argument("--json", action="store_true", help="print the install report as JSON")
+    install.set_defaults(func=cmd_install)
+
+    batch_cmd = commands.add_parser("batch", help="install every AAB of a directory or manifest on all devices")
+    batch_cmd.add_argument("source", help="directory of .aab files, or a .json/.txt manifest")
+    batch_cmd.add_argument("--bundletool", default=os.environ.get("BUNDLETOOL_PATH"))
+    add_signing_args(batch_cmd)
+    add_build_args(batch_cmd)
+    batch_cmd.add_argument("--build-workers", type=int, default=None,
+                           help="parallel builds (default: limited by CPU count and free memory)")
+    batch_cmd.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS)
+    batch_cmd.add_argument("--json", action="store_true", help="print the result matrix as JSON")
+    batch_cmd.set_defaults(func=cmd_batch)
+
+    daemon = commands.add_parser(
+        "daemon", help="keep the latest build of an AAB installed on every device that comes online")
+    daemon.add_argument("aab")
+    daemon.add_argument("--bundletool", default=os.environ.get("BUNDLETOOL_PATH"))
+    add_signing_args(daemon)
+    daemon.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS)
+    daemon.add_argument("--poll-interval", type=float, default=2.0, help="seconds between AAB change checks")
+    daemon.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.endpoints = [AdbEndpoint.parse(text) for text in args.adb_server or []]
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    trace.configure(args.trace)
+    try:
+        return args.func(args)
+    finally:
+        if args.chrome_trace:
+            trace.get_tracer().write_chrome_trace(args.chrome_trace)
+        if args.timings:
+            print(trace.get_tracer().format_summary(), file=sys.stderr)
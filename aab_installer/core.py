@@ -0,0 +1,513 @@
+"""
+GUI-free install flow shared by the desktop scripts and the command line.
+
+Nothing in here imports PyQt5, so CI agents without a display can use it
+through `python -m aab_installer`.
+"""
+
+import functools
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from .adb_monitor import READY_STATE, get_device_monitor, parse_device_list
+from .bundletool import get_runner
+from .cache import ApksCache, release
+from .device_spec import group_devices_by_spec
+from .direct_install import install_direct
+from .farm import discover_devices, install_on_farm
+from .incremental import install_incremental
+from .jobs import CANCELLED
+from .launch import measure_startup
+from .parallel import (DEFAULT_MAX_WORKERS, InstallReport, failed_results, install_on_device, install_on_devices,
+                       skipped_results)
+from .preflight import check_aab, check_keystore
+from .prewarm import prewarm_devices, settle_devices
+from .probe import matches_build, probe_devices, read_bundle_identity
+from .process import run_streaming
+from .trace import span
+from .taskgraph import TaskGraph
+from .workspace import export_artifacts, scratch_dir, scratch_root
+
+
+DEFAULT_STOREPASS = "123456"
+DEFAULT_KEYPASS = "123456"
+MONITOR_TIMEOUT = 2.0
+# free space a build needs next to the cache, as a multiple of the AAB size
+BUILD_SPACE_FACTOR = 2
+KEYSTORE_DNAME = "CN=china, OU=YourOrgUnit, O=YourOrg, L=beijing, S=guangzhou, C=china"
+
+
+def get_connected_devices(adb="adb"):
+    """Serials of the devices that are ready for installs.
+
+    Read from the live adb_monitor table when the adb server is reachable;
+    otherwise `adb devices` is run, which also starts the server. Devices in
+    the "unauthorized", "offline" and other states are skipped either way.
+    """
+    with span("devices") as s:
+        monitor = get_device_monitor()
+        if monitor.wait_ready(timeout=MONITOR_TIMEOUT):
+            ready = monitor.devices()
+            s.set(source="monitor", count=len(ready))
+            return ready
+
+        devices_raw = subprocess.check_output([adb, "devices"])
+        devices = parse_device_list(devices_raw.decode("utf-8"))
+        ready = sorted(serial for serial, state in devices.items() if state == READY_STATE)
+        s.set(source="adb devices", count=len(ready))
+        return ready
+
+
+def generate_keystore(keystore_path, alias, storepass, keypass, keytool="keytool"):
+    keytool_command = [
+        keytool,
+        "-genkey",
+        "-v",
+        "-keystore",
+        keystore_path,
+        "-alias",
+        alias,
+        "-storepass",
+        storepass,
+        "-keypass",
+        keypass,
+        "-keyalg",
+        "RSA",
+        "-keysize",
+        "2048",
+        "-validity",
+        "10000",
+        "-dname",
+        KEYSTORE_DNAME,
+    ]
+
+    with span("keygen", alias=alias) as s:
+        result = run_streaming(keytool_command)
+        s.set(exit_code=result.returncode)
+    if result.returncode == 0:
+        return keystore_path
+    print(f"Error while generating keystore: exit status {result.returncode}, "
+          f"{result.stderr.decode('utf-8', 'replace')}, {result.stdout.decode('utf-8', 'replace')}")
+    return None
+
+
+def build_runner(bundletool_path, java="java", jvm_options=()):
+    """Runner for build-apks: runs next to the jar, with its directory on PATH."""
+    bundletool_dir = os.path.dirname(os.path.abspath(bundletool_path))
+    env = os.environ.copy()
+    env["PATH"] = env["PATH"] + f"{os.pathsep}{bundletool_dir}"
+    return get_runner(bundletool_path, java, cwd=bundletool_dir, env=env, jvm_options=jvm_options)
+
+
+def build_apks(bundletool_path, aab_path, keystore_path, alias, storepass, keypass, device_spec=None,
+               java="java", on_line=None, cancel=None, profile=None):
+    """Build the .apks for `aab_path`, or reuse a cached one. Returns its path, or None on failure.
+
+    `device_spec` is an optional (spec_path, spec_digest) pair from
+    aab_installer.device_spec; the build then only contains the splits that
+    spec needs. `profile` (aab_installer.profiles.BuildProfile) adds its
+    bundletool flags and JVM options. `on_line` and `cancel` are passed on to
+    BundletoolRunner.run. The returned cache entry is pinned until it is
+    passed to aab_installer.cache.release().
+    """
+    with span("build-apks", aab=os.path.basename(aab_path), bundletool=os.path.basename(bundletool_path)) as s:
+        extra_args = []
+        cache_flags = []
+        if device_spec:
+            spec_path, digest = device_spec
+            extra_args.append(f"--device-spec={spec_path}")
+            cache_flags.append(f"device-spec={digest}")
+        if profile is not None:
+            extra_args.extend(profile.build_args)
+            cache_flags.extend(f"arg={arg}" for arg in profile.build_args)
+            s.set(profile=profile.name)
+
+        s.set(device_spec=device_spec[1][:12] if device_spec else None)
+        cache = ApksCache()
+        try:
+            cache_key = cache.key(aab_path, bundletool_path, keystore_path, alias, cache_flags)
+        except OSError as e:
+            print(f"Error: Failed to generate APKS from AAB. Error: {e}")
+            return None
+        apk_output = cache.get(cache_key)
+        if apk_output:
+            print(f"Reusing cached APKS: {apk_output}")
+            s.set(cache="hit", apks_bytes=os.path.getsize(apk_output))
+            return apk_output
+
+        aab_bytes = os.path.getsize(aab_path)
+        needed = aab_bytes * BUILD_SPACE_FACTOR
+        if not cache.make_room(needed):
+            print(f"Error: Failed to generate APKS from AAB. Error: not enough disk space in {cache.root} "
+                  f"({cache.free_bytes() / 2 ** 20:.0f} MB free, about {needed / 2 ** 20:.0f} MB needed)")
+            s.set(cache="no-space")
+            return None
+
+        # bundletool's intermediate APKs go to the scratch directory (a tmpfs for small bundles)
+        temp_dir = scratch_root(aab_bytes)
+        os.makedirs(temp_dir, exist_ok=True)
+        jvm_options = [*(profile.jvm_options if profile else ()), f"-Djava.io.tmpdir={temp_dir}"]
+        build_output = cache.temp_path()
+        result = build_runner(bundletool_path, java, jvm_options).run([
+            "build-apks",
+            f"--bundle={os.path.abspath(aab_path)}",
+            f"--output={build_output}",
+            f"--ks={os.path.abspath(keystore_path)}",
+            f"--ks-pass=pass:{storepass}",
+            f"--ks-key-alias={alias}",
+            f"--key-pass=pass:{keypass}",
+            *extra_args,
+        ], on_line, cancel)
+        s.set(cache="miss", exit_code=result.returncode)
+
+        if cancel is not None and cancel.is_set():
+            cache.discard(build_output)
+            print("Build cancelled")
+            return None
+        if result.returncode:
+            cache.discard(build_output)
+            print(f"Error: Failed to generate APKS from AAB. Error: {result.stderr.decode('utf-8')}")
+            return None
+
+        print("APKS generated successfully!")
+        apk_output = cache.commit(cache_key, build_output)
+        s.set(apks_bytes=os.path.getsize(apk_output))
+        return apk_output
+
+
+def prepare_install(graph, bundletool_path, aab_path, storepass, keypass, max_workers=DEFAULT_MAX_WORKERS,
+                    per_device_spec=False, java="java", adb="adb", progress=None, cancel=None, endpoints=None,
+                    profile=None, defer_devices=False):
+    """Add device discovery and build tasks to `graph`.
+
+    `graph` must have a "keystore" task resolving to (keystore_path, alias).
+    The build starts as soon as the keystore is ready and runs alongside
+    device discovery. The added "targets" task resolves to
+    [(apks_path or None, [device_id, ...]), ...]; "identity" resolves to the
+    (package, versionCode) of the AAB. bundletool build output goes to
+    `progress("build", line)`; setting `cancel` stops the build. With
+    `endpoints` (aab_installer.farm.AdbEndpoint), devices are gathered from
+    all of those adb servers as "host:port/serial" and one .apks is built for
+    all of them (`per_device_spec` is not used). A `profile` with
+    per_device_spec turns per_device_spec on.
+
+    The AAB and the keystore are checked first (aab_installer.preflight); if
+    either is broken nothing is built and "targets" resolves to no .apks.
+    Without `endpoints`, a "prewarm" task wakes the devices and reads their
+    free space and installed signatures during the build
+    (aab_installer.prewarm).
+
+    With `defer_devices`, only the tasks that do not depend on the devices
+    are added (the "build", unless it is per device spec), and a function is
+    returned that adds "devices", "prewarm" and "targets" when called, so
+    devices connected in between are included.
+    """
+    if profile is not None and profile.per_device_spec:
+        per_device_spec = True
+    if endpoints:
+        per_device_spec = False
+    graph.add("aab-check", check_aab, args=(aab_path,))
+
+    def identity(aab_check):
+        info = aab_check.info
+        if info is not None and info.package and isinstance(info.version_code, int):
+            return info.package, info.version_code
+        return read_bundle_identity(bundletool_path, aab_path, java)
+
+    def preflight(keystore, aab_check):
+        report = check_keystore(*keystore, storepass, keypass).merge(aab_check)
+        report.print_problems()
+        return report.ok
+
+    graph.add("identity", identity, deps=["aab-check"])
+    graph.add("preflight", preflight, deps=["keystore", "aab-check"])
+
+    def build(keystore, inputs_ok, device_spec=None):
+        if not inputs_ok:
+            return None
+        keystore_path, alias = keystore
+        on_line = None if progress is None else lambda stream, line: progress("build", line)
+        return build_apks(bundletool_path, aab_path, keystore_path, alias, storepass, keypass, device_spec,
+                          java=java, on_line=on_line, cancel=cancel, profile=profile)
+
+    if not per_device_spec:
+        graph.add("build", build, deps=["keystore", "preflight"])
+
+    def add_device_tasks():
+        if endpoints:
+            graph.add("devices", discover_devices, args=(endpoints,))
+        else:
+            graph.add("devices", get_connected_devices, args=(adb,))
+            graph.add("prewarm",
+                      lambda device_ids, identity: prewarm_devices(device_ids, identity[0], adb, max_workers),
+                      deps=["devices", "identity"])
+        if not per_device_spec:
+            graph.add("targets", lambda apks_path, device_ids: [(apks_path, device_ids)], deps=["build", "devices"])
+            return
+
+        spec_dir = scratch_dir("aab-device-specs-")
+
+        def fetch_specs(device_ids, aab_check):
+            if not device_ids or not aab_check.ok:
+                return [(None, None, [])]
+            # 相同配置的设备共用一次构建
+            return group_devices_by_spec(bundletool_path, device_ids, spec_dir, max_workers=max_workers, java=java)
+
+        def build_groups(keystore, inputs_ok, groups):
+            try:
+                return [(build(keystore, inputs_ok, (spec_path, digest) if spec_path else None), group)
+                        for spec_path, digest, group in groups]
+            finally:
+                shutil.rmtree(spec_dir, ignore_errors=True)
+
+        graph.add("specs", fetch_specs, deps=["devices", "aab-check"])
+        graph.add("targets", build_groups, deps=["keystore", "preflight", "specs"])
+
+    if defer_devices:
+        return add_device_tasks
+    add_device_tasks()
+
+
+def install_prepared(graph, bundletool_path, max_workers=DEFAULT_MAX_WORKERS, java="java", adb="adb",
+                     skip_installed=True, incremental=True, progress=None, cancel=None, direct=False, retry=None,
+                     endpoints=None, uninstall_conflicts=True, launch_iterations=0):
+    """Wait for the "targets" task of `graph` and install each .apks on its devices.
+
+    With `skip_installed`, devices are probed first: those that already have
+    the exact build are left alone and, with `incremental`, those running an
+    older build of the same versionCode only get the changed splits. With
+    `direct`, full installs stream the splits into an install session over
+    adb (aab_installer.direct_install) instead of running `install-apks`.
+    `retry` (an aab_installer.retry.RetryPolicy) sets the per-device timeout
+    and retries of transient failures. With `endpoints`, the devices from
+    prepare_install are installed through their own adb servers by
+    aab_installer.farm (no incremental installs). Devices checked by the
+    "prewarm" task that lack the space for the build are not installed, and
+    where the package is signed with another key it is uninstalled first
+    (its data is lost), or with `uninstall_conflicts` False the device fails.
+    With `launch_iterations`, the app is then started that many times cold
+    and hot on every device it is installed on (aab_installer.launch) and
+    the startup times go into each device's result.
+    `progress(device_id, message)` follows each device; `cancel` stops the
+    installs (see aab_installer.parallel). Returns an InstallReport (truthy
+    when every device succeeded), or False when no APKS could be built at all.
+    Pass `graph` to finish_prepared() afterwards.
+    """
+    with span("wait-targets"):
+        targets = graph.result("targets")
+    if all(apks_path is None for apks_path, _ in targets):
+        return False
+
+    identity = None
+    if skip_installed:
+        try:
+            identity = graph.result("identity")
+        except Exception as e:
+            print(f"Could not read package and versionCode, installing everywhere: {e}")
+    readiness, package = {}, None
+    if "prewarm" in graph.names():
+        try:
+            readiness, (package, _) = graph.result("prewarm"), graph.result("identity")
+        except Exception as e:
+            print(f"Warning: Could not prepare the devices: {e}")
+
+    full_install = functools.partial(install_direct, adb=adb) if direct else install_on_device
+    reports = []
+    for apks_path, device_ids in targets:
+        if apks_path is None:
+            reports.append(failed_results(None, device_ids, "Failed to generate APKS from AAB"))
+            continue
+        if endpoints:
+            reports.append(install_on_farm(bundletool_path, apks_path, device_ids, endpoints, max_workers, java, adb,
+                                           identity, progress, cancel, retry))
+            continue
+        if readiness:
+            with span("settle", devices=len(device_ids)):
+                device_ids, not_ready = settle_devices(apks_path, device_ids, readiness, package, adb, max_workers,
+                                                       uninstall_conflicts, progress)
+            reports.append(not_ready)
+        install = full_install
+        if identity:
+            package, version_code = identity
+            if progress is not None:
+                for device_id in device_ids:
+                    progress(device_id, "Checking the installed build")
+            with span("probe", devices=len(device_ids)):
+                probes = probe_devices(device_ids, package, adb, max_workers)
+            up_to_date = [device_id for device_id in device_ids
+                          if matches_build(probes[device_id], version_code, apks_path)]
+            reports.append(skipped_results(apks_path, up_to_date))
+            for device_id in up_to_date:
+                with span("install-device", device=device_id, mode="skipped", exit_code=0):
+                    pass
+            if progress is not None:
+                for device_id in up_to_date:
+                    progress(device_id, "Already up to date")
+            device_ids = [device_id for device_id in device_ids if device_id not in up_to_date]
+
+            def install(bundletool_path, apks_path, device_id, java, progress=None, cancel=None,
+                        package=package, probes=probes):
+                installed = probes[device_id]
+                if incremental and installed and installed["version_code"] == version_code:
+                    return install_incremental(bundletool_path, apks_path, device_id, package, installed, adb, java,
+                                               progress, cancel)
+                return full_install(bundletool_path, apks_path, device_id, java, progress, cancel)
+
+        reports.append(install_on_devices(bundletool_path, apks_path, device_ids, max_workers=max_workers,
+                                          java=java, install=install, progress=progress, cancel=cancel, retry=retry))
+
+    report = InstallReport.merge(reports, time.monotonic() - graph.started)
+    for device in report.results:
+        if device.skipped:
+            print(f"{device.device_id} already has this build, skipped")
+        elif device.ok and device.pushed is not None:
+            print(f"Pushed {', '.join(device.pushed)} to {device.device_id} ({device.duration:.1f}s)")
+        elif device.ok:
+            print(f"APKs installed successfully on {device.device_id}! ({device.duration:.1f}s)")
+        else:
+            print(f"Error: Failed to install APKs on {device.device_id} ({device.error}). Error: {device.stderr}")
+
+    if launch_iterations and not endpoints:
+        _measure_launch(graph, report, launch_iterations, adb, progress, cancel)
+    return report
+
+
+def finish_prepared(graph):
+    """Shut down a graph from prepare_install, installed or not; the cache pins of its .apks are released once built."""
+    graph.shutdown(wait=False)
+    names = graph.names()
+    targets = graph.future("targets") if "targets" in names else None
+
+    def targets_done(future):
+        if not future.cancelled() and future.exception() is None:
+            for apks_path, _ in future.result():
+                release(apks_path)
+
+    def build_done(future):
+        # a build still running at shutdown finishes after "targets" was cancelled (or was never added)
+        if (targets is None or targets.cancelled()) and not future.cancelled() and future.exception() is None:
+            release(future.result())
+
+    if targets is not None:
+        targets.add_done_callback(targets_done)
+    if "build" in names:
+        graph.future("build").add_done_callback(build_done)
+
+
+def queue_install(scheduler, name, graph, bundletool_path, cancel=None, progress=None, **options):
+    """Queue the install of a graph from prepare_install as a job of `scheduler` (aab_installer.jobs).
+
+    The job waits for the other jobs on its devices, then runs
+    install_prepared with `options` and the job's cancel event (`cancel`,
+    which should also be the build's). Its progress goes to
+    `progress("<device> #<job id>", message)`. The graph is finished with
+    finish_prepared when the job ends, also if it is cancelled while queued.
+    """
+    def run(job):
+        job_progress = None if progress is None else (
+            lambda device_id, message: progress(f"{device_id} #{job.job_id}", message))
+        return install_prepared(graph, bundletool_path, progress=job_progress, cancel=job.cancel, **options)
+
+    return scheduler.submit(name, run, devices=lambda: graph.result("devices"), cancel=cancel,
+                            cleanup=lambda job: finish_prepared(graph))
+
+
+def install_job_message(job):
+    """Status line for a finished queue_install job."""
+    if job.state == CANCELLED:
+        return "Cancelled"
+    if job.error:
+        return f"Error: {job.error}"
+    if job.result:
+        return "Done!"
+    if job.result is False:
+        return "Error: Failed to generate APKS from AAB"
+    return f"Error: Failed to install APKs on {job.result.format_failures()}"
+
+
+class PreparedInstall:
+    """The build of one AAB, started when the GUIs have it picked and installed by a queued job.
+
+    Only the tasks that do not depend on the devices start right away (see
+    prepare_install with defer_devices); the devices are listed when the
+    install is queued. `keystore` is a callable returning (keystore_path,
+    alias), e.g. KeystorePool.current. `cancel` stops the build.
+    """
+
+    def __init__(self, bundletool_path, aab_path, keystore, storepass, keypass, progress=None, **options):
+        self.bundletool_path = bundletool_path
+        self.aab_path = aab_path
+        self.progress = progress
+        self.cancel = threading.Event()
+        # time.time(), like the trace spans
+        self.started = time.time()
+        self.graph = TaskGraph()
+        self.graph.add("keystore", keystore)
+        self._add_device_tasks = prepare_install(self.graph, bundletool_path, aab_path, storepass, keypass,
+                                                 progress=progress, cancel=self.cancel, defer_devices=True,
+                                                 **options)
+
+    def queue(self, scheduler, name, **options):
+        """List the devices now and queue the install (queue_install); the job owns the build afterwards."""
+        self._add_device_tasks()
+        return queue_install(scheduler, name, self.graph, self.bundletool_path, cancel=self.cancel,
+                             progress=self.progress, **options)
+
+    def discard(self):
+        """Stop the build of an AAB that will not be installed and release its .apks."""
+        self.cancel.set()
+        finish_prepared(self.graph)
+
+
+def _measure_launch(graph, report, iterations, adb, progress, cancel):
+    """Add aab_installer.launch startup times to the installed devices of `report`."""
+    try:
+        package, _ = graph.result("identity")
+    except Exception as e:
+        print(f"Warning: Could not read the package name, not measuring startup: {e}")
+        return
+    installed = {result.device_id: result for result in report.results if result.ok}
+    with span("measure-startup", devices=len(installed), iterations=iterations):
+        stats = measure_startup(list(installed), package, iterations, adb, progress, cancel)
+    for device_id, device_stats in stats.items():
+        installed[device_id].launch = device_stats.to_dict()
+        print(f"Startup on {device_id}: {device_stats.format()}")
+
+
+def build_and_install_apks(bundletool_path, aab_path, keystore_path, alias, storepass, keypass,
+                           max_workers=DEFAULT_MAX_WORKERS, per_device_spec=False, java="java", adb="adb",
+                           skip_installed=True, incremental=True, progress=None, cancel=None, direct=False,
+                           retry=None, endpoints=None, profile=None, uninstall_conflicts=True, launch_iterations=0,
+                           export_dir=None):
+    """Build the AAB and install it on every connected device.
+
+    Devices that already have the identical build are skipped unless
+    `skip_installed` is False; with `incremental`, devices with an older
+    build of the same versionCode only get the changed splits. `progress`,
+    `cancel`, `direct`, `retry`, `endpoints`, `profile`,
+    `uninstall_conflicts` and `launch_iterations` are described in
+    build_apks, prepare_install and install_prepared. With `export_dir`,
+    the built .apks are also placed there (workspace.export_artifacts)
+    while the cache still has them pinned.
+    Returns an InstallReport (truthy when every device succeeded), or False
+    when the APKS could not be built at all.
+    """
+    graph = TaskGraph()
+    with span("build_and_install_apks", aab=os.path.basename(aab_path)) as s:
+        try:
+            graph.add_value("keystore", (keystore_path, alias))
+            prepare_install(graph, bundletool_path, aab_path, storepass, keypass, max_workers, per_device_spec,
+                            java, adb, progress, cancel, endpoints, profile)
+            report = install_prepared(graph, bundletool_path, max_workers, java, adb, skip_installed, incremental,
+                                      progress, cancel, direct, retry, endpoints, uninstall_conflicts,
+                                      launch_iterations)
+            if export_dir and report is not False:
+                builds = [(aab_path, apks_path) for apks_path, _ in graph.result("targets") if apks_path]
+                export_artifacts(export_dir, builds)
+            s.set(ok=bool(report))
+            return report
+        finally:
+            finish_prepared(graph)
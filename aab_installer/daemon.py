@@ -0,0 +1,191 @@
+"""
+Keep a watched AAB installed on every device of the rack.
+
+The daemon rebuilds the AAB when it changes on disk (through the .apks
+cache) and listens to the adb DeviceMonitor. Every device that appears or
+comes back online is checked against the current build and installed only
+if it does not already have it (see aab_installer.probe).
+"""
+
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .adb_monitor import READY_STATE, get_device_monitor
+from .cache import pin, release
+from .core import build_apks
+from .incremental import install_incremental
+from .parallel import DEFAULT_MAX_WORKERS, install_on_device, install_with_retry
+from .preflight import preflight
+from .probe import apks_digests, matches_build, read_bundle_identity, try_probe
+from .retry import RetryPolicy
+
+
+# a failed build of an unchanged AAB is retried after about 5s, 10s, 20s, ... up to 5 minutes
+BUILD_RETRY = RetryPolicy(backoff=5.0, max_backoff=300.0)
+
+
+class InstallDaemon:
+    def __init__(self, bundletool_path, aab_path, keystore_path, alias, storepass, keypass,
+                 max_workers=DEFAULT_MAX_WORKERS, java="java", adb="adb", monitor=None, poll_interval=2.0):
+        self.bundletool_path = bundletool_path
+        self.aab_path = aab_path
+        self.keystore_path = keystore_path
+        self.alias = alias
+        self.storepass = storepass
+        self.keypass = keypass
+        self.java = java
+        self.adb = adb
+        self.monitor = monitor or get_device_monitor()
+        self.poll_interval = poll_interval
+        self.build = None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="daemon-install")
+        self._pending = queue.Queue()
+        self._busy = set()
+        self._busy_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._seen_signature = None
+        self._built_signature = None
+        # signature of an AAB that failed the preflight checks; checked again once it changes
+        self._rejected_signature = None
+        # signature of the AAB whose last build failed, its consecutive failures and when to try again
+        self._failed_signature = None
+        self._build_failures = 0
+        self._retry_at = 0.0
+
+    def _aab_signature(self):
+        try:
+            st = os.stat(self.aab_path)
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _maybe_rebuild(self):
+        """Rebuild once the AAB has changed and stayed unchanged for one poll interval."""
+        signature = self._aab_signature()
+        previous, self._seen_signature = self._seen_signature, signature
+        if signature is None or signature != previous or signature in (self._built_signature,
+                                                                         self._rejected_signature):
+            return False
+        # failed builds are retried with backoff while the AAB stays the same, and at once when it changes
+        if signature == self._failed_signature and time.monotonic() < self._retry_at:
+            return False
+
+        # An AAB that is still being copied fails the zip checks; it is picked up again once it changes.
+        inputs = preflight(self.aab_path, self.keystore_path, self.alias, self.storepass, self.keypass)
+        inputs.print_problems()
+        if not inputs.ok:
+            self._rejected_signature = signature
+            return False
+        apks_path = build_apks(self.bundletool_path, self.aab_path, self.keystore_path, self.alias,
+                               self.storepass, self.keypass, java=self.java)
+        if not apks_path:
+            self._build_failed(signature)
+            return False
+        try:
+            package, version_code = read_bundle_identity(self.bundletool_path, self.aab_path, self.java)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            release(apks_path)
+            self._build_failed(signature)
+            return False
+        # Hash the archive once here instead of in the first probe.
+        apks_digests(apks_path)
+        if self.build is not None:
+            # installs still running from the old build hold their own pins
+            release(self.build["apks"])
+        self._built_signature = signature
+        self._failed_signature = None
+        self.build = {
+            "apks": apks_path,
+            "package": package,
+            "version_code": version_code,
+        }
+        print(f"Serving {package} versionCode {version_code} from {apks_path}")
+        return True
+
+    def _build_failed(self, signature):
+        if signature != self._failed_signature:
+            self._failed_signature, self._build_failures = signature, 0
+        self._build_failures += 1
+        delay = BUILD_RETRY.delay(self._build_failures)
+        self._retry_at = time.monotonic() + delay
+        print(f"Build failed, retrying in {delay:.0f}s unless {os.path.basename(self.aab_path)} changes")
+
+    def _on_device_change(self, serial, old_state, new_state):
+        if new_state == READY_STATE and old_state != READY_STATE:
+            self._pending.put(serial)
+
+    def _install(self, device_id, build):
+        try:
+            installed = try_probe(device_id, build["package"], self.adb)
+            if matches_build(installed, build["version_code"], build["apks"]):
+                print(f"{device_id}: already has {build['package']} {build['version_code']}, skipped")
+                return
+
+            def install(bundletool_path, apks_path, device_id, java, progress=None, cancel=None):
+                if installed and installed["version_code"] == build["version_code"]:
+                    return install_incremental(bundletool_path, apks_path, device_id, build["package"], installed,
+                                               self.adb, java, progress, cancel)
+                return install_on_device(bundletool_path, apks_path, device_id, java, progress, cancel)
+
+            result = install_with_retry(install, self.bundletool_path, build["apks"], device_id, self.java)
+            if result.ok and result.pushed is not None:
+                print(f"{device_id}: pushed {', '.join(result.pushed)} ({result.duration:.1f}s)")
+            elif result.ok:
+                print(f"{device_id}: installed {build['package']} {build['version_code']} ({result.duration:.1f}s)")
+            else:
+                print(f"{device_id}: install failed ({result.error}): {result.stderr.strip()}")
+        finally:
+            release(build["apks"])
+            with self._busy_lock:
+                self._busy.discard(device_id)
+            # A newer build may have arrived while this device was busy.
+            if self.build is not build and device_id in self.monitor.devices():
+                self._pending.put(device_id)
+
+    def _dispatch(self, device_id):
+        build = self.build
+        if build is None:
+            return
+        with self._busy_lock:
+            if device_id in self._busy:
+                return
+            self._busy.add(device_id)
+        # released by _install
+        pin(build["apks"])
+        future = self._pool.submit(self._install, device_id, build)
+        future.add_done_callback(lambda future: self._install_done(device_id, future))
+
+    @staticmethod
+    def _install_done(device_id, future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"{device_id}: install failed: {future.exception()!r}")
+
+    def run(self):
+        """Serve until stop() is called (or KeyboardInterrupt)."""
+        self.monitor.add_listener(self._on_device_change)
+        if not self.monitor.wait_ready(timeout=self.poll_interval):
+            # No adb server yet; start one, the monitor reconnects on its own.
+            subprocess.run([self.adb, "start-server"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        next_poll = 0.0
+        try:
+            while not self._stopped.is_set():
+                if time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + self.poll_interval
+                    if self._maybe_rebuild():
+                        for device_id in self.monitor.devices():
+                            self._pending.put(device_id)
+                try:
+                    device_id = self._pending.get(timeout=max(0.0, next_poll - time.monotonic()))
+                except queue.Empty:
+                    continue
+                self._dispatch(device_id)
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,90 @@
+"""
+Group connected devices by their bundletool device spec.
+
+`bundletool get-device-spec` is run once per device per run. Only the fields
+that affect split selection are kept, so devices of the same model and
+configuration end up with identical specs and can share one targeted
+`build-apks --device-spec=...` output.
+"""
+
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from .bundletool import get_runner
+from .trace import span
+
+
+# Fields of the bundletool DeviceSpec that take part in APK matching.
+SPEC_FIELDS = (
+    "supportedAbis",
+    "supportedLocales",
+    "deviceFeatures",
+    "glExtensions",
+    "screenDensity",
+    "sdkVersion",
+    "deviceTier",
+    "deviceGroups",
+    "countrySet",
+    "sdkRuntime",
+)
+
+
+def fetch_device_spec(bundletool_path, device_id, output_dir, java="java"):
+    """Run `get-device-spec` for one device and return the parsed JSON, or None."""
+    output = os.path.join(output_dir, re.sub(r"[^\w.-]", "_", device_id) + ".raw.json")
+    with span("get-device-spec", device=device_id) as s:
+        result = get_runner(bundletool_path, java).run([
+            "get-device-spec",
+            f"--device-id={device_id}",
+            f"--output={output}",
+            "--overwrite",
+        ])
+        s.set(exit_code=result.returncode)
+    if result.returncode:
+        print(f"Error: Failed to get device spec of {device_id}. Error: {result.stderr.decode('utf-8')}")
+        return None
+    with open(output, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def normalize_spec(spec):
+    return {field: spec[field] for field in SPEC_FIELDS if field in spec}
+
+
+def spec_digest(spec):
+    canonical = json.dumps(normalize_spec(spec), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def group_devices_by_spec(bundletool_path, device_ids, output_dir, max_workers=4, java="java"):
+    """Return [(spec_path, spec_digest, [device_id, ...]), ...].
+
+    Devices whose spec could not be read are returned in a last group with
+    `spec_path` and `spec_digest` set to None, to be served by a full build.
+    """
+    workers = max(1, min(max_workers, len(device_ids) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        specs = list(pool.map(lambda device_id: fetch_device_spec(bundletool_path, device_id, output_dir, java),
+                              device_ids))
+
+    groups = {}
+    unknown = []
+    for device_id, spec in zip(device_ids, specs):
+        if spec is None:
+            unknown.append(device_id)
+            continue
+        digest = spec_digest(spec)
+        if digest not in groups:
+            spec_path = os.path.join(output_dir, f"spec-{digest[:16]}.json")
+            with open(spec_path, "w", encoding="utf-8") as f:
+                json.dump(normalize_spec(spec), f, indent=2, sort_keys=True)
+            groups[digest] = (spec_path, digest, [])
+        groups[digest][2].append(device_id)
+
+    result = list(groups.values())
+    if unknown:
+        result.append((None, None, unknown))
+    return result
@@ -0,0 +1,227 @@
+"""
+Install an .apks by streaming its splits straight into a package installer session.
+
+Instead of `bundletool install-apks`, the splits that match the device are
+picked from toc.pb (aab_installer.archive) for the device properties read
+with one `adb shell` call, a session is opened with
+`pm install-create`, every split is piped from the zip into its own
+`adb exec-in ... install-write` (several at a time) and the session is
+committed. Nothing is extracted to disk and only adb is needed, so `adb`
+may point at another machine's adb server (see aab_installer.farm).
+Whenever the splits cannot be matched or the session fails, the device falls
+back to install_on_device.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .adb_monitor import adb_command
+from .archive import read_apks
+from .parallel import DeviceResult, install_on_device
+from .process import CANCELLED_RETURNCODE, popen, terminate_on_cancel
+from .trace import span
+
+
+DEFAULT_WRITE_WORKERS = 4
+COPY_CHUNK = 1024 * 1024
+INSTALL_TIMEOUT = 600
+SHELL_TIMEOUT = 60
+SPEC_SCRIPT = ("echo @sdk; getprop ro.build.version.sdk; echo @abis; getprop ro.product.cpu.abilist; "
+                "echo @density; wm density; echo @locales; getprop persist.sys.locale; getprop ro.product.locale")
+DENSITY_DPI = {"ldpi": 120, "mdpi": 160, "tvdpi": 213, "hdpi": 240, "xhdpi": 320, "xxhdpi": 480, "xxxhdpi": 640}
+
+
+def _density_dpi(apk):
+    density = apk.densities[0]
+    if density in DENSITY_DPI:
+        return DENSITY_DPI[density]
+    return int(density) if density.isdigit() else None
+
+
+def parse_sections(text):
+    """{name: [line, ...]} of `adb shell` output split at its "@name" marker lines."""
+    sections, lines = {}, None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("@"):
+            lines = sections.setdefault(line[1:], [])
+        elif line and lines is not None:
+            lines.append(line)
+    return sections
+
+
+def spec_from_sections(sections):
+    """The device spec fields from the SPEC_SCRIPT sections of parse_sections(); None when incomplete."""
+    sdk = (sections.get("sdk") or [""])[0]
+    # "Override density" follows "Physical density" when the user changed the display size
+    densities = re.findall(r"density: (\d+)", "\n".join(sections.get("density", [])))
+    if not sdk.isdigit() or not densities:
+        return None
+    return {
+        "sdkVersion": int(sdk),
+        "supportedAbis": [abi for abi in (sections.get("abis") or [""])[0].split(",") if abi],
+        "screenDensity": int(densities[-1]),
+        "supportedLocales": sections.get("locales", [])[:1],
+    }
+
+
+def read_device_spec(device_id, adb="adb"):
+    """The split-matching fields of a bundletool device spec, read with getprop; None on failure."""
+    try:
+        result = subprocess.run(adb_command(adb, device_id, "shell", SPEC_SCRIPT), stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, timeout=SHELL_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return spec_from_sections(parse_sections(result.stdout.decode("utf-8", "replace")))
+
+
+def select_apks(info, spec):
+    """The APKs of `info` that install-apks would push to a device with `spec`, or None when unsure.
+
+    Picks the split variant with the highest minimum SDK the device
+    supports, then per install-time module the master and untargeted splits,
+    the split of the device's preferred ABI, the splits of its languages and
+    the closest screen density split.
+    """
+    sdk = spec.get("sdkVersion", 0)
+    variants = {}
+    for apk in info.apks:
+        if not apk.standalone and (apk.variant_min_sdk or 0) <= sdk:
+            variants.setdefault((apk.variant_min_sdk or 0, apk.variant), []).append(apk)
+    if not variants:
+        return None
+    candidates = [apk for apk in variants[max(variants)]
+                  if info.modules.get(apk.module, "install-time") == "install-time"]
+
+    languages = {locale.split("-")[0] for locale in spec.get("supportedLocales", [])}
+    selected = []
+    for module in sorted({apk.module for apk in candidates}):
+        apks = [apk for apk in candidates if apk.module == module]
+        selected.extend(apk for apk in apks if not (apk.abis or apk.languages or apk.densities))
+        selected.extend(apk for apk in apks if languages & set(apk.languages))
+
+        abi_apks = [apk for apk in apks if apk.abis]
+        if abi_apks:
+            abi = next((abi for abi in spec.get("supportedAbis", []) if any(abi in apk.abis for apk in abi_apks)),
+                       None)
+            if abi is None:
+                return None
+            selected.extend(apk for apk in abi_apks if abi in apk.abis)
+
+        density_apks = [(_density_dpi(apk), apk) for apk in apks if apk.densities]
+        if density_apks:
+            device_dpi = spec.get("screenDensity")
+            if device_dpi is None or any(dpi is None for dpi, _ in density_apks):
+                return None
+            higher = [(dpi, apk.path, apk) for dpi, apk in density_apks if dpi >= device_dpi]
+            selected.append(min(higher)[2] if higher else max((dpi, apk.path, apk) for dpi, apk in density_apks)[2])
+    return selected
+
+
+def _shell(adb, device_id, args):
+    """Run an `adb shell` command, returning (ok, output)."""
+    try:
+        result = subprocess.run(adb_command(adb, device_id, "shell", *args), stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, timeout=SHELL_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return False, str(e)
+    output = result.stdout.decode("utf-8", "replace").strip()
+    return result.returncode == 0 and output.startswith("Success"), output
+
+
+def write_split(adb, device_id, installer, session, apks_path, apk, cancel=None):
+    """Pipe one APK from the .apks zip into the install session. Returns (ok, output)."""
+    name = os.path.basename(apk.path)
+    with span("install-write", device=device_id, split=name, apks_bytes=apk.size) as s:
+        with zipfile.ZipFile(apks_path) as apks, apks.open(apk.path) as source:
+            process = popen(adb_command(adb, device_id, "exec-in", *installer, "install-write", "-S", str(apk.size),
+                                        session, name, "-"),
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            with terminate_on_cancel(process, cancel):
+                try:
+                    shutil.copyfileobj(source, process.stdin, COPY_CHUNK)
+                    process.stdin.close()
+                except OSError:
+                    # the write failed on the device side; its output says why
+                    pass
+                output = process.stdout.read().decode("utf-8", "replace").strip()
+                try:
+                    process.wait(timeout=INSTALL_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    return False, f"install-write of {name} timed out"
+        s.set(exit_code=process.returncode)
+    return process.returncode == 0 and output.startswith("Success"), output
+
+
+def install_session(adb, device_id, installer, apks_path, apks, write_workers=DEFAULT_WRITE_WORKERS, progress=None,
+                    cancel=None):
+    """Create, fill and commit an install session with `apks`. Returns (ok, output)."""
+    total_size = sum(apk.size for apk in apks)
+    ok, output = _shell(adb, device_id, [*installer, "install-create", "-r", "-S", str(total_size)])
+    match = re.search(r"\[(\d+)\]", output)
+    if not ok or not match:
+        return False, output
+    session = match.group(1)
+
+    def write(apk):
+        if cancel is not None and cancel.is_set():
+            return False, "cancelled"
+        if progress is not None:
+            progress(device_id, f"Writing {os.path.basename(apk.path)} ({apk.size / 2 ** 20:.1f} MB)")
+        try:
+            return write_split(adb, device_id, installer, session, apks_path, apk, cancel)
+        except (OSError, zipfile.BadZipFile, KeyError) as e:
+            return False, f"install-write of {apk.path} failed: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(write_workers, len(apks)))) as executor:
+        writes = list(executor.map(write, apks))
+    failed = [output for ok, output in writes if not ok]
+    if failed or (cancel is not None and cancel.is_set()):
+        _shell(adb, device_id, [*installer, "install-abandon", session])
+        return False, "\n".join(failed)
+
+    if progress is not None:
+        progress(device_id, "Committing install session")
+    return _shell(adb, device_id, [*installer, "install-commit", session])
+
+
+def install_direct(bundletool_path, apks_path, device_id, java="java", progress=None, cancel=None, adb="adb",
+                   write_workers=DEFAULT_WRITE_WORKERS, fallback=install_on_device):
+    """Drop-in replacement for install_on_device that streams the splits over adb itself.
+
+    `fallback` (install_on_device's signature) takes over when the direct
+    path fails; None reports the failure instead.
+    """
+    started = time.monotonic()
+    spec = read_device_spec(device_id, adb)
+    output = "cannot read the device properties" if spec is None else "no matching splits"
+    try:
+        apks = select_apks(read_apks(apks_path), spec) if spec is not None else None
+    except ValueError as e:
+        output = str(e)
+        apks = None
+
+    if apks:
+        # `cmd package` skips starting the pm wrapper's app_process; it exists since Android 7.0
+        installer = ["cmd", "package"] if spec.get("sdkVersion", 0) >= 24 else ["pm"]
+        if progress is not None:
+            progress(device_id, f"Streaming {len(apks)} splits")
+        with span("install-direct", device=device_id, splits=len(apks),
+                  apks_bytes=sum(apk.size for apk in apks)) as s:
+            ok, output = install_session(adb, device_id, installer, apks_path, apks, write_workers, progress, cancel)
+            s.set(exit_code=0 if ok else 1)
+        if ok:
+            return DeviceResult(device_id, 0, output, "", started, time.monotonic(), apks_path)
+        if cancel is not None and cancel.is_set():
+            return DeviceResult(device_id, CANCELLED_RETURNCODE, "", "cancelled", started, time.monotonic(),
+                                apks_path)
+    if fallback is None:
+        return DeviceResult(device_id, 1, "", output, started, time.monotonic(), apks_path)
+    print(f"Direct install on {device_id} failed, falling back to install-apks: {output}")
+    return fallback(bundletool_path, apks_path, device_id, java, progress, cancel)
@@ -0,0 +1,187 @@
+"""
+Install on devices attached to several machines, each running its own adb server.
+
+An endpoint is "host[:port][@MB/s]", e.g. "rack-2:5037@40" or "[::1]:5037"
+(IPv6 addresses go in brackets): the address of an adb server (started
+with `adb -a server` to listen on the network) and, optionally, how fast
+that machine's USB bus moves APKs. Devices are discovered through one
+adb_monitor per endpoint and named "host:port/serial".
+
+The .apks is built once and every device is installed through the server
+that owns it: bundletool `install-apks` with ANDROID_ADB_SERVER_PORT for
+servers on this machine, and for other machines aab_installer.direct_install
+over `adb -H host -P port` (bundletool's ddmlib only reaches local servers).
+Each host gets its own pool whose size follows its bandwidth, so a fast host
+runs more installs at once while a slow USB bus is not split between more
+transfers than it can carry.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .adb_monitor import ADB_PORT, get_device_monitor
+from .direct_install import install_direct
+from .parallel import InstallReport, failed_results, install_on_device, install_on_devices, skipped_results
+from .probe import matches_build, probe_devices
+from .trace import span
+
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+# Roughly what one `adb install` pulls over USB 2.0; a host with bandwidth B runs B / DEVICE_BANDWIDTH installs
+DEVICE_BANDWIDTH = 30.0
+MONITOR_TIMEOUT = 5.0
+
+
+class AdbEndpoint:
+    def __init__(self, host, port=ADB_PORT, bandwidth=None):
+        self.host = host
+        self.port = port
+        # MB/s of the host's USB bus, None when unknown
+        self.bandwidth = bandwidth
+
+    @classmethod
+    def parse(cls, text):
+        """AdbEndpoint from "host[:port][@MB/s]", with an IPv6 host as "[addr]". Raises ValueError."""
+        address, _, bandwidth = text.partition("@")
+        if address.startswith("["):
+            host, bracket, port = address[1:].partition("]")
+            if not bracket or (port and not port.startswith(":")):
+                raise ValueError(f"bad adb server address {text!r}, expected [IPv6]:port")
+            port = port[1:]
+        elif address.count(":") > 1:
+            raise ValueError(f"IPv6 adb server address {text!r} needs brackets, e.g. [{address}]:{ADB_PORT}")
+        else:
+            host, _, port = address.partition(":")
+        try:
+            return cls(host or "127.0.0.1", int(port) if port else ADB_PORT, float(bandwidth) if bandwidth else None)
+        except ValueError:
+            raise ValueError(f"bad adb server address {text!r}, expected host[:port][@MB/s]") from None
+
+    @property
+    def name(self):
+        return f"[{self.host}]:{self.port}" if ":" in self.host else f"{self.host}:{self.port}"
+
+    @property
+    def local(self):
+        return self.host in LOCAL_HOSTS
+
+    def adb(self, adb="adb"):
+        """adb command prefix that talks to this server."""
+        return [adb, "-H", self.host, "-P", str(self.port)]
+
+    def env(self):
+        """Environment for bundletool so its ddmlib uses this (local) server."""
+        return dict(os.environ, ANDROID_ADB_SERVER_PORT=str(self.port))
+
+    def slots(self, default):
+        """Installs to run on this host at once."""
+        return max(1, round(self.bandwidth / DEVICE_BANDWIDTH)) if self.bandwidth else default
+
+    def __repr__(self):
+        return f"<AdbEndpoint {self.name} bandwidth={self.bandwidth}>"
+
+
+def device_name(endpoint, serial):
+    return f"{endpoint.name}/{serial}"
+
+
+def split_device_name(device_id):
+    """(endpoint name, serial) of a "host:port/serial" device."""
+    endpoint_name, _, serial = device_id.partition("/")
+    return endpoint_name, serial
+
+
+def discover_devices(endpoints):
+    """Ready devices of every endpoint as "host:port/serial", skipping servers that cannot be reached."""
+    with span("devices", endpoints=len(endpoints)) as s:
+        devices = []
+        for endpoint in endpoints:
+            monitor = get_device_monitor(endpoint.host, endpoint.port)
+            if not monitor.wait_ready(timeout=MONITOR_TIMEOUT):
+                print(f"Warning: adb server {endpoint.name} is not reachable, skipping its devices")
+                continue
+            devices.extend(device_name(endpoint, serial) for serial in monitor.devices())
+        s.set(source="farm", count=len(devices))
+        return devices
+
+
+def install_through(endpoint, bundletool_path, apks_path, device_id, java="java", adb="adb", progress=None,
+                    cancel=None):
+    """Install on one "host:port/serial" device of `endpoint`; the result keeps that device id."""
+    _, serial = split_device_name(device_id)
+    device_progress = None if progress is None else lambda _, message: progress(device_id, message)
+    if endpoint.local:
+        result = install_on_device(bundletool_path, apks_path, serial, java, device_progress, cancel,
+                                   env=endpoint.env())
+    else:
+        result = install_direct(bundletool_path, apks_path, serial, java, device_progress, cancel,
+                                adb=endpoint.adb(adb), fallback=None)
+    result.device_id = device_id
+    return result
+
+
+def farm_installer(endpoints, adb="adb"):
+    """install(bundletool_path, apks_path, device_id, java, progress, cancel) for "host:port/serial" devices."""
+    by_name = {endpoint.name: endpoint for endpoint in endpoints}
+
+    def install(bundletool_path, apks_path, device_id, java, progress=None, cancel=None):
+        endpoint_name, _ = split_device_name(device_id)
+        return install_through(by_name[endpoint_name], bundletool_path, apks_path, device_id, java, adb, progress,
+                               cancel)
+
+    return install
+
+
+def install_on_host(bundletool_path, apks_path, endpoint, serials, max_workers, java="java", adb="adb", identity=None,
+                    progress=None, cancel=None, retry=None):
+    """Install on the devices of one adb server. Returns an InstallReport with "host:port/serial" ids."""
+    host_adb = endpoint.adb(adb)
+    reports = []
+    if identity:
+        package, version_code = identity
+        with span("probe", devices=len(serials), host=endpoint.name):
+            probes = probe_devices(serials, package, host_adb, max_workers)
+        up_to_date = [serial for serial in serials if matches_build(probes[serial], version_code, apks_path)]
+        reports.append(skipped_results(apks_path, [device_name(endpoint, serial) for serial in up_to_date]))
+        serials = [serial for serial in serials if serial not in up_to_date]
+
+    def install(bundletool_path, apks_path, device_id, java, progress=None, cancel=None):
+        return install_through(endpoint, bundletool_path, apks_path, device_id, java, adb, progress, cancel)
+
+    reports.append(install_on_devices(bundletool_path, apks_path, [device_name(endpoint, serial) for serial in serials],
+                                      max_workers=endpoint.slots(max_workers), java=java, install=install,
+                                      progress=progress, cancel=cancel, retry=retry))
+    return InstallReport.merge(reports, sum(report.elapsed for report in reports))
+
+
+def install_on_farm(bundletool_path, apks_path, device_ids, endpoints, max_workers, java="java", adb="adb",
+                    identity=None, progress=None, cancel=None, retry=None):
+    """Install `apks_path` on "host:port/serial" devices, all hosts at once.
+
+    `max_workers` is the pool size of hosts without a known bandwidth.
+    With `identity` ((package, versionCode)), devices that already have the
+    build are skipped as in install_prepared. When a host fails as a whole
+    (e.g. its probe raises), its devices get failed results.
+    """
+    started = time.monotonic()
+    by_name = {endpoint.name: endpoint for endpoint in endpoints}
+    groups = {}
+    for device_id in device_ids:
+        endpoint_name, serial = split_device_name(device_id)
+        groups.setdefault(endpoint_name, []).append(serial)
+
+    def run_host(name, serials):
+        endpoint = by_name[name]
+        try:
+            return install_on_host(bundletool_path, apks_path, endpoint, serials, max_workers, java, adb, identity,
+                                   progress, cancel, retry)
+        except Exception as e:
+            print(f"Error: Install through {name} raised: {e}")
+            return failed_results(apks_path, [device_name(endpoint, serial) for serial in serials],
+                                  str(e) or type(e).__name__, error="unknown")
+
+    with ThreadPoolExecutor(max_workers=max(1, len(groups))) as hosts:
+        futures = [hosts.submit(run_host, name, serials) for name, serials in groups.items()]
+        reports = [future.result() for future in futures]
+    return InstallReport.merge(reports, time.monotonic() - started)
@@ -0,0 +1,147 @@
+"""
+Push only the split APKs that changed since the build a device already has.
+
+For a device that runs an older build with the same versionCode, the APKs
+bundletool would install on it are extracted (`extract-apks` with the
+device's spec, once per build and spec, kept in the .apks cache) and
+compared by sha256 with what the probe found installed.
+Only the new or changed ones go to the device, in an
+`adb install-multiple -p <package>` session that inherits the unchanged
+splits. Any failure falls back to a full `install-apks`.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from .bundletool import get_runner
+from .cache import ApksCache, file_digest, release
+from .device_spec import fetch_device_spec, normalize_spec, spec_digest
+from .parallel import DeviceResult, device_lines, install_on_device
+from .process import CANCELLED_RETURNCODE, run_streaming
+from .trace import span
+from .workspace import place_artifact
+
+
+INSTALL_TIMEOUT = 600
+# one extract-apks per (build, device spec) at a time
+_extract_locks = {}
+_extract_locks_lock = threading.Lock()
+
+
+def _extraction(bundletool_path, apks_path, spec, device_id, java):
+    """Cached directory of the APKs extracted from `apks_path` for `spec`, or None on failure."""
+    cache = ApksCache()
+    key = hashlib.sha256(f"{file_digest(apks_path)}\n{spec_digest(spec)}".encode("utf-8")).hexdigest()
+    with _extract_locks_lock:
+        lock = _extract_locks.setdefault(key, threading.Lock())
+    with lock, span("extract-apks", device=device_id) as s:
+        cached = cache.get_extracted(key)
+        if cached:
+            s.set(cache="hit")
+            return cached
+        work_dir = cache.temp_dir()
+        spec_path = os.path.join(work_dir, "device-spec.json")
+        with open(spec_path, "w", encoding="utf-8") as f:
+            json.dump(normalize_spec(spec), f)
+        extract_dir = os.path.join(work_dir, "apks")
+        result = get_runner(bundletool_path, java).run([
+            "extract-apks",
+            f"--apks={apks_path}",
+            f"--device-spec={spec_path}",
+            f"--output-dir={extract_dir}",
+        ])
+        s.set(cache="miss", exit_code=result.returncode)
+        if result.returncode:
+            cache.discard(work_dir)
+            print(f"Error: Failed to extract APKs for {device_id}. Error: {result.stderr.decode('utf-8')}")
+            return None
+        os.remove(spec_path)
+        return cache.commit_extracted(key, work_dir)
+
+
+def extract_device_apks(bundletool_path, apks_path, device_id, output_dir, java="java"):
+    """Paths of the APKs `install-apks` would push to the device, or None on failure.
+
+    Devices with the same spec share one extraction in the .apks cache; the
+    APKs are linked into `output_dir`, so the cache can evict the extraction
+    while this device still installs from it.
+    """
+    spec = fetch_device_spec(bundletool_path, device_id, output_dir, java)
+    if spec is None:
+        return None
+    extracted = _extraction(bundletool_path, apks_path, spec, device_id, java)
+    if extracted is None:
+        return None
+    apk_paths = []
+    try:
+        for directory, _, names in os.walk(extracted):
+            for name in names:
+                if name.endswith(".apk"):
+                    apk_path = os.path.join(output_dir, name)
+                    place_artifact(os.path.join(directory, name), apk_path)
+                    apk_paths.append(apk_path)
+    finally:
+        release(extracted)
+    return sorted(apk_paths)
+
+
+def changed_apks(apk_paths, installed):
+    """The APKs of `apk_paths` that are not byte-identical to an installed one.
+
+    Returns None when the installed split set cannot be patched in place
+    (a different number of APKs, e.g. a module was added or removed).
+    """
+    if not installed["apks"] or len(installed["apks"]) != len(apk_paths):
+        return None
+    return [path for path in apk_paths if file_digest(path) not in installed["apks"]]
+
+
+def install_partial(device_id, package, apk_paths, adb="adb", on_line=None, cancel=None):
+    """Run `adb install-multiple -p` with the given splits. Returns (ok, output)."""
+    with span("install-partial", device=device_id, splits=len(apk_paths),
+              apks_bytes=sum(os.path.getsize(path) for path in apk_paths)) as s:
+        try:
+            result = run_streaming([adb, "-s", device_id, "install-multiple", "-r", "-p", package, *apk_paths],
+                                   on_line, cancel, timeout=INSTALL_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            s.set(error=str(e))
+            return False, str(e)
+        s.set(exit_code=result.returncode)
+    output = (result.stdout + result.stderr).decode("utf-8", "replace")
+    return result.returncode == 0 and "Success" in output, output
+
+
+def install_incremental(bundletool_path, apks_path, device_id, package, installed, adb="adb", java="java",
+                        progress=None, cancel=None):
+    """Install `apks_path` on the device, pushing only the changed splits when possible.
+
+    `installed` is the device's probe result from aab_installer.probe.
+    """
+    started = time.monotonic()
+    # on the cache's filesystem, so the extracted APKs are hard-linked rather than copied
+    work_dir = ApksCache().temp_dir()
+    try:
+        if progress is not None:
+            progress(device_id, "Comparing splits with the installed build")
+        apk_paths = extract_device_apks(bundletool_path, apks_path, device_id, work_dir, java)
+        changed = changed_apks(apk_paths, installed) if apk_paths else None
+        if changed:
+            names = [os.path.basename(path) for path in changed]
+            if progress is not None:
+                progress(device_id, f"Pushing {len(changed)} of {len(apk_paths)} splits: {', '.join(names)}")
+            ok, output = install_partial(device_id, package, changed, adb, device_lines(progress, device_id),
+                                         cancel)
+            if ok:
+                return DeviceResult(device_id, 0, output, "", started, time.monotonic(), apks_path, pushed=names)
+            if cancel is not None and cancel.is_set():
+                return DeviceResult(device_id, CANCELLED_RETURNCODE, "", "cancelled", started,
+                                    time.monotonic(), apks_path)
+            print(f"Partial install on {device_id} failed, falling back to a full install: {output.strip()}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return install_on_device(bundletool_path, apks_path, device_id, java, progress, cancel)
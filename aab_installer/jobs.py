@@ -0,0 +1,181 @@
+"""
+Queue of install jobs that run side by side but never on the same device at once.
+
+Each submitted job runs in its own thread. Before its work starts, the job
+waits until every earlier job that shares one of its devices has finished,
+so installs never race on a device and each device gets the jobs in the
+order they were queued. Jobs on disjoint devices run concurrently.
+
+A job's devices may be given as a callable, such as the "devices" task of an
+install graph. The callable is resolved in the job's thread. Until it
+returns, later jobs treat the job as using every device, and so does a job
+submitted with devices=None.
+
+A job's `cleanup(job)` runs in its thread once the job has ended, also
+when it was cancelled before its work started, e.g. to shut down the task
+graph of a build nobody will install.
+
+The builds start before their jobs are queued (the mac and win GUIs build
+as soon as an AAB is picked, see aab_installer.core.PreparedInstall), so
+only the install waits here; see aab_installer.core.queue_install.
+"""
+
+import itertools
+import threading
+import time
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+# headers of Job.row(), for the GUIs' job tables
+COLUMNS = ["Job", "AAB", "State", "Devices", "Elapsed"]
+
+
+class Job:
+    def __init__(self, job_id, name, run, devices, cancel, cleanup=None):
+        self.job_id = job_id
+        self.name = name
+        self.run = run
+        self.cleanup = cleanup
+        # device ids once resolved; None while unknown or for "every device"
+        self.devices = None
+        self.device_source = devices
+        self.cancel = cancel
+        self.state = QUEUED
+        # time.time(), like the trace spans
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    @property
+    def active(self):
+        return self.state in ACTIVE_STATES
+
+    @property
+    def elapsed(self):
+        """Seconds spent running, or waiting while still queued."""
+        end = self.finished or time.time()
+        return end - (self.started or self.submitted)
+
+    def row(self):
+        """Table cells for COLUMNS."""
+        devices = ", ".join(self.devices) if self.devices is not None else "-"
+        return f"#{self.job_id}", self.name, self.state, devices, f"{self.elapsed:.1f}s"
+
+    def __repr__(self):
+        return f"<Job #{self.job_id} {self.name} {self.state} devices={self.devices}>"
+
+
+class JobScheduler:
+    """Runs `run(job)` for each submitted job, serialized per device.
+
+    `on_change(job)` is called from the job threads whenever a job is
+    queued, gets its devices, starts or finishes.
+    """
+
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self._jobs = []
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+
+    def submit(self, name, run, devices=None, cancel=None, cleanup=None):
+        """Queue `run(job)`; `devices` is a list of ids, a callable returning one, or None for every device.
+
+        `cancel` (a threading.Event, new by default) becomes job.cancel and is
+        set by cancel(); a running job's work should watch it. `cleanup(job)`
+        is called once the job has ended, however it ended.
+        """
+        with self._condition:
+            job = Job(next(self._ids), name, run, devices, cancel or threading.Event(), cleanup)
+            self._jobs.append(job)
+        self._changed(job)
+        threading.Thread(target=self._work, args=(job,), name=f"job-{job.job_id}", daemon=True).start()
+        return job
+
+    def jobs(self):
+        """All jobs in submission order."""
+        with self._condition:
+            return list(self._jobs)
+
+    def get(self, job_id):
+        with self._condition:
+            return next((job for job in self._jobs if job.job_id == job_id), None)
+
+    def active(self):
+        """True while any job is queued or running."""
+        with self._condition:
+            return any(job.active for job in self._jobs)
+
+    def cancel(self, job_id=None):
+        """Cancel one job, or every unfinished job when `job_id` is None."""
+        with self._condition:
+            for job in self._jobs:
+                if job.active and job_id in (None, job.job_id):
+                    job.cancel.set()
+            self._condition.notify_all()
+
+    def _changed(self, job):
+        if self.on_change is not None:
+            self.on_change(job)
+
+    def _blocked(self, job):
+        for earlier in self._jobs:
+            if earlier is job:
+                return False
+            if earlier.active and (earlier.devices is None or job.devices is None
+                                   or set(earlier.devices) & set(job.devices)):
+                return True
+        return False
+
+    def _work(self, job):
+        try:
+            self._prepare_and_run(job)
+        finally:
+            if job.cleanup is not None:
+                try:
+                    job.cleanup(job)
+                except Exception as e:
+                    print(f"Cleanup of job #{job.job_id} ({job.name}) failed: {e}")
+
+    def _prepare_and_run(self, job):
+        try:
+            devices = job.device_source() if callable(job.device_source) else job.device_source
+        except Exception as e:
+            print(f"Could not list the devices of job #{job.job_id}, waiting for every device: {e}")
+            devices = None
+        with self._condition:
+            job.devices = list(devices) if devices is not None else None
+            # later jobs may not share any device with this one
+            self._condition.notify_all()
+        self._changed(job)
+
+        with self._condition:
+            while self._blocked(job) and not job.cancel.is_set():
+                self._condition.wait()
+            if job.cancel.is_set():
+                job.state, job.finished = CANCELLED, time.time()
+                self._condition.notify_all()
+            else:
+                job.state, job.started = RUNNING, time.time()
+        self._changed(job)
+        if job.state == CANCELLED:
+            return
+
+        try:
+            job.result = job.run(job)
+            state = CANCELLED if job.cancel.is_set() else DONE if job.result else FAILED
+        except Exception as e:
+            print(f"Job #{job.job_id} ({job.name}) failed: {e}")
+            job.error = str(e) or type(e).__name__
+            state = FAILED
+        with self._condition:
+            job.state, job.finished = state, time.time()
+            self._condition.notify_all()
+        self._changed(job)
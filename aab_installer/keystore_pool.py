@@ -0,0 +1,208 @@
+"""
+Managed store of debug signing keys reused across sessions.
+
+Instead of running keytool for every selected AAB, the pool keeps one
+active key plus spare keys under ~/.aab_installer/keystores. Spares are
+generated in the background, so asking for a key is normally just reading
+the index. `rotate()` retires the active key and promotes a spare.
+Reusing the same key also lets the .apks cache hit across sessions.
+
+Every GUI window and command line run has its own pool object, so index.json
+is only changed under a lock file and replaced atomically. keytool runs
+outside the lock. A retired key stays on disk for RETIRED_GRACE seconds,
+since builds that picked it up before the rotation may still be reading it.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .core import DEFAULT_KEYPASS, DEFAULT_STOREPASS, generate_keystore
+
+
+DEFAULT_POOL_DIR = os.path.join(os.path.expanduser("~"), ".aab_installer", "keystores")
+DEFAULT_SPARES = 1
+# keytool is called with -validity 10000; stop handing out keys a year before they expire.
+KEY_LIFETIME = (10000 - 365) * 24 * 3600
+# longest a build may still read a key after it was retired
+RETIRED_GRACE = 3600
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on `path` shared with other processes."""
+    with open(path, "a+b") as f:
+        if sys.platform == "win32":
+            import msvcrt
+
+            while True:
+                try:
+                    # LK_LOCK itself gives up after 10 seconds
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class KeystorePool:
+    def __init__(self, root=DEFAULT_POOL_DIR, spares=DEFAULT_SPARES, storepass=DEFAULT_STOREPASS,
+                 keypass=DEFAULT_KEYPASS, keytool="keytool"):
+        self.root = root
+        self.spares = spares
+        self.storepass = storepass
+        self.keypass = keypass
+        self.keytool = keytool
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._prefill_lock = threading.Lock()
+        self._prefill_thread = None
+
+    @contextmanager
+    def _locked(self):
+        """The index, loaded under the thread lock and the lock file; write it back with _save."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, _file_lock(os.path.join(self.root, "index.lock")):
+            yield self._load()
+
+    def _load(self):
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("current", None)
+        index.setdefault("spares", [])
+        index.setdefault("retired", [])
+        return index
+
+    def _save(self, index):
+        tmp_path = f"{self._index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self._index_path)
+
+    @staticmethod
+    def _usable(key):
+        return bool(key) and os.path.exists(key["path"]) and time.time() - key["created"] < KEY_LIFETIME
+
+    def _generate(self):
+        os.makedirs(self.root, exist_ok=True)
+        name = uuid.uuid4().hex[:8]
+        path = os.path.join(self.root, f"debug-{name}.jks")
+        alias = f"aab-installer-{name}"
+        if generate_keystore(path, alias, self.storepass, self.keypass, self.keytool) is None:
+            raise RuntimeError("Failed to generate keystore")
+        return {"path": path, "alias": alias, "created": time.time()}
+
+    def current(self, prefill=True):
+        """(keystore_path, alias) of the active key, generating one only if the pool is empty.
+
+        With `prefill`, spare keys are topped up on a background thread.
+        """
+        key = self._promote()
+        if key is None:
+            key = self._install(self._generate())
+        if prefill:
+            self.start_prefill()
+        return key["path"], key["alias"]
+
+    def _promote(self):
+        """The active key, promoting a spare if needed; None when a new key must be generated."""
+        with self._locked() as index:
+            changed = self._purge_retired(index)
+            if not self._usable(index["current"]):
+                self._retire(index, index["current"])
+                index["spares"] = [key for key in index["spares"] if self._usable(key)]
+                index["current"] = index["spares"].pop(0) if index["spares"] else None
+                changed = True
+            if changed:
+                self._save(index)
+            return index["current"]
+
+    def _install(self, key):
+        """Make a freshly generated `key` the active one, unless another pool got there first."""
+        with self._locked() as index:
+            if self._usable(index["current"]):
+                index["spares"].append(key)
+            else:
+                self._retire(index, index["current"])
+                index["current"] = key
+            self._save(index)
+            return index["current"]
+
+    def rotate(self, prefill=True):
+        """Retire the active key and switch to a spare (or a new key)."""
+        with self._locked() as index:
+            self._retire(index, index["current"])
+            index["current"] = None
+            self._save(index)
+        return self.current(prefill)
+
+    @staticmethod
+    def _retire(index, key):
+        """Queue `key` for deletion once RETIRED_GRACE has passed."""
+        if key:
+            index["retired"].append(dict(key, retired=time.time()))
+
+    @staticmethod
+    def _purge_retired(index):
+        """Delete the retired keys past their grace period; True when the index changed."""
+        cutoff = time.time() - RETIRED_GRACE
+        kept = []
+        for key in index["retired"]:
+            try:
+                if key["retired"] < cutoff:
+                    os.remove(key["path"])
+                    continue
+            except FileNotFoundError:
+                continue
+            except OSError:
+                # still open elsewhere (Windows); tried again on a later call
+                pass
+            kept.append(key)
+        changed = len(kept) != len(index["retired"])
+        index["retired"] = kept
+        return changed
+
+    def prefill(self):
+        """Generate spare keys until the pool holds `spares` of them."""
+        while True:
+            with self._locked() as index:
+                if len([key for key in index["spares"] if self._usable(key)]) >= self.spares:
+                    return
+            key = self._generate()
+            with self._locked() as index:
+                index["spares"].append(key)
+                self._save(index)
+
+    def start_prefill(self):
+        """Run `prefill` on a background thread unless one is already running."""
+        with self._prefill_lock:
+            if self._prefill_thread is not None and self._prefill_thread.is_alive():
+                return self._prefill_thread
+            self._prefill_thread = threading.Thread(target=self._prefill_quietly, daemon=True)
+            self._prefill_thread.start()
+            return self._prefill_thread
+
+    def _prefill_quietly(self):
+        try:
+            self.prefill()
+        except RuntimeError as e:
+            print(f"Error while pre-generating keystores: {e}")
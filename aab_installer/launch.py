@@ -0,0 +1,157 @@
+"""
+Launch the installed app on every device and time its startup.
+
+The launcher activity is resolved once per device with
+`cmd package resolve-activity`. Each iteration is one `adb shell` that
+force-stops the package and runs `am start -W` (a cold start), goes back to
+the home screen and runs `am start -W` again while the process and its
+activity are alive (a hot start). TotalTime and WaitTime are what
+ActivityManager reports in milliseconds; LaunchState (Android 10+) says how
+the system classified the start, and samples it classified differently from
+their bucket are dropped. All devices are measured at the same time, each
+in its own thread: the work is on the devices, and a shared limit would
+make one device's timings depend on how many others are attached.
+"""
+
+import re
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .adb_monitor import adb_command
+from .direct_install import parse_sections
+from .trace import span
+
+
+LAUNCH_TIMEOUT = 60
+# seconds for the activity to draw before it is sent to the background
+SETTLE_SECONDS = 1
+_RESOLVE_SCRIPT = ("cmd package resolve-activity --brief -a android.intent.action.MAIN "
+                   "-c android.intent.category.LAUNCHER {package} | tail -n 1")
+_LAUNCH_SCRIPT = (
+    "am force-stop {package}; echo @cold; am start -W -n {component}; sleep {settle}; "
+    "input keyevent KEYCODE_HOME; sleep {settle}; echo @hot; am start -W -n {component}"
+)
+# the LaunchState each bucket must report; older Android versions report none
+LAUNCH_STATES = {"cold": "COLD", "hot": "HOT"}
+
+
+class LaunchStats:
+    def __init__(self, device_id, component=None):
+        self.device_id = device_id
+        self.component = component
+        # {"cold": [(total_ms, wait_ms, launch_state), ...], "hot": [...]}
+        self.samples = {"cold": [], "hot": []}
+        # starts dropped because their LaunchState did not match the bucket
+        self.dropped = 0
+        self.error = None
+
+    @property
+    def ok(self):
+        return bool(self.samples["cold"])
+
+    def summary(self, kind):
+        """{"runs", "median_ms", "min_ms", "max_ms", "wait_median_ms", "launch_state"} of one start kind."""
+        samples = self.samples[kind]
+        if not samples:
+            return None
+        totals = [total for total, _, _ in samples]
+        waits = [wait for _, wait, _ in samples if wait is not None]
+        states = {state for _, _, state in samples if state}
+        return {
+            "runs": len(samples),
+            "median_ms": statistics.median(totals),
+            "min_ms": min(totals),
+            "max_ms": max(totals),
+            "wait_median_ms": statistics.median(waits) if waits else None,
+            "launch_state": "/".join(sorted(states)) or None,
+        }
+
+    def to_dict(self):
+        return {
+            "component": self.component,
+            "cold": self.summary("cold"),
+            "hot": self.summary("hot"),
+            "dropped": self.dropped,
+            "error": self.error,
+        }
+
+    def format(self):
+        """e.g. "cold 612 ms (598-640), hot 95 ms (90-101), 5 runs" for the console."""
+        if not self.ok:
+            return f"no startup time ({self.error or 'no samples'})"
+        parts = []
+        for kind in ("cold", "hot"):
+            summary = self.summary(kind)
+            if summary:
+                parts.append(f"{kind} {summary['median_ms']:.0f} ms ({summary['min_ms']}-{summary['max_ms']})")
+        dropped = f", {self.dropped} dropped (LaunchState mismatch)" if self.dropped else ""
+        return f"{', '.join(parts)}, {len(self.samples['cold'])} runs{dropped}"
+
+
+def _shell(adb, device_id, script):
+    result = subprocess.run(adb_command(adb, device_id, "shell", script), stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, timeout=LAUNCH_TIMEOUT)
+    return result.returncode, result.stdout.decode("utf-8", "replace")
+
+
+def resolve_launcher(device_id, package, adb="adb"):
+    """The launcher activity of `package` as "package/activity", or None."""
+    _, output = _shell(adb, device_id, _RESOLVE_SCRIPT.format(package=package))
+    component = output.strip()
+    return component if re.fullmatch(r"[\w.]+/[\w.$]+", component) else None
+
+
+def parse_start(lines):
+    """(total_ms, wait_ms, launch_state) from `am start -W` output; None when it did not start."""
+    values = dict(line.split(":", 1) for line in lines if ":" in line)
+    total = values.get("TotalTime", values.get("ThisTime", "")).strip()
+    if not total.isdigit():
+        return None
+    wait = values.get("WaitTime", "").strip()
+    return int(total), int(wait) if wait.isdigit() else None, values.get("LaunchState", "").strip() or None
+
+
+def measure_device(device_id, package, iterations, adb="adb", progress=None, cancel=None):
+    """LaunchStats of `iterations` cold and hot starts of `package` on one device."""
+    stats = LaunchStats(device_id)
+    with span("launch", device=device_id, iterations=iterations) as s:
+        try:
+            stats.component = resolve_launcher(device_id, package, adb)
+            if stats.component is None:
+                stats.error = "no launcher activity"
+                return stats
+            for iteration in range(iterations):
+                if cancel is not None and cancel.is_set():
+                    break
+                if progress is not None:
+                    progress(device_id, f"Measuring startup {iteration + 1}/{iterations}")
+                _, output = _shell(adb, device_id, _LAUNCH_SCRIPT.format(package=package, component=stats.component,
+                                                                         settle=SETTLE_SECONDS))
+                sections = parse_sections(output)
+                for kind in ("cold", "hot"):
+                    sample = parse_start(sections.get(kind, []))
+                    if sample is None:
+                        continue
+                    if sample[2] is not None and sample[2] != LAUNCH_STATES[kind]:
+                        # e.g. a "hot" start that found its activity destroyed
+                        stats.dropped += 1
+                        continue
+                    stats.samples[kind].append(sample)
+                if parse_start(sections.get("cold", [])) is None:
+                    stats.error = " ".join(sections.get("cold", [])) or output.strip() or "am start failed"
+                    break
+        except (OSError, subprocess.TimeoutExpired) as e:
+            stats.error = str(e)
+        cold = stats.summary("cold")
+        s.set(ok=stats.ok, cold_ms=cold and cold["median_ms"])
+    return stats
+
+
+def measure_startup(device_ids, package, iterations, adb="adb", progress=None, cancel=None):
+    """{device_id: LaunchStats}, measured on all devices concurrently (one thread per device)."""
+    if not device_ids or iterations <= 0:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(device_ids)) as executor:
+        return dict(zip(device_ids, executor.map(
+            lambda device_id: measure_device(device_id, package, iterations, adb, progress, cancel), device_ids)))
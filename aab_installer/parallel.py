@@ -0,0 +1,242 @@
+"""
+Install a built .apks archive on several devices at once.
+
+Each device gets its own `bundletool install-apks` call; a bounded thread
+pool keeps at most `max_workers` of them running so a full test rack does not
+start dozens of JVMs at the same time.
+
+The optional `progress(device_id, message)` callback is called from the
+install threads as a device moves through its install, and setting the
+optional `cancel` threading.Event stops the installs that are still running.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .bundletool import get_runner
+from .retry import TRANSIENT_FAILURES, Deadline, RetryPolicy, classify_failure, get_circuit_breaker
+from .trace import span
+
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class DeviceResult:
+    def __init__(self, device_id, returncode, stdout="", stderr="", started=0.0, finished=0.0, apks_path=None,
+                 skipped=False, pushed=None, error=None, attempts=1, launch=None):
+        self.device_id = device_id
+        self.apks_path = apks_path
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.started = started
+        self.finished = finished
+        # True when the device already had this build and nothing was pushed
+        self.skipped = skipped
+        # APK names pushed by an incremental install; None for a full install
+        self.pushed = pushed
+        # failure class from aab_installer.retry.classify_failure, None when ok
+        self.error = error
+        self.attempts = attempts
+        # startup times from aab_installer.launch.LaunchStats.to_dict(), when measured
+        self.launch = launch
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+    def to_dict(self):
+        return {
+            "device_id": self.device_id,
+            "apks": self.apks_path,
+            "ok": self.ok,
+            "skipped": self.skipped,
+            "pushed": self.pushed,
+            "returncode": self.returncode,
+            "error": self.error,
+            "attempts": self.attempts,
+            "duration": round(self.duration, 3),
+            "stderr": self.stderr,
+            "launch": self.launch,
+        }
+
+
+class InstallReport:
+    """Per-device results of one install run. Truthy when every device succeeded."""
+
+    def __init__(self, apks_path, results, elapsed, max_workers):
+        self.apks_path = apks_path
+        self.results = results
+        self.elapsed = elapsed
+        self.max_workers = max_workers
+
+    @classmethod
+    def merge(cls, reports, elapsed):
+        """Combine the reports of several install rounds (e.g. one per device spec)."""
+        apks_paths = {report.apks_path for report in reports}
+        return cls(
+            apks_paths.pop() if len(apks_paths) == 1 else None,
+            [result for report in reports for result in report.results],
+            elapsed,
+            max((report.max_workers for report in reports), default=0),
+        )
+
+    @property
+    def ok(self):
+        return all(result.ok for result in self.results)
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f"<InstallReport ok={self.ok} devices={len(self.results)} elapsed={self.elapsed:.1f}s>"
+
+    @property
+    def failed_devices(self):
+        return [result.device_id for result in self.results if not result.ok]
+
+    def format_failures(self):
+        """e.g. "emulator-5554 (device-offline), R58M (signature-mismatch)" for status lines."""
+        return ", ".join(f"{result.device_id} ({result.error or 'failed'})" for result in self.results
+                         if not result.ok)
+
+    def to_dict(self):
+        return {
+            "apks": self.apks_path,
+            "ok": self.ok,
+            "elapsed": round(self.elapsed, 3),
+            "max_workers": self.max_workers,
+            "devices": [result.to_dict() for result in self.results],
+        }
+
+
+def device_lines(progress, device_id):
+    """An on_line callback forwarding a device's tool output to `progress`, or None."""
+    if progress is None:
+        return None
+    return lambda stream, line: progress(device_id, line) if line.strip() else None
+
+
+def install_on_device(bundletool_path, apks_path, device_id, java="java", progress=None, cancel=None, env=None):
+    """`bundletool install-apks` on one device; `env` reaches another adb server via ANDROID_ADB_SERVER_PORT."""
+    started = time.monotonic()
+    if progress is not None:
+        progress(device_id, "Installing all splits")
+    with span("install-apks", device=device_id) as s:
+        try:
+            s.set(apks_bytes=os.path.getsize(apks_path))
+        except OSError:
+            # bundletool reports the missing file itself
+            pass
+        result = get_runner(bundletool_path, java, env=env).run([
+            "install-apks",
+            f"--apks={apks_path}",
+            f"--device-id={device_id}",
+        ], device_lines(progress, device_id), cancel)
+        s.set(exit_code=result.returncode)
+    return DeviceResult(
+        device_id,
+        result.returncode,
+        result.stdout.decode("utf-8", "replace"),
+        result.stderr.decode("utf-8", "replace"),
+        started,
+        time.monotonic(),
+        apks_path,
+    )
+
+
+def failed_results(apks_path, device_ids, message, error=None):
+    """Report for devices that were never attempted, e.g. because their build failed."""
+    now = time.monotonic()
+    results = [DeviceResult(device_id, None, "", message, now, now, apks_path, error=error)
+               for device_id in device_ids]
+    return InstallReport(apks_path, results, 0.0, 0)
+
+
+def skipped_results(apks_path, device_ids):
+    """Report for devices that already have the build in `apks_path`."""
+    now = time.monotonic()
+    results = [DeviceResult(device_id, 0, "", "", now, now, apks_path, skipped=True) for device_id in device_ids]
+    return InstallReport(apks_path, results, 0.0, 0)
+
+
+def install_with_retry(install, bundletool_path, apks_path, device_id, java="java", progress=None, cancel=None,
+                       retry=None, breaker=None):
+    """Call `install` for one device under the timeout and retry rules of `retry` (a RetryPolicy).
+
+    Every attempt gets a Deadline instead of `cancel`, so an attempt that
+    exceeds retry.timeout is terminated and counts as a "timeout" failure.
+    Transient failures are retried after a jittered backoff; the result is
+    reported to `breaker`, which may have left the device out to begin with.
+    """
+    retry = retry or RetryPolicy()
+    breaker = breaker or get_circuit_breaker()
+    if not breaker.allow(device_id):
+        now = time.monotonic()
+        return DeviceResult(device_id, None, "", "left out after repeated failures (circuit breaker open)", now, now,
+                            apks_path, error="circuit-open")
+
+    for attempt in range(1, retry.attempts + 1):
+        deadline = Deadline(retry.timeout, cancel)
+        result = install(bundletool_path, apks_path, device_id, java, progress=progress, cancel=deadline)
+        result.attempts = attempt
+        if result.ok:
+            break
+        if cancel is not None and cancel.is_set():
+            result.error = "cancelled"
+            return result
+        if deadline.expired:
+            result.error = "timeout"
+            detail = "" if result.stderr.strip() == "cancelled" else f": {result.stderr}"
+            result.stderr = f"timed out after {retry.timeout}s{detail}"
+        else:
+            result.error = classify_failure(result.stdout + result.stderr)
+        if result.error not in TRANSIENT_FAILURES or attempt == retry.attempts:
+            break
+        delay = retry.delay(attempt)
+        if progress is not None:
+            progress(device_id, f"{result.error}, retrying in {delay:.1f}s (attempt {attempt + 1}/{retry.attempts})")
+        with span("retry-wait", device=device_id, error=result.error, attempt=attempt):
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
+    breaker.record(device_id, result.ok, result.error)
+    return result
+
+
+def install_on_devices(bundletool_path, apks_path, device_ids, max_workers=DEFAULT_MAX_WORKERS, java="java",
+                       install=install_on_device, progress=None, cancel=None, retry=None, breaker=None):
+    """Run `install-apks` for every device, at most `max_workers` at a time.
+
+    `install` replaces install_on_device for callers with their own install
+    strategy; each device goes through install_with_retry with `retry` and
+    `breaker`, so a hung device only costs its own worker. An exception
+    raised for one device becomes its failed result. Results keep the order
+    of `device_ids` regardless of completion order.
+    """
+    def run_one(device_id):
+        started = time.monotonic()
+        try:
+            result = install_with_retry(install, bundletool_path, apks_path, device_id, java, progress, cancel,
+                                        retry, breaker)
+        except Exception as e:
+            print(f"Error: Install on {device_id} raised: {e}")
+            result = DeviceResult(device_id, None, "", str(e) or type(e).__name__, started, time.monotonic(),
+                                  apks_path, error="unknown")
+        if progress is not None:
+            cancelled = cancel is not None and cancel.is_set() and not result.ok
+            progress(device_id, "Cancelled" if cancelled else "Installed" if result.ok else "Failed")
+        return result
+
+    started = time.monotonic()
+    workers = max(1, min(max_workers, len(device_ids) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_one, device_id) for device_id in device_ids]
+        results = [future.result() for future in futures]
+    return InstallReport(apks_path, results, time.monotonic() - started, workers)
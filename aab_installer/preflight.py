@@ -0,0 +1,390 @@
+"""
+Cheap checks of the AAB and the signing key before `bundletool build-apks` runs.
+
+A broken bundle or a wrong keystore password otherwise only shows up after a
+full build-apks JVM run. check_aab() maps the AAB once. That pass hashes the
+whole file and walks the zip central directory, checking each local header
+and that entry data stays inside the archive. It then reads BundleConfig.pb
+and the base manifest in place. The sha256 is handed to aab_installer.cache,
+so the cache key does not read the file a second time.
+
+check_keystore() opens the keystore in Python, without keytool:
+
+    JKS / JCEKS  store password from the keyed SHA-1 trailer, alias, and for
+                 JKS keys the key password (Sun's SHA-1 key protector)
+    PKCS12       store password from the PFX MAC, alias from the
+                 friendlyName of the key bags
+
+JCEKS and PKCS12 keys are encrypted with 3DES or AES, which the standard
+library cannot decrypt, so their key password is not checked. keytool always
+uses the store password for PKCS12 keys, and a different one only earns a
+warning.
+"""
+
+import hashlib
+import hmac
+import mmap
+import os
+import struct
+import zipfile
+
+from .archive import aab_info, open_mapped_zip, proto_fields
+from .cache import remember_digest
+from .trace import span
+
+
+HASH_CHUNK = 1024 * 1024
+BUNDLE_CONFIG = "BundleConfig.pb"
+BASE_MANIFEST = "base/manifest/AndroidManifest.xml"
+# entry problems listed before the rest are summarised
+MAX_ENTRY_PROBLEMS = 5
+
+JKS_MAGIC = 0xFEEDFEED
+JCEKS_MAGIC = 0xCECECECE
+JKS_WHITENER = b"Mighty Aphrodite"
+JKS_KEY_PROTECTOR = "1.3.6.1.4.1.42.2.17.1.1"
+PKCS7_DATA = "1.2.840.113549.1.7.1"
+PKCS7_ENCRYPTED_DATA = "1.2.840.113549.1.7.6"
+PKCS12_KEY_BAGS = {"1.2.840.113549.1.12.10.1.1", "1.2.840.113549.1.12.10.1.2"}
+FRIENDLY_NAME = "1.2.840.113549.1.9.20"
+MAC_HASHES = {
+    "1.3.14.3.2.26": "sha1",
+    "2.16.840.1.101.3.4.2.4": "sha224",
+    "2.16.840.1.101.3.4.2.1": "sha256",
+    "2.16.840.1.101.3.4.2.2": "sha384",
+    "2.16.840.1.101.3.4.2.3": "sha512",
+}
+
+
+class PreflightReport:
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        # sha256 hex of the AAB and its AabInfo, set by check_aab
+        self.digest = None
+        self.info = None
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def merge(self, other):
+        self.errors.extend(other.errors)
+        self.warnings.extend(other.warnings)
+        return self
+
+    def print_problems(self, prefix=""):
+        for warning in self.warnings:
+            print(f"{prefix}Warning: {warning}")
+        for error in self.errors:
+            print(f"{prefix}Error: {error}")
+
+
+# --- AAB -----------------------------------------------------------------------------------------------------
+
+def _entry_problems(mapped, archive):
+    """Central directory entries whose local header or data do not fit the archive."""
+    problems = []
+    seen = set()
+    data_end = getattr(archive, "start_dir", len(mapped))
+    for info in archive.infolist():
+        name = info.filename
+        if name in seen:
+            problems.append(f"duplicate entry {name}")
+        seen.add(name)
+        if name.startswith("/") or ".." in name.split("/"):
+            problems.append(f"unsafe entry path {name}")
+        offset = info.header_offset
+        if offset + 30 > data_end or mapped[offset:offset + 4] != b"PK\x03\x04":
+            problems.append(f"entry {name} has no local header at offset {offset}")
+            continue
+        name_length, extra_length = struct.unpack_from("<HH", mapped, offset + 26)
+        if offset + 30 + name_length + extra_length + info.compress_size > data_end:
+            problems.append(f"entry {name} runs past the end of the archive (truncated file?)")
+    return problems
+
+
+def _check_bundle(mapped, archive, path, report):
+    problems = _entry_problems(mapped, archive)
+    report.errors.extend(problems[:MAX_ENTRY_PROBLEMS])
+    if len(problems) > MAX_ENTRY_PROBLEMS:
+        report.errors.append(f"... and {len(problems) - MAX_ENTRY_PROBLEMS} more broken entries")
+    if problems:
+        return
+
+    names = set(archive.namelist())
+    for required in (BUNDLE_CONFIG, BASE_MANIFEST):
+        if required not in names:
+            report.errors.append(f"{path} is not an Android App Bundle: {required} is missing")
+    if not report.ok:
+        return
+
+    # archive.read checks the CRC-32 of the entries it reads
+    try:
+        list(proto_fields(archive.read(BUNDLE_CONFIG)))
+    except (zipfile.BadZipFile, IndexError, struct.error, ValueError) as e:
+        report.errors.append(f"{BUNDLE_CONFIG} is corrupt: {e}")
+    try:
+        report.info = aab_info(archive, os.path.abspath(path), len(mapped))
+    except (zipfile.BadZipFile, IndexError, struct.error, ValueError, UnicodeDecodeError) as e:
+        report.errors.append(f"{BASE_MANIFEST} is corrupt: {e}")
+        return
+    if not report.info.package:
+        report.errors.append(f"{BASE_MANIFEST} has no package name")
+    if not isinstance(report.info.version_code, int):
+        report.errors.append(f"{BASE_MANIFEST} has no versionCode")
+
+
+def check_aab(aab_path):
+    """PreflightReport for the AAB: zip structure, BundleConfig and manifest, plus its sha256 and AabInfo."""
+    report = PreflightReport()
+    with span("preflight-aab", aab=os.path.basename(aab_path)) as s:
+        try:
+            with open(aab_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                if not st.st_size:
+                    report.errors.append(f"{aab_path} is empty")
+                    return report
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest = hashlib.sha256()
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, len(view), HASH_CHUNK):
+                            digest.update(view[offset:offset + HASH_CHUNK])
+                    finally:
+                        view.release()
+                    report.digest = digest.hexdigest()
+                    try:
+                        with open_mapped_zip(mapped) as archive:
+                            _check_bundle(mapped, archive, aab_path, report)
+                    except zipfile.BadZipFile as e:
+                        report.errors.append(f"{aab_path} is not a valid zip archive: {e}")
+        except OSError as e:
+            report.errors.append(f"cannot read {aab_path}: {e}")
+            return report
+        remember_digest(aab_path, st, report.digest)
+        s.set(aab_bytes=st.st_size, ok=report.ok)
+    return report
+
+
+# --- keystores -----------------------------------------------------------------------------------------------
+
+def _der_items(data):
+    """[(tag, value)] of the DER elements in `data`."""
+    items, pos = [], 0
+    while pos < len(data):
+        if pos + 2 > len(data):
+            raise ValueError("truncated DER element")
+        tag, length = data[pos], data[pos + 1]
+        pos += 2
+        if length & 0x80:
+            count = length & 0x7F
+            if not count or count > 4:
+                raise ValueError("indefinite or oversized DER length")
+            length = int.from_bytes(data[pos:pos + count], "big")
+            pos += count
+        if pos + length > len(data):
+            raise ValueError("truncated DER element")
+        items.append((tag, data[pos:pos + length]))
+        pos += length
+    return items
+
+
+def _oid(value):
+    numbers, current = [], 0
+    for byte in value:
+        current = (current << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            numbers.append(current)
+            current = 0
+    first = min(numbers[0] // 40, 2)
+    return ".".join(str(number) for number in [first, numbers[0] - 40 * first, *numbers[1:]])
+
+
+def _jks_key_password_ok(protected, keypass):
+    """Whether `keypass` unlocks a key protected by Sun's JKS KeyProtector (salt | xor-ed key | SHA-1 check)."""
+    password = keypass.encode("utf-16-be")
+    salt, encrypted, check = protected[:20], protected[20:-20], protected[-20:]
+    stream, block = bytearray(), salt
+    while len(stream) < len(encrypted):
+        block = hashlib.sha1(password + block).digest()
+        stream.extend(block)
+    key = bytes(a ^ b for a, b in zip(encrypted, stream))
+    return hmac.compare_digest(hashlib.sha1(password + key).digest(), check)
+
+
+def _read_jks_entries(data, version):
+    """({alias: protected key bytes or None for certificates}, complete) of a JKS/JCEKS body."""
+    entries = {}
+    count = struct.unpack_from(">I", data, 8)[0]
+    pos = 12
+
+    def utf(pos):
+        length = struct.unpack_from(">H", data, pos)[0]
+        return data[pos + 2:pos + 2 + length].decode("utf-8", "replace"), pos + 2 + length
+
+    def blob(pos):
+        length = struct.unpack_from(">I", data, pos)[0]
+        return data[pos + 4:pos + 4 + length], pos + 4 + length
+
+    for _ in range(count):
+        tag = struct.unpack_from(">I", data, pos)[0]
+        alias, pos = utf(pos + 4)
+        pos += 8  # creation date
+        if tag == 1:
+            protected, pos = blob(pos)
+            chain = struct.unpack_from(">I", data, pos)[0]
+            pos += 4
+            for _ in range(chain):
+                if version == 2:
+                    _, pos = utf(pos)
+                _, pos = blob(pos)
+            entries[alias] = protected
+        elif tag == 2:
+            if version == 2:
+                _, pos = utf(pos)
+            _, pos = blob(pos)
+            entries[alias] = None
+        else:
+            # JCEKS secret keys are serialized Java objects; the entries after one cannot be located
+            return entries, False
+    return entries, True
+
+
+def _check_jks(data, alias, storepass, keypass, report):
+    magic, version = struct.unpack_from(">II", data)
+    expected = hashlib.sha1(storepass.encode("utf-16-be") + JKS_WHITENER + data[:-20]).digest()
+    if not hmac.compare_digest(expected, data[-20:]):
+        report.errors.append("wrong keystore password (or the keystore is corrupt)")
+        return
+    entries, complete = _read_jks_entries(data, version)
+    # JKS stores aliases in lower case and looks them up case-insensitively
+    protected = entries.get(alias.lower(), entries.get(alias, False))
+    if protected is False:
+        if complete:
+            report.errors.append(f"alias {alias!r} not found in the keystore (has {', '.join(sorted(entries))})")
+        else:
+            report.warnings.append(f"alias {alias!r} not found among the keystore's readable entries")
+        return
+    if protected is None:
+        report.errors.append(f"alias {alias!r} is a trusted certificate, not a signing key")
+        return
+    # EncryptedPrivateKeyInfo: SEQUENCE { AlgorithmIdentifier, OCTET STRING }
+    algorithm, encrypted = _der_items(_der_items(protected)[0][1])[:2]
+    algorithm_oid = _oid(_der_items(algorithm[1])[0][1])
+    if algorithm_oid != JKS_KEY_PROTECTOR:
+        report.warnings.append(f"key password of {alias!r} not checked (key encrypted with {algorithm_oid})")
+    elif not _jks_key_password_ok(encrypted[1], keypass):
+        report.errors.append(f"wrong key password for alias {alias!r}")
+
+
+def _pkcs12_kdf(hash_name, password, salt, iterations, purpose, size):
+    """RFC 7292 appendix B key derivation; `password` is the BMPString with its two-byte terminator."""
+    block_size = hashlib.new(hash_name).block_size
+
+    def stretch(value):
+        length = block_size * -(-len(value) // block_size)
+        return (value * (length // len(value) + 1))[:length] if value else b""
+
+    diversifier = bytes([purpose]) * block_size
+    material = bytearray(stretch(salt) + stretch(password))
+    output = b""
+    while len(output) < size:
+        block = diversifier + bytes(material)
+        for _ in range(iterations):
+            block = hashlib.new(hash_name, block).digest()
+        output += block
+        increment = int.from_bytes(stretch(block), "big") + 1
+        for start in range(0, len(material), block_size):
+            value = (int.from_bytes(material[start:start + block_size], "big") + increment) % (1 << 8 * block_size)
+            material[start:start + block_size] = value.to_bytes(block_size, "big")
+    return output[:size]
+
+
+def _pkcs12_key_aliases(auth_safe):
+    """(friendly names of the key bags, whether some content was encrypted and could not be read)."""
+    aliases, hidden = [], False
+    for _, content_info in _der_items(_der_items(auth_safe)[0][1]):
+        items = _der_items(content_info)
+        content_type = _oid(items[0][1])
+        if content_type == PKCS7_ENCRYPTED_DATA:
+            hidden = True
+            continue
+        if content_type != PKCS7_DATA:
+            continue
+        safe_contents = _der_items(_der_items(items[1][1])[0][1])[0][1]
+        for _, bag in _der_items(safe_contents):
+            bag_items = _der_items(bag)
+            if _oid(bag_items[0][1]) not in PKCS12_KEY_BAGS or len(bag_items) < 3:
+                continue
+            for _, attribute in _der_items(bag_items[2][1]):
+                attribute_oid, values = _der_items(attribute)
+                if _oid(attribute_oid[1]) == FRIENDLY_NAME:
+                    aliases.append(_der_items(values[1])[0][1].decode("utf-16-be", "replace"))
+    return aliases, hidden
+
+
+def _check_pkcs12(data, alias, storepass, keypass, report):
+    pfx = _der_items(_der_items(data)[0][1])
+    content_info = _der_items(pfx[1][1])
+    if _oid(content_info[0][1]) != PKCS7_DATA:
+        report.warnings.append("public-key protected PKCS12 keystore, password not checked")
+        return
+    auth_safe = _der_items(content_info[1][1])[0][1]
+    if len(pfx) > 2:
+        mac_data = _der_items(pfx[2][1])
+        digest_info = _der_items(mac_data[0][1])
+        hash_oid = _oid(_der_items(digest_info[0][1])[0][1])
+        hash_name = MAC_HASHES.get(hash_oid)
+        if hash_name is None:
+            report.warnings.append(f"keystore password not checked (MAC algorithm {hash_oid})")
+        else:
+            iterations = int.from_bytes(mac_data[2][1], "big") if len(mac_data) > 2 else 1
+            password = storepass.encode("utf-16-be") + b"\0\0"
+            key = _pkcs12_kdf(hash_name, password, mac_data[1][1], iterations, 3, hashlib.new(hash_name).digest_size)
+            if not hmac.compare_digest(hmac.new(key, auth_safe, hash_name).digest(), digest_info[1][1]):
+                report.errors.append("wrong keystore password (or the keystore is corrupt)")
+                return
+
+    aliases, hidden = _pkcs12_key_aliases(auth_safe)
+    if alias.lower() not in {name.lower() for name in aliases}:
+        if hidden and not aliases:
+            report.warnings.append(f"alias {alias!r} not checked (the keystore's entries are encrypted)")
+        else:
+            report.errors.append(f"alias {alias!r} not found in the keystore (has {', '.join(sorted(aliases))})")
+        return
+    if keypass != storepass:
+        report.warnings.append("PKCS12 keys normally use the keystore password; the key password was not checked")
+
+
+def check_keystore(keystore_path, alias, storepass, keypass):
+    """PreflightReport for opening `alias` of the keystore with the given passwords."""
+    report = PreflightReport()
+    with span("preflight-keystore", alias=alias) as s:
+        try:
+            with open(keystore_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except OSError as e:
+            report.errors.append(f"cannot read keystore {keystore_path}: {e}")
+            return report
+        # the keystore is part of the APKS cache key too
+        remember_digest(keystore_path, st, hashlib.sha256(data).hexdigest())
+        try:
+            if len(data) >= 32 and struct.unpack_from(">I", data)[0] in (JKS_MAGIC, JCEKS_MAGIC):
+                s.set(format="jks")
+                _check_jks(data, alias, storepass, keypass, report)
+            elif data[:1] == b"\x30":
+                s.set(format="pkcs12")
+                _check_pkcs12(data, alias, storepass, keypass, report)
+            else:
+                report.errors.append(f"{keystore_path} is not a JKS, JCEKS or PKCS12 keystore")
+        except (IndexError, struct.error, ValueError) as e:
+            report.errors.append(f"keystore {keystore_path} is corrupt or in an unsupported layout: {e}")
+        s.set(ok=report.ok)
+    return report
+
+
+def preflight(aab_path, keystore_path, alias, storepass, keypass):
+    """check_aab and check_keystore in one report."""
+    return check_aab(aab_path).merge(check_keystore(keystore_path, alias, storepass, keypass))
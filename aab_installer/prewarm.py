@@ -0,0 +1,177 @@
+"""
+Get devices ready for the install while bundletool is still building.
+
+prewarm_devices() runs one `adb shell` per device, all devices at once, that
+wakes the screen and dismisses an insecure keyguard, and reads the free
+space of /data, the signing certificate hashes of the installed package,
+the power state and the split-matching device properties (the same fields as
+aab_installer.direct_install).
+
+Once the .apks exists, settle_devices() holds back the devices that do not
+have room for the splits they will get and uninstalls the package where it
+was signed with another certificate, so the install phase only sees ready
+devices instead of failing on them with INSUFFICIENT_STORAGE or
+UPDATE_INCOMPATIBLE. dumpsys prints each certificate as Java's
+Arrays.hashCode of its DER encoding, which is compared with the certificate
+in the APK signing block of the build (aab_installer.archive). A device
+whose free space or signatures could not be read is not held back.
+"""
+
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .adb_monitor import adb_command
+from .archive import read_apks, read_signing_certificates
+from .direct_install import SPEC_SCRIPT, parse_sections, select_apks, spec_from_sections
+from .parallel import DEFAULT_MAX_WORKERS, InstallReport, failed_results
+from .trace import span
+
+
+# an install needs room for the APKs plus their dexopt output
+STORAGE_FACTOR = 2
+PREWARM_TIMEOUT = 30
+UNINSTALL_TIMEOUT = 60
+_PREWARM_SCRIPT = (
+    "input keyevent KEYCODE_WAKEUP 2>/dev/null; wm dismiss-keyguard 2>/dev/null; "
+    "echo @free; df /data | tail -n 1; "
+    "echo @signatures; dumpsys package {package} | grep -m1 'signatures='; "
+    "echo @power; dumpsys power | grep -m1 mWakefulness=; " + SPEC_SCRIPT
+)
+
+
+class DeviceReadiness:
+    def __init__(self, device_id, free_bytes=None, signatures=None, awake=None, spec=None):
+        self.device_id = device_id
+        # bytes available on /data, None when df could not be read
+        self.free_bytes = free_bytes
+        # hex certificate hashes of the installed package; [] when it is not installed, None when unknown
+        self.signatures = signatures
+        self.awake = awake
+        self.spec = spec
+
+    def __repr__(self):
+        return (f"<DeviceReadiness {self.device_id} free={self.free_bytes} signatures={self.signatures} "
+                f"awake={self.awake}>")
+
+
+def java_hash(data):
+    """Java's Arrays.hashCode(byte[]) as dumpsys prints it (Integer.toHexString)."""
+    value = 1
+    for byte in data:
+        value = (31 * value + (byte - 256 if byte > 127 else byte)) & 0xFFFFFFFF
+    return f"{value:x}"
+
+
+def parse_readiness(device_id, text):
+    sections = parse_sections(text)
+    free_bytes = None
+    fields = (sections.get("free") or [""])[-1].split()
+    # toybox df: Filesystem 1K-blocks Used Available Use% Mounted-on
+    if len(fields) >= 4 and fields[3].isdigit():
+        free_bytes = int(fields[3]) * 1024
+    signatures = None
+    if "signatures" in sections:
+        line = " ".join(sections["signatures"])
+        # Android 9+: "signatures:[1a2b3c4d, ...]"; older: "PackageSignatures{... [1a2b3c4d]}"
+        match = re.search(r"signatures:\[([^\]]*)\]", line) or re.search(r"\[([0-9a-f, ]*)\]", line)
+        signatures = [value.strip() for value in match.group(1).split(",") if value.strip()] if match else []
+    power = " ".join(sections.get("power", []))
+    awake = "mWakefulness=Awake" in power if power else None
+    return DeviceReadiness(device_id, free_bytes, signatures, awake, spec_from_sections(sections))
+
+
+def prewarm_device(device_id, package, adb="adb"):
+    """Wake `device_id` and read its DeviceReadiness; fields that could not be read are None."""
+    with span("prewarm", device=device_id) as s:
+        try:
+            result = subprocess.run(adb_command(adb, device_id, "shell", _PREWARM_SCRIPT.format(package=package)),
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=PREWARM_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            return DeviceReadiness(device_id)
+        readiness = parse_readiness(device_id, result.stdout.decode("utf-8", "replace"))
+        s.set(free_bytes=readiness.free_bytes, awake=readiness.awake)
+    return readiness
+
+
+def prewarm_devices(device_ids, package, adb="adb", max_workers=DEFAULT_MAX_WORKERS):
+    """{device_id: DeviceReadiness} for all devices, checked in parallel."""
+    if not device_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(device_ids)))) as executor:
+        return dict(zip(device_ids, executor.map(lambda device_id: prewarm_device(device_id, package, adb),
+                                                 device_ids)))
+
+
+def required_bytes(info, spec):
+    """Space an install of the .apks described by `info` needs on a device with `spec`."""
+    apks = select_apks(info, spec) if spec else None
+    return STORAGE_FACTOR * (sum(apk.size for apk in apks) if apks else info.total_size)
+
+
+def uninstall(device_id, package, adb="adb"):
+    """`adb uninstall`; returns (ok, output)."""
+    with span("uninstall", device=device_id) as s:
+        try:
+            result = subprocess.run(adb_command(adb, device_id, "uninstall", package), stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, timeout=UNINSTALL_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return False, str(e)
+        s.set(exit_code=result.returncode)
+    output = result.stdout.decode("utf-8", "replace").strip()
+    return result.returncode == 0 and "Success" in output, output
+
+
+def settle_devices(apks_path, device_ids, readiness, package, adb="adb", max_workers=DEFAULT_MAX_WORKERS,
+                   uninstall_conflicts=True, progress=None):
+    """Split `device_ids` into the ones ready for `apks_path` and an InstallReport of the others.
+
+    `readiness` comes from prewarm_devices(). Devices without room fail
+    with error "insufficient-storage"; where the installed package has other
+    signatures it is uninstalled first (with `uninstall_conflicts`, else the
+    device fails with "signature-mismatch").
+    """
+    try:
+        info = read_apks(apks_path)
+        certificates = {java_hash(certificate) for certificate in read_signing_certificates(apks_path)}
+    except ValueError as e:
+        print(f"Warning: could not read {apks_path} for the device checks: {e}")
+        return device_ids, InstallReport(apks_path, [], 0.0, 0)
+
+    ready, short, conflicts = [], {}, []
+    for device_id in device_ids:
+        state = readiness.get(device_id)
+        if state is None:
+            ready.append(device_id)
+            continue
+        if state.awake is False:
+            print(f"Warning: {device_id} did not wake up, installing anyway")
+        needed = required_bytes(info, state.spec)
+        if state.free_bytes is not None and state.free_bytes < needed:
+            short[device_id] = (f"{device_id} has {state.free_bytes / 2 ** 20:.1f} MB free, "
+                                f"the install needs about {needed / 2 ** 20:.1f} MB")
+        elif certificates and state.signatures and not certificates & set(state.signatures):
+            conflicts.append(device_id)
+        else:
+            ready.append(device_id)
+
+    reports = [failed_results(apks_path, [device_id], message, error="insufficient-storage")
+               for device_id, message in short.items()]
+    if conflicts and not uninstall_conflicts:
+        reports.append(failed_results(apks_path, conflicts, f"{package} is installed with another signing key",
+                                      error="signature-mismatch"))
+    elif conflicts:
+        if progress is not None:
+            for device_id in conflicts:
+                progress(device_id, f"Uninstalling {package} (other signing key)")
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(conflicts)))) as executor:
+            results = list(executor.map(lambda device_id: uninstall(device_id, package, adb), conflicts))
+        for device_id, (ok, output) in zip(conflicts, results):
+            if ok:
+                print(f"Uninstalled {package} from {device_id}: it was signed with another key")
+                ready.append(device_id)
+            else:
+                reports.append(failed_results(apks_path, [device_id], f"uninstall failed: {output}",
+                                              error="signature-mismatch"))
+    return ([device_id for device_id in device_ids if device_id in ready],
+            InstallReport(apks_path, [result for report in reports for result in report.results], 0.0, 0))
@@ -0,0 +1,119 @@
+"""
+Check what build of a package a device already has.
+
+One `adb shell` round trip per device prints the installed versionCode and
+the sha256 of every installed APK (`pm path` lists the base and each split).
+A device already has the build in an .apks when the versionCode matches and
+every installed APK is byte-identical to an APK of that archive: the split
+set is then a subset of the build, and since the digest covers the APK
+signing block, the signing certificate is the same too.
+"""
+
+import hashlib
+import re
+import subprocess
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .adb_monitor import adb_command
+from .archive import read_aab
+from .bundletool import get_runner
+from .parallel import DEFAULT_MAX_WORKERS
+from .trace import span
+
+
+_PROBE_SCRIPT = (
+    "echo @version; dumpsys package {package} | grep -m1 versionCode; "
+    "echo @paths; for p in $(pm path {package}); do sha256sum \"${{p#package:}}\"; done"
+)
+
+_apks_memo = {}
+_apks_lock = threading.Lock()
+
+
+def read_bundle_identity(bundletool_path, aab_path, java="java"):
+    """(package_name, version_code) from the AAB manifest.
+
+    The manifest is read in-process (aab_installer.archive); `bundletool dump
+    manifest` is only started when that cannot decode it.
+    """
+    with span("identity") as s:
+        try:
+            info = read_aab(aab_path)
+            if info.package and isinstance(info.version_code, int):
+                s.set(source="archive")
+                return info.package, info.version_code
+        except ValueError:
+            pass
+        s.set(source="bundletool")
+        runner = get_runner(bundletool_path, java)
+        values = []
+        for xpath in ("/manifest/@package", "/manifest/@android:versionCode"):
+            result = runner.run(["dump", "manifest", f"--bundle={aab_path}", f"--xpath={xpath}"])
+            if result.returncode:
+                raise RuntimeError(f"Failed to read {xpath} from {aab_path}: {result.stderr.decode('utf-8')}")
+            values.append(result.stdout.decode("utf-8").strip())
+    return values[0], int(values[1])
+
+
+def apks_digests(apks_path, chunk_size=1024 * 1024):
+    """sha256 of every APK inside an .apks archive, remembered per archive for this process."""
+    with zipfile.ZipFile(apks_path) as apks:
+        infos = [info for info in apks.infolist() if info.filename.endswith(".apk")]
+        memo_key = (apks_path, tuple((info.filename, info.CRC, info.file_size) for info in infos))
+        with _apks_lock:
+            if memo_key in _apks_memo:
+                return _apks_memo[memo_key]
+
+        digests = set()
+        for info in infos:
+            digest = hashlib.sha256()
+            with apks.open(info) as entry:
+                for chunk in iter(lambda: entry.read(chunk_size), b""):
+                    digest.update(chunk)
+            digests.add(digest.hexdigest())
+
+    with _apks_lock:
+        _apks_memo[memo_key] = digests
+    return digests
+
+
+def probe_installed(device_id, package, adb="adb", timeout=30):
+    """{"version_code": int or None, "apks": {sha256, ...}} for `package` on the device."""
+    result = subprocess.run(
+        adb_command(adb, device_id, "shell", _PROBE_SCRIPT.format(package=package)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=timeout,
+    )
+    output = result.stdout.decode("utf-8", "replace")
+    version_part, _, paths_part = output.partition("@paths")
+    version = re.search(r"versionCode=(\d+)", version_part)
+    return {
+        "version_code": int(version.group(1)) if version else None,
+        "apks": set(re.findall(r"^([0-9a-f]{64})\s", paths_part, re.MULTILINE)),
+    }
+
+
+def try_probe(device_id, package, adb="adb"):
+    """probe_installed(), or None when the device could not be queried."""
+    try:
+        return probe_installed(device_id, package, adb)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def probe_devices(device_ids, package, adb="adb", max_workers=DEFAULT_MAX_WORKERS):
+    """{device_id: probe result or None}, probing up to `max_workers` devices at once."""
+    if not device_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(device_ids)))) as pool:
+        found = pool.map(lambda device_id: try_probe(device_id, package, adb), device_ids)
+        return dict(zip(device_ids, found))
+
+
+def matches_build(installed, version_code, apks_path):
+    """True when a probe result shows the build of `apks_path` already installed."""
+    return (installed is not None and installed["version_code"] == version_code
+            and bool(installed["apks"]) and installed["apks"] <= apks_digests(apks_path))
@@ -0,0 +1,110 @@
+"""
+Run external tools without buffering all of their output.
+
+run_streaming() reads stdout and stderr line by line on background threads,
+passes every line to an optional callback and keeps only the last
+`tail_lines` lines of each stream (a collections.deque ring buffer) for the
+returned CompletedProcess. Setting the optional `cancel` threading.Event
+terminates the process together with its children, so a GUI thread can stop
+a long install without waiting for it.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+DEFAULT_TAIL_LINES = 200
+CANCEL_POLL_INTERVAL = 0.1
+TERMINATE_GRACE = 5
+CANCELLED_RETURNCODE = -signal.SIGTERM
+
+
+def popen(args, **kwargs):
+    """subprocess.Popen in its own process group, so terminate() also reaches its children."""
+    if os.name == "posix":
+        kwargs.setdefault("start_new_session", True)
+    return subprocess.Popen(args, **kwargs)
+
+
+def terminate(process):
+    """Stop a process started with popen(), killing it if it ignores SIGTERM."""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        process.wait(timeout=TERMINATE_GRACE)
+    except subprocess.TimeoutExpired:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+@contextmanager
+def terminate_on_cancel(process, cancel):
+    """Terminate `process` if `cancel` gets set while the block runs."""
+    if cancel is None:
+        yield
+        return
+    finished = threading.Event()
+
+    def watch():
+        while not finished.wait(CANCEL_POLL_INTERVAL):
+            if cancel.is_set():
+                terminate(process)
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        yield
+    finally:
+        finished.set()
+
+
+def run_streaming(args, on_line=None, cancel=None, cwd=None, env=None, timeout=None,
+                  tail_lines=DEFAULT_TAIL_LINES):
+    """Run `args` and return a CompletedProcess holding the tail of stdout/stderr as bytes.
+
+    `on_line(stream, line)` is called from reader threads with stream
+    "stdout" or "stderr" and the decoded line. A cancelled process returns
+    CANCELLED_RETURNCODE; an expired `timeout` raises subprocess.TimeoutExpired
+    after the process was terminated.
+    """
+    process = popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    cwd=cwd, env=env)
+    tails = {"stdout": deque(maxlen=tail_lines), "stderr": deque(maxlen=tail_lines)}
+
+    def pump(stream, name):
+        with stream:
+            for line in iter(stream.readline, b""):
+                tails[name].append(line)
+                if on_line is not None:
+                    on_line(name, line.decode("utf-8", "replace").rstrip("\r\n"))
+
+    readers = [threading.Thread(target=pump, args=(process.stdout, "stdout"), daemon=True),
+               threading.Thread(target=pump, args=(process.stderr, "stderr"), daemon=True)]
+    for reader in readers:
+        reader.start()
+
+    with terminate_on_cancel(process, cancel):
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            terminate(process)
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+
+    returncode = CANCELLED_RETURNCODE if cancel is not None and cancel.is_set() else process.returncode
+    return subprocess.CompletedProcess(args, returncode, b"".join(tails["stdout"]), b"".join(tails["stderr"]))
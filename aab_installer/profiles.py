@@ -0,0 +1,55 @@
+"""
+Named build profiles: the `build-apks` flags and JVM options of a build.
+
+    fast-dev      --local-testing and one build per distinct device spec of
+                  the connected devices (what --connected-device does, but
+                  shared by identical devices); C1-only JIT, which suits
+                  short builds
+    default       bundletool's defaults
+    universal     --mode=universal, one APK that installs anywhere
+    full-release  bundletool's defaults with a 4 GB heap and the parallel GC
+
+Profile flags are part of the APKS cache key; JVM options are not, since
+they do not change what gets built. with_cpus() caps how many cores the
+bundletool JVM sees (-XX:ActiveProcessorCount), which bounds its thread
+pools.
+"""
+
+
+class BuildProfile:
+    def __init__(self, name, build_args=(), jvm_options=(), per_device_spec=False, description=""):
+        self.name = name
+        self.build_args = list(build_args)
+        self.jvm_options = list(jvm_options)
+        # build only what the connected devices need, one .apks per distinct device spec
+        self.per_device_spec = per_device_spec
+        self.description = description
+
+    def with_cpus(self, cpus):
+        """Copy of this profile whose bundletool JVM sees at most `cpus` processors."""
+        options = [option for option in self.jvm_options if not option.startswith("-XX:ActiveProcessorCount=")]
+        return BuildProfile(self.name, self.build_args, [*options, f"-XX:ActiveProcessorCount={cpus}"],
+                            self.per_device_spec, self.description)
+
+    def __repr__(self):
+        return f"<BuildProfile {self.name} args={self.build_args} jvm={self.jvm_options}>"
+
+
+BUILD_PROFILES = {
+    profile.name: profile for profile in (
+        BuildProfile("fast-dev", ["--local-testing"], ["-XX:TieredStopAtLevel=1"], per_device_spec=True,
+                     description="connected devices only, local testing"),
+        BuildProfile("default", description="bundletool defaults"),
+        BuildProfile("universal", ["--mode=universal"], description="single universal APK"),
+        BuildProfile("full-release", [], ["-Xmx4g", "-XX:+UseParallelGC"], description="all splits, large heap"),
+    )
+}
+DEFAULT_PROFILE = "default"
+
+
+def get_profile(name):
+    """The BuildProfile called `name`; raises ValueError for unknown names."""
+    try:
+        return BUILD_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"unknown build profile {name!r}, choose from {', '.join(BUILD_PROFILES)}")
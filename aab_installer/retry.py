@@ -0,0 +1,135 @@
+"""
+Timeouts, failure classes, retry backoff and a circuit breaker for device installs.
+
+Each install attempt runs under a Deadline, a stand-in for the cancel event
+that also fires after the attempt's timeout, so a hung `install-apks` or adb
+is terminated the same way a user cancel is and never holds up the other
+devices. Failures are classified from the tool output; transient classes are
+retried with jittered exponential backoff (see
+aab_installer.parallel.install_with_retry). The CircuitBreaker counts
+consecutive device-side failures per serial and leaves a device out for a
+cool-down once it reaches the threshold.
+"""
+
+import random
+import re
+import threading
+import time
+
+
+DEFAULT_ATTEMPTS = 3
+DEFAULT_ATTEMPT_TIMEOUT = 600
+DEFAULT_BACKOFF = 2.0
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_BREAKER_THRESHOLD = 3
+DEFAULT_BREAKER_COOLDOWN = 300
+
+# First match wins; the patterns cover bundletool's exceptions and adb/pm output.
+FAILURE_PATTERNS = [
+    ("device-offline", re.compile(r"device offline|device '[^']*' not found|device not found|no devices/emulators"
+                                  r"|DeviceNotFound|still connecting", re.IGNORECASE)),
+    ("unauthorized", re.compile(r"unauthorized", re.IGNORECASE)),
+    ("connection-lost", re.compile(r"error: closed|connection reset|protocol fault|broken pipe"
+                                   r"|AdbCommandRejectedException|ShellCommandUnresponsiveException"
+                                   r"|TimeoutException", re.IGNORECASE)),
+    ("insufficient-storage", re.compile(r"INSTALL_FAILED_INSUFFICIENT_STORAGE|not enough space")),
+    ("signature-mismatch", re.compile(r"INSTALL_FAILED_UPDATE_INCOMPATIBLE|INCONSISTENT_CERTIFICATES")),
+    ("version-downgrade", re.compile(r"INSTALL_FAILED_VERSION_DOWNGRADE")),
+    ("incompatible-device", re.compile(r"INSTALL_FAILED_NO_MATCHING_ABIS|INSTALL_FAILED_OLDER_SDK"
+                                       r"|IncompatibleDeviceException")),
+    ("install-failed", re.compile(r"INSTALL_(?:PARSE_)?FAILED_\w+|Failure \[")),
+]
+# Worth another attempt on the same device
+TRANSIENT_FAILURES = {"timeout", "device-offline", "connection-lost"}
+# Say something about the device rather than the build, so they count towards the circuit breaker
+DEVICE_FAILURES = TRANSIENT_FAILURES | {"unauthorized", "insufficient-storage"}
+
+
+def classify_failure(output):
+    """Failure class of a failed install from its stdout/stderr text ("unknown" when nothing matches)."""
+    for code, pattern in FAILURE_PATTERNS:
+        if pattern.search(output):
+            return code
+    return "unknown"
+
+
+class Deadline:
+    """Cancel-like object that is set once `cancel` is set or `timeout` seconds have passed."""
+
+    def __init__(self, timeout, cancel=None):
+        self.timeout = timeout
+        self.cancel = cancel
+        self._expires = time.monotonic() + timeout if timeout else None
+
+    @property
+    def expired(self):
+        return self._expires is not None and time.monotonic() >= self._expires
+
+    def is_set(self):
+        return (self.cancel is not None and self.cancel.is_set()) or self.expired
+
+
+class RetryPolicy:
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, timeout=DEFAULT_ATTEMPT_TIMEOUT, backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF):
+        self.attempts = max(1, attempts)
+        # seconds per install attempt; None or 0 waits forever
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt):
+        """Seconds to wait after failed attempt number `attempt` (1-based): exponential, with jitter."""
+        return random.uniform(0.5, 1.0) * min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+
+
+class CircuitBreaker:
+    """Keeps devices that keep failing out of installs for a while.
+
+    After `threshold` consecutive device-side failures a device is open:
+    allow() refuses it until `cooldown` seconds have passed, then lets one
+    install through; success closes the circuit, another failure reopens it.
+    """
+
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, cooldown=DEFAULT_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._opened = {}
+        self._lock = threading.Lock()
+
+    def allow(self, device_id):
+        with self._lock:
+            opened = self._opened.get(device_id)
+            return opened is None or time.monotonic() - opened >= self.cooldown
+
+    def record(self, device_id, ok, error=None):
+        with self._lock:
+            if ok:
+                self._failures.pop(device_id, None)
+                self._opened.pop(device_id, None)
+            elif error in DEVICE_FAILURES:
+                failures = self._failures[device_id] = self._failures.get(device_id, 0) + 1
+                if failures >= self.threshold:
+                    self._opened[device_id] = time.monotonic()
+
+    def open_devices(self):
+        with self._lock:
+            return sorted(self._opened)
+
+    def reset(self, device_id=None):
+        with self._lock:
+            if device_id is None:
+                self._failures.clear()
+                self._opened.clear()
+            else:
+                self._failures.pop(device_id, None)
+                self._opened.pop(device_id, None)
+
+
+_breaker = CircuitBreaker()
+
+
+def get_circuit_breaker():
+    """The process-wide breaker, so a long-running daemon or GUI remembers flaky devices across runs."""
+    return _breaker
@@ -0,0 +1,91 @@
+"""
+A small dependency graph of tasks on a thread pool.
+
+Each task starts as soon as the tasks it depends on have finished and is
+called with their results, in dependency order. A failed dependency fails
+its dependents with the same exception without running them, and
+cancelling a task that has not started yet cancels its dependents.
+shutdown() cancels every task that has not started.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class TaskGraph:
+    def __init__(self, max_workers=4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="taskgraph")
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def add(self, name, fn, deps=(), args=()):
+        """Schedule `fn(*args, *dep_results)` once every task in `deps` is done."""
+        with self._lock:
+            if name in self._futures:
+                raise ValueError(f"task {name!r} already exists")
+            dep_futures = [self._futures[dep] for dep in deps]
+            future = self._futures[name] = Future()
+
+        remaining = [len(dep_futures)]
+
+        def start():
+            if future.cancelled():
+                return
+            for dep in dep_futures:
+                if dep.cancelled():
+                    future.cancel()
+                    return
+                if dep.exception() is not None:
+                    future.set_exception(dep.exception())
+                    return
+            dep_results = [dep.result() for dep in dep_futures]
+            try:
+                self._pool.submit(self._run, future, fn, (*args, *dep_results))
+            except RuntimeError:
+                # The graph was shut down before this task became ready.
+                future.cancel()
+
+        def dep_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                start()
+
+        if not dep_futures:
+            start()
+        for dep in dep_futures:
+            dep.add_done_callback(dep_done)
+        return future
+
+    def add_value(self, name, value):
+        """Add an already known result, e.g. a keystore picked by the user."""
+        return self.add(name, lambda: value)
+
+    @staticmethod
+    def _run(future, fn, args):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def future(self, name):
+        return self._futures[name]
+
+    def result(self, name, timeout=None):
+        return self._futures[name].result(timeout)
+
+    def names(self):
+        return list(self._futures)
+
+    def shutdown(self, wait=True):
+        """Cancel the tasks that have not started (and so their dependents) and stop the pool."""
+        with self._lock:
+            futures = list(self._futures.values())
+        for future in futures:
+            future.cancel()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
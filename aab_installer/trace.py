@@ -0,0 +1,134 @@
+"""
+Timing spans for the phases of an install run.
+
+Code wraps a phase in `with span("build-apks", aab=...) as s:` and adds
+results with `s.set(exit_code=..., apks_bytes=...)`. Finished spans are kept
+in memory (the last MAX_SPANS), appended as JSON lines to the file named by
+AAB_INSTALLER_TRACE (or `configure(jsonl_path=...)`), and can be written as
+a Chrome trace (chrome://tracing, Perfetto) or summarised as a table.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+
+MAX_SPANS = 10000
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = None
+        self.thread = threading.current_thread().name
+        self.thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    @property
+    def end(self):
+        return self.start + (self.duration or 0.0)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "start": round(self.start, 6),
+            "end": round(self.end, 6),
+            "duration": round(self.duration or 0.0, 6),
+            "thread": self.thread,
+            "attrs": self.attrs,
+        }
+
+
+class Tracer:
+    def __init__(self, jsonl_path=None, max_spans=MAX_SPANS):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.jsonl_path = jsonl_path
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        current = Span(name, attrs)
+        try:
+            yield current
+        except BaseException as e:
+            current.set(error=type(e).__name__)
+            raise
+        finally:
+            current.finish()
+            self._record(current)
+
+    def _record(self, span):
+        with self._lock:
+            self._spans.append(span)
+            if self.jsonl_path:
+                line = dict(span.to_dict(), run=self.run_id, pid=os.getpid())
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(line, default=str) + "\n")
+
+    def spans(self, since=None):
+        """Finished spans in start order, optionally only those started at or after `since` (time.time())."""
+        with self._lock:
+            spans = list(self._spans)
+        return sorted((span for span in spans if since is None or span.start >= since), key=lambda s: s.start)
+
+    def write_chrome_trace(self, path, since=None):
+        """Write the spans in the Chrome trace event format."""
+        pid = os.getpid()
+        spans = self.spans(since)
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+                  for tid, thread in {span.thread_id: span.thread for span in spans}.items()]
+        events.extend({
+            "name": span.name,
+            "cat": "aab_installer",
+            "ph": "X",
+            "ts": int(span.start * 1e6),
+            "dur": int((span.duration or 0.0) * 1e6),
+            "pid": pid,
+            "tid": span.thread_id,
+            "args": span.attrs,
+        } for span in spans)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def summary(self, since=None):
+        """Rows of (phase, device, seconds, exit code, .apks bytes) for the table views."""
+        return [(span.name, span.attrs.get("device", ""), span.duration or 0.0, span.attrs.get("exit_code", ""),
+                 span.attrs.get("apks_bytes", "")) for span in self.spans(since)]
+
+    def format_summary(self, since=None):
+        rows = [("phase", "device", "seconds", "exit", "apks bytes")]
+        rows.extend((name, device, f"{seconds:.2f}", str(code), str(size))
+                    for name, device, seconds, code, size in self.summary(since))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+                         for row in rows)
+
+
+_tracer = Tracer(os.environ.get("AAB_INSTALLER_TRACE"))
+
+
+def get_tracer():
+    return _tracer
+
+
+def configure(jsonl_path=None):
+    """Start appending spans to `jsonl_path` (None stops)."""
+    _tracer.jsonl_path = jsonl_path
+
+
+def span(name, **attrs):
+    """Shortcut for get_tracer().span(...)."""
+    return _tracer.span(name, **attrs)
@@ -0,0 +1,142 @@
+"""
+Where build artifacts and short-lived files go, and how artifacts are reused without copying.
+
+    AAB_INSTALLER_CACHE            .apks cache and extracted splits (aab_installer.cache)
+    AAB_INSTALLER_CACHE_MAX_BYTES  retention budget of the cache, 4 GB by default
+    AAB_INSTALLER_MIN_FREE_BYTES   space the cache leaves free on its disk, 1 GB by default
+    AAB_INSTALLER_SCRATCH          directory for device specs, extraction and bundletool's
+                                   own temp files
+
+Without AAB_INSTALLER_SCRATCH, bundles up to TMPFS_MAX_BYTES use a tmpfs
+(/dev/shm) when it has room, so their intermediate files never reach the
+disk. Larger bundles use the cache's tmp directory, which is on the same
+filesystem as the cache, so finished artifacts are renamed into place
+rather than copied. Scratch files left by crashed runs are removed after
+cache.STALE_SECONDS.
+
+place_artifact() puts an artifact at a second path as a reflink
+(copy-on-write clone), else a hard link, else a copy. export_artifacts()
+does so for the .apks of named AABs; callers export while the cache
+entries are still pinned (aab_installer.cache).
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+from .cache import DEFAULT_CACHE_DIR, remove_stale
+
+
+TMPFS_DIR = "/dev/shm"
+TMPFS_MAX_BYTES = 256 * 1024 ** 2
+# bundletool's intermediate files take a few times the size of the bundle
+SCRATCH_FACTOR = 3
+# Linux FICLONE ioctl: share the source's extents (btrfs, xfs, bcachefs)
+FICLONE = 0x40049409
+
+
+def free_bytes(path):
+    """Free space on the filesystem of `path` (or of its nearest existing parent)."""
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return shutil.disk_usage(path).free
+
+
+def _tmpfs_fits(size_hint):
+    return (sys.platform.startswith("linux") and os.path.isdir(TMPFS_DIR) and size_hint <= TMPFS_MAX_BYTES
+            and free_bytes(TMPFS_DIR) > size_hint * SCRATCH_FACTOR)
+
+
+def scratch_root(size_hint=0):
+    """Scratch directory for work on a bundle of about `size_hint` bytes."""
+    configured = os.environ.get("AAB_INSTALLER_SCRATCH")
+    if configured:
+        # a subdirectory, so clearing stale files never touches anything else there
+        return os.path.join(configured, "aab_installer")
+    if _tmpfs_fits(size_hint):
+        return os.path.join(TMPFS_DIR, "aab_installer")
+    return os.path.join(DEFAULT_CACHE_DIR, "tmp")
+
+
+def scratch_dir(prefix, size_hint=0):
+    """A new directory under scratch_root(size_hint); the caller removes it."""
+    root = scratch_root(size_hint)
+    os.makedirs(root, exist_ok=True)
+    remove_stale(root)
+    return tempfile.mkdtemp(prefix=prefix, dir=root)
+
+
+def _reflink(source, destination):
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _clone(source, destination):
+    if sys.platform.startswith("linux"):
+        try:
+            _reflink(source, destination)
+            return "reflink"
+        except OSError:
+            if os.path.exists(destination):
+                os.remove(destination)
+    try:
+        os.link(source, destination)
+        return "hardlink"
+    except OSError:
+        shutil.copyfile(source, destination)
+        return "copy"
+
+
+def place_artifact(source, destination):
+    """Make `destination` a copy of `source`, sharing its data when the filesystem allows.
+
+    Tries a reflink, then a hard link, then a plain copy, into a temporary
+    name next to `destination` that is renamed over it at the end, so
+    readers never see a partial file. Returns "reflink", "hardlink" or
+    "copy". A hard-linked artifact is the cache's own file, so it must be
+    treated as read-only; the cache never rewrites entries in place.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    temp_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+    try:
+        method = _clone(source, temp_path)
+        os.replace(temp_path, destination)
+        return method
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def export_artifacts(directory, builds):
+    """Place the .apks of each (aab_path, apks_path) in `directory` as <aab name>.apks.
+
+    An AAB with several .apks (one per device spec) gets <aab name>-1.apks,
+    -2 and so on. Returns False when an artifact could not be placed; the
+    error is printed.
+    """
+    counts = {}
+    for aab_path, _ in builds:
+        counts[aab_path] = counts.get(aab_path, 0) + 1
+    seen = {}
+    ok = True
+    for aab_path, apks_path in builds:
+        name = os.path.splitext(os.path.basename(aab_path))[0]
+        if counts[aab_path] > 1:
+            seen[aab_path] = seen.get(aab_path, 0) + 1
+            name = f"{name}-{seen[aab_path]}"
+        destination = os.path.join(directory, name + ".apks")
+        try:
+            method = place_artifact(apks_path, destination)
+        except OSError as e:
+            print(f"Error: Failed to export {destination}. Error: {e}")
+            ok = False
+            continue
+        print(f"Exported {destination} ({method})")
+    return ok
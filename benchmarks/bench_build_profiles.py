@@ -0,0 +1,120 @@
+"""
+Build time and output size of each build profile (aab_installer.profiles).
+
+    python -m benchmarks.bench_build_profiles
+    python -m benchmarks.bench_build_profiles --bundletool bundletool-all.jar --aab app.aab --runs 5 --json builds.jsonl
+
+Without --bundletool the fake java/adb from benchmarks.fake_tools build a
+synthetic AAB for --devices fake devices. Every run is a cold build: the
+.apks files are removed from the cache afterwards. The warm bundletool JVM is
+kept between runs, as in an interactive dev loop, so the first run of a
+profile includes its JVM startup. fast-dev builds once per distinct device
+spec of the connected devices, so its time includes get-device-spec.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_tools import fake_env, install_fake_tools, make_synthetic_aab, write_jks
+
+
+def build_once(bundletool_path, aab_path, keystore, storepass, keypass, profile, java, adb):
+    """Wall seconds and the distinct .apks paths of one prepare_install build."""
+    from aab_installer.core import finish_prepared, prepare_install
+    from aab_installer.taskgraph import TaskGraph
+
+    graph = TaskGraph()
+    started = time.monotonic()
+    try:
+        graph.add_value("keystore", keystore)
+        prepare_install(graph, bundletool_path, aab_path, storepass, keypass, java=java, adb=adb, profile=profile)
+        targets = graph.result("targets")
+    finally:
+        finish_prepared(graph)
+    return time.monotonic() - started, sorted({apks_path for apks_path, _ in targets if apks_path})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bundletool", help="real bundletool jar (default: fake tools)")
+    parser.add_argument("--aab", help="AAB to build (default: a synthetic one)")
+    parser.add_argument("--keystore")
+    parser.add_argument("--alias")
+    parser.add_argument("--storepass", default="123456")
+    parser.add_argument("--keypass", default="123456")
+    parser.add_argument("--java", default="java")
+    parser.add_argument("--adb", default="adb")
+    parser.add_argument("--profiles", nargs="+", help="default: all profiles")
+    parser.add_argument("--build-cpus", type=int, help="cap the processors the bundletool JVM sees")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--devices", type=int, default=4, help="fake devices (fake tools only)")
+    parser.add_argument("--aab-mb", type=float, default=10, help="synthetic AAB size (fake tools only)")
+    parser.add_argument("--apks-mb", type=float, default=20, help="APKs per fake build (fake tools only)")
+    parser.add_argument("--json", metavar="FILE.jsonl", help="also append the result rows to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="aab-bench-profiles-")
+    # the cache directory and the adb server port are read when aab_installer is imported
+    os.environ["AAB_INSTALLER_CACHE"] = os.path.join(work_dir, "cache")
+    if not args.bundletool:
+        os.environ.update(fake_env(install_fake_tools(), build_seconds=1.0, jvm_startup_seconds=0.3,
+                                   apks_bytes=int(args.apks_mb * 2 ** 20), splits=4, spec_variants=2,
+                                   adb_devices=args.devices))
+        os.environ["ANDROID_ADB_SERVER_PORT"] = "1"
+        args.bundletool = os.path.join(work_dir, "bundletool.jar")
+        with open(args.bundletool, "wb") as f:
+            f.write(b"fake bundletool")
+        args.aab = args.aab or make_synthetic_aab(os.path.join(work_dir, "app.aab"), int(args.aab_mb * 2 ** 20))
+        args.keystore, args.alias = os.path.join(work_dir, "debug.jks"), "key0"
+        write_jks(args.keystore, args.alias, args.storepass, args.keypass)
+
+    from aab_installer.keystore_pool import KeystorePool
+    from aab_installer.profiles import BUILD_PROFILES, get_profile
+
+    if args.keystore:
+        keystore = (args.keystore, args.alias)
+    else:
+        pool = KeystorePool()
+        keystore = pool.current(prefill=False)
+        args.storepass, args.keypass = pool.storepass, pool.keypass
+
+    print(f"{'profile':<13} {'runs':>4} {'median s':>9} {'min s':>7} {'apks':>5} {'MB':>8}  jvm options")
+    for name in args.profiles or list(BUILD_PROFILES):
+        profile = get_profile(name)
+        if args.build_cpus:
+            profile = profile.with_cpus(args.build_cpus)
+        walls, outputs = [], []
+        for _ in range(args.runs):
+            wall, outputs = build_once(args.bundletool, args.aab, keystore, args.storepass, args.keypass, profile,
+                                       args.java, args.adb)
+            walls.append(wall)
+            size = sum(os.path.getsize(path) for path in outputs)
+            for path in outputs:
+                os.remove(path)
+        row = {
+            "profile": name,
+            "build_args": profile.build_args,
+            "jvm_options": profile.jvm_options,
+            "runs": len(walls),
+            "median": round(statistics.median(walls), 3),
+            "min": round(min(walls), 3),
+            "apks_files": len(outputs),
+            "apks_bytes": size if outputs else 0,
+        }
+        print(f"{name:<13} {row['runs']:>4} {row['median']:>9.2f} {row['min']:>7.2f} {row['apks_files']:>5} "
+              f"{row['apks_bytes'] / 2 ** 20:>8.1f}  {' '.join(profile.jvm_options)}")
+        if args.json:
+            with open(args.json, "a", encoding="utf-8") as f:
+                f.write(json.dumps(dict(row, aab=os.path.basename(args.aab))) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
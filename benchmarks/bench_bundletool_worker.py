@@ -0,0 +1,66 @@
+"""
+Compare cold `java -jar bundletool` calls with a warm BundletoolWorker.
+
+    python -m benchmarks.bench_bundletool_worker --bundletool ~/Downloads/bundletool-all-1.15.6.jar
+    python -m benchmarks.bench_bundletool_worker --fake --jvm-startup-seconds 0.8
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aab_installer.bundletool import BundletoolRunner, BundletoolWorker
+from benchmarks.fake_tools import fake_env, install_fake_tools
+
+
+def timed(fn):
+    started = time.monotonic()
+    result = fn()
+    return time.monotonic() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bundletool", default="bundletool.jar")
+    parser.add_argument("--java", default="java")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--command", nargs="+", default=["version"])
+    parser.add_argument("--fake", action="store_true", help="use the fake java from benchmarks.fake_tools")
+    parser.add_argument("--jvm-startup-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    java = args.java
+    if args.fake:
+        tools_dir = install_fake_tools()
+        os.environ.update(fake_env(tools_dir, jvm_startup_seconds=args.jvm_startup_seconds))
+        java = os.path.join(tools_dir, "java")
+
+    runner = BundletoolRunner(args.bundletool, java, pool_size=0)
+    cold = []
+    for _ in range(args.runs):
+        elapsed, result = timed(lambda: runner.run_subprocess(args.command))
+        if result.returncode:
+            print(result.stderr.decode("utf-8", "replace"))
+            return 1
+        cold.append(elapsed)
+
+    worker = BundletoolWorker(args.bundletool, java)
+    startup, _ = timed(worker.start)
+    warm = [timed(lambda: worker.run(args.command))[0] for _ in range(args.runs)]
+    worker.stop()
+
+    print(f"command: bundletool {' '.join(args.command)}, {args.runs} runs")
+    print(f"{'path':<16} {'first (s)':>10} {'median (s)':>11} {'total (s)':>10}")
+    print(f"{'java -jar':<16} {cold[0]:>10.3f} {statistics.median(cold):>11.3f} {sum(cold):>10.3f}")
+    print(f"{'worker':<16} {startup + warm[0]:>10.3f} {statistics.median(warm):>11.3f} "
+          f"{startup + sum(warm):>10.3f}")
+    print(f"worker startup: {startup:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
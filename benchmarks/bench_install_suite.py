@@ -0,0 +1,151 @@
+"""
+Throughput baseline of device discovery and build_and_install_apks on fake tools.
+
+    python -m benchmarks.bench_install_suite
+    python -m benchmarks.bench_install_suite --devices 1 8 64 --aab-mb 50 --apks-mb 80 --json baseline.jsonl
+
+Every scenario runs in a fresh interpreter against a FakeAdbServer with N
+devices and the fake java/adb from benchmarks.fake_tools, so wall time, CPU
+time (ours plus the fake tools') and peak RSS belong to that scenario alone.
+Each scenario measures discovery, a cold run (build + full installs) and a
+warm run (cached build, devices already up to date). POSIX only: it uses the
+resource module.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_tools import fake_env, install_fake_tools, make_synthetic_aab, write_jks
+
+
+DEFAULT_DEVICE_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+# ru_maxrss is in KiB on Linux and in bytes on macOS
+_MAXRSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+
+def usage():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "cpu": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        "peak_rss": own.ru_maxrss * _MAXRSS_SCALE,
+        "children_peak_rss": children.ru_maxrss * _MAXRSS_SCALE,
+    }
+
+
+def measure(fn):
+    before = usage()
+    started = time.monotonic()
+    result = fn()
+    after = usage()
+    return result, {
+        "wall": round(time.monotonic() - started, 3),
+        "cpu": round(after["cpu"] - before["cpu"], 3),
+        "peak_rss_mb": round(after["peak_rss"] / 2 ** 20, 1),
+        "children_peak_rss_mb": round(after["children_peak_rss"] / 2 ** 20, 1),
+    }
+
+
+def run_scenario(scenario):
+    """Run one scenario in this process and return its result row."""
+    from benchmarks.fake_adb_server import FakeAdbServer
+
+    work_dir = scenario["work_dir"]
+    devices = {f"emulator-{5554 + index * 2}": "device" for index in range(scenario["devices"])}
+    server = FakeAdbServer(devices).start()
+    # adb_monitor reads the port when it is imported
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(server.port)
+    from aab_installer.core import build_and_install_apks, get_connected_devices
+    try:
+        found, discovery = measure(get_connected_devices)
+        aab_path = make_synthetic_aab(os.path.join(work_dir, "app.aab"), scenario["aab_bytes"])
+        keystore_path = write_jks(os.path.join(work_dir, "debug.jks"), "key0", "123456", "123456")
+
+        def install():
+            return build_and_install_apks(scenario["bundletool"], aab_path, keystore_path, "key0", "123456",
+                                          "123456", max_workers=scenario["max_workers"])
+
+        cold_report, cold = measure(install)
+        warm_report, warm = measure(install)
+    finally:
+        server.stop()
+
+    # failed is None when the build itself failed
+    return {
+        "devices": scenario["devices"],
+        "found": len(found),
+        "discovery": discovery,
+        "cold": dict(cold, failed=len(cold_report.failed_devices) if cold_report is not False else None),
+        "warm": dict(warm, failed=len(warm_report.failed_devices) if warm_report is not False else None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=DEFAULT_DEVICE_COUNTS)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--aab-mb", type=float, default=10)
+    parser.add_argument("--apks-mb", type=float, default=20)
+    parser.add_argument("--splits", type=int, default=4)
+    parser.add_argument("--build-seconds", type=float, default=1.0)
+    parser.add_argument("--install-seconds", type=float, default=0.5)
+    parser.add_argument("--jvm-startup-seconds", type=float, default=0.3)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="probability that an install fails")
+    parser.add_argument("--json", metavar="FILE.jsonl", help="also append the result rows to this file")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(json.loads(args.scenario))))
+        return 0
+
+    tools_dir = install_fake_tools()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'devices':>7} {'found':>6} {'discover':>9} {'cold wall':>10} {'cold cpu':>9} {'warm wall':>10} "
+          f"{'warm cpu':>9} {'peak MB':>8} {'tools MB':>9} {'failed':>7}")
+    for count in args.devices:
+        work_dir = tempfile.mkdtemp(prefix="aab-bench-")
+        env = fake_env(tools_dir, build_seconds=args.build_seconds, install_seconds=args.install_seconds,
+                       jvm_startup_seconds=args.jvm_startup_seconds, apks_bytes=int(args.apks_mb * 2 ** 20),
+                       splits=args.splits, install_fail_rate=args.fail_rate,
+                       device_state=os.path.join(work_dir, "devices"))
+        env["AAB_INSTALLER_CACHE"] = os.path.join(work_dir, "cache")
+        env["HOME"] = work_dir
+        scenario = {
+            "devices": count,
+            "max_workers": args.max_workers,
+            "aab_bytes": int(args.aab_mb * 2 ** 20),
+            "bundletool": os.path.join(work_dir, "bundletool.jar"),
+            "work_dir": work_dir,
+        }
+        with open(scenario["bundletool"], "wb") as f:
+            f.write(b"fake bundletool")
+        try:
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_install_suite", "--scenario",
+                                     json.dumps(scenario)], stdout=subprocess.PIPE, env=env, cwd=root, check=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        row = json.loads(output.stdout.decode("utf-8").strip().splitlines()[-1])
+        cold, warm = row["cold"], row["warm"]
+        peak = max(cold["peak_rss_mb"], warm["peak_rss_mb"])
+        tools_peak = max(cold["children_peak_rss_mb"], warm["children_peak_rss_mb"])
+        print(f"{count:>7} {row['found']:>6} {row['discovery']['wall']:>9.2f} {cold['wall']:>10.2f} "
+              f"{cold['cpu']:>9.2f} {warm['wall']:>10.2f} {warm['cpu']:>9.2f} {peak:>8.1f} {tools_peak:>9.1f} "
+              f"{cold['failed']!s:>7}")
+        if args.json:
+            with open(args.json, "a", encoding="utf-8") as f:
+                f.write(json.dumps(dict(row, settings=vars(args))) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""
+Compare serial and parallel `install-apks` fan-out against fake tools.
+
+    python -m benchmarks.bench_parallel_install --devices 12 --install-seconds 2
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aab_installer.parallel import install_on_devices
+from benchmarks.fake_tools import fake_env, install_fake_tools
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=12)
+    parser.add_argument("--install-seconds", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 12])
+    args = parser.parse_args()
+
+    tools_dir = install_fake_tools()
+    os.environ.update(fake_env(tools_dir, adb_devices=args.devices, install_seconds=args.install_seconds))
+    java = os.path.join(tools_dir, "java")
+    device_ids = [f"emulator-{5554 + index * 2}" for index in range(args.devices)]
+
+    print(f"{'workers':>8} {'wall (s)':>10} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        started = time.monotonic()
+        report = install_on_devices("bundletool.jar", "app.apks", device_ids, max_workers=workers, java=java)
+        wall = time.monotonic() - started
+        if not report.ok:
+            print(f"install failed on {report.failed_devices}")
+            return 1
+        baseline = baseline or wall
+        print(f"{workers:>8} {wall:>10.2f} {baseline / wall:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+A local stand-in for the adb server's host services.
+
+Serves `host:version`, `host:devices`, `host:devices-l` and
+`host:track-devices` on a TCP port so DeviceMonitor and
+get_connected_devices can be exercised without adb or hardware:
+
+    server = FakeAdbServer({"emulator-5554": "device"}).start()
+    server.set_devices({"emulator-5554": "offline"})   # pushed to trackers
+    server.stop()
+"""
+
+import socket
+import socketserver
+import threading
+
+
+def _message(text):
+    data = text.encode("utf-8")
+    return b"%04x" % len(data) + data
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server.fake
+        try:
+            length = int(self._read(4), 16)
+            request = self._read(length).decode("utf-8")
+        except (ConnectionError, ValueError):
+            return
+
+        if request == "host:version":
+            self.request.sendall(b"OKAY" + _message("0029"))
+        elif request in ("host:devices", "host:devices-l"):
+            self.request.sendall(b"OKAY" + _message(server.device_list()))
+        elif request == "host:track-devices":
+            self.request.sendall(b"OKAY")
+            server.track(self.request)
+        else:
+            self.request.sendall(b"FAIL" + _message(f"unknown host service: {request}"))
+
+    def _read(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeAdbServer:
+    def __init__(self, devices=None, host="127.0.0.1", port=0):
+        self._devices = dict(devices or {})
+        self._trackers = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self.host, self.port = self._server.server_address
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            trackers, self._trackers = self._trackers, []
+        for sock in trackers:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def device_list(self):
+        with self._lock:
+            return "".join(f"{serial}\t{state}\n" for serial, state in self._devices.items())
+
+    def set_devices(self, devices):
+        with self._lock:
+            self._devices = dict(devices)
+            trackers = list(self._trackers)
+        for sock in trackers:
+            self._push(sock)
+
+    def track(self, sock):
+        with self._lock:
+            self._trackers.append(sock)
+        self._push(sock)
+        # Keep the handler thread (and connection) alive until the client leaves.
+        try:
+            while sock.recv(1):
+                pass
+        except OSError:
+            pass
+        with self._lock:
+            if sock in self._trackers:
+                self._trackers.remove(sock)
+
+    def _push(self, sock):
+        try:
+            sock.sendall(_message(self.device_list()))
+        except OSError:
+            pass
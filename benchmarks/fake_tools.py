@@ -0,0 +1,400 @@
+"""
+Stand-in `adb`, `java` and `keytool` executables for benchmarking without real devices.
+
+The fakes are small Python scripts written into a temporary directory. Their
+behaviour is driven by environment variables so a benchmark can change device
+count and latency without rewriting them:
+
+    FAKE_ADB_DEVICES        number of devices reported by `adb devices`
+    FAKE_BUILD_SECONDS      time spent in `bundletool build-apks`
+    FAKE_INSTALL_SECONDS    time spent in `bundletool install-apks` per device
+    FAKE_SPEC_VARIANTS      number of distinct device specs across the devices
+    FAKE_JVM_STARTUP_SECONDS  simulated JVM startup paid by each `java` launch
+    FAKE_KEYGEN_SECONDS     time spent in `keytool -genkey`
+    FAKE_DEVICE_STATE       optional directory where fake installs are recorded, so
+                            `adb shell` probes see what was installed before
+    FAKE_APKS_BYTES         approximate size of the APKs inside each built .apks
+    FAKE_SPLITS             number of config splits next to the base APK
+    FAKE_FAIL_DEVICES       comma separated serials whose installs always fail (out of storage)
+    FAKE_HANG_DEVICES       comma separated serials whose installs never finish
+    FAKE_INSTALL_FAIL_RATE  probability (0-1) that any other install fails with "device offline"
+    FAKE_LOW_STORAGE_DEVICES  comma separated serials that report 10 KB free on /data
+    FAKE_FOREIGN_SIGNATURE_DEVICES  comma separated serials that have the package installed with
+                            another signing key until it is uninstalled
+
+`build-apks --device-spec` writes only the matching config split and
+`--mode=universal` a single universal.apk; base-master.apk carries an APK
+signature block with a fixed certificate. The fake adb also takes
+`pm install-create` / `exec-in ... install-write` / `install-commit`
+sessions as used by aab_installer.direct_install, the device checks of
+aab_installer.prewarm, `adb uninstall` and the `am start -W` launches of
+aab_installer.launch.
+
+`make_synthetic_aab` writes an AAB-shaped zip of a given size to feed them,
+and `write_jks` (also behind the fake keytool) a JKS keystore that
+aab_installer.preflight can open.
+"""
+
+import hashlib
+import inspect
+import os
+import random
+import stat
+import struct
+import sys
+import tempfile
+import time
+import zipfile
+
+
+FAKE_ADB = '''\
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+
+def session_dir(device_id, session):
+    return os.path.join(os.environ.get("FAKE_DEVICE_STATE") or tempfile.gettempdir(), f"{device_id}.session-{session}")
+
+
+def state_path(device_id, suffix=""):
+    return os.path.join(os.environ.get("FAKE_DEVICE_STATE") or tempfile.gettempdir(), device_id + suffix)
+
+
+def certificate_hash():
+    # Arrays.hashCode of the certificate that the fake build-apks signs with
+    value = 1
+    for byte in b"fake certificate":
+        value = (31 * value + byte) & 0xFFFFFFFF
+    return f"{value:x}"
+
+
+args = sys.argv[1:]
+while args[:1] in (["-H"], ["-P"]):
+    args = args[2:]
+if args[:1] == ["devices"]:
+    print("List of devices attached")
+    for index in range(int(os.environ.get("FAKE_ADB_DEVICES", "1"))):
+        print(f"emulator-{5554 + index * 2}\\tdevice")
+    print()
+elif args[:1] == ["-s"] and "install-create" in args:
+    session = random.randrange(1, 2 ** 31)
+    os.makedirs(session_dir(args[1], session))
+    print(f"Success: created install session [{session}]")
+elif args[:1] == ["-s"] and "install-write" in args:
+    # install-write -S <size> <session> <name> -, with the APK on stdin
+    size, session, name = args[-4:-1]
+    data = sys.stdin.buffer.read()
+    if len(data) != int(size):
+        print(f"Error: expected {size} bytes for {name}, got {len(data)}")
+        sys.exit(1)
+    with open(os.path.join(session_dir(args[1], session), name), "w") as f:
+        f.write(hashlib.sha256(data).hexdigest())
+    print(f"Success: streamed {len(data)} bytes")
+elif args[:1] == ["-s"] and "install-commit" in args:
+    time.sleep(float(os.environ.get("FAKE_INSTALL_SECONDS", "0")))
+    directory = session_dir(args[1], args[-1])
+    lines = ["@version", "    versionCode=1 minSdk=21 targetSdk=34", "@paths"]
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            lines.append(f"{f.read()}  /data/app/fake/{name}")
+    shutil.rmtree(directory)
+    if os.environ.get("FAKE_DEVICE_STATE"):
+        with open(os.path.join(os.environ["FAKE_DEVICE_STATE"], args[1]), "w") as f:
+            f.write("\\n".join(lines) + "\\n")
+    print("Success")
+elif args[:1] == ["-s"] and "install-abandon" in args:
+    shutil.rmtree(session_dir(args[1], args[-1]), ignore_errors=True)
+    print("Success")
+elif args[:1] == ["-s"] and args[2:3] == ["shell"] and "echo @free" in args[3]:
+    device_id = args[1]
+    free_kb = 10 if device_id in os.environ.get("FAKE_LOW_STORAGE_DEVICES", "").split(",") else 8 * 1024 ** 2
+    print(f"@free\\n/dev/block/dm-5 115249236 {115249236 - free_kb} {free_kb} 40% /data")
+    print("@signatures")
+    if (device_id in os.environ.get("FAKE_FOREIGN_SIGNATURE_DEVICES", "").split(",")
+            and not os.path.exists(state_path(device_id, ".uninstalled"))):
+        print("    signatures=PackageSignatures{5c4c7e1 version:2, signatures:[deadbeef], past signatures:[]}")
+    elif os.path.exists(state_path(device_id)):
+        print(f"    signatures=PackageSignatures{{5c4c7e1 version:2, signatures:[{certificate_hash()}], "
+              "past signatures:[]}")
+    print("@power\\n  mWakefulness=Awake")
+    print("@sdk\\n33\\n@abis\\narm64-v8a,armeabi-v7a\\n@density\\nPhysical density: 420\\n@locales\\nen-US")
+elif args[:1] == ["-s"] and args[2:3] == ["shell"] and "resolve-activity" in args[3]:
+    if os.path.exists(state_path(args[1])):
+        print("com.example.fake/.MainActivity")
+    else:
+        print("No activity found")
+elif args[:1] == ["-s"] and args[2:3] == ["shell"] and "am start -W" in args[3]:
+    for kind, total in (("cold", random.randint(550, 650)), ("hot", random.randint(80, 120))):
+        print(f"@{kind}\\nStarting: Intent {{ cmp=com.example.fake/.MainActivity }}\\nStatus: ok")
+        print(f"LaunchState: {kind.upper()}\\nActivity: com.example.fake/.MainActivity")
+        print(f"TotalTime: {total}\\nWaitTime: {total + 12}\\nComplete")
+elif args[:1] == ["-s"] and args[2:3] == ["uninstall"]:
+    if os.path.exists(state_path(args[1])):
+        os.remove(state_path(args[1]))
+    open(state_path(args[1], ".uninstalled"), "w").close()
+    print("Success")
+elif args[:1] == ["-s"] and args[2:3] == ["shell"] and "getprop ro.build.version.sdk" in args[3]:
+    print("@sdk\\n33\\n@abis\\narm64-v8a,armeabi-v7a\\n@density\\nPhysical density: 420\\n@locales\\nen-US")
+elif args[:1] == ["-s"] and args[2:3] == ["shell"]:
+    state = os.path.join(os.environ.get("FAKE_DEVICE_STATE", ""), args[1])
+    if os.environ.get("FAKE_DEVICE_STATE") and os.path.exists(state):
+        with open(state) as f:
+            sys.stdout.write(f.read())
+elif args[:1] == ["-s"] and args[2:3] == ["install-multiple"]:
+    # Partial install: replace the recorded digests of the pushed splits.
+    state = os.path.join(os.environ.get("FAKE_DEVICE_STATE", ""), args[1])
+    if os.environ.get("FAKE_DEVICE_STATE") and os.path.exists(state):
+        with open(state) as f:
+            lines = f.read().splitlines()
+        for path in [arg for arg in args if arg.endswith(".apk")]:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            name = os.path.basename(path)
+            lines = [line for line in lines if not line.endswith("/" + name)]
+            lines.append(f"{digest}  /data/app/fake/{name}")
+        with open(state, "w") as f:
+            f.write("\\n".join(lines) + "\\n")
+    print("Success")
+'''
+
+FAKE_JAVA = '''\
+import hashlib
+import io
+import json
+import os
+import random
+import struct
+import sys
+import time
+import zipfile
+from contextlib import redirect_stderr, redirect_stdout
+
+
+ADB_COMMANDS = {"install-apks", "install-multi-apks", "get-device-spec"}
+
+
+def option(args, name):
+    return [arg.split("=", 1)[1] for arg in args if arg.startswith(f"--{name}=")][0]
+
+
+def record_install(apks_path, device_id):
+    # Same output as the probe script in aab_installer/probe.py.
+    lines = ["@version", "    versionCode=1 minSdk=21 targetSdk=34", "@paths"]
+    with zipfile.ZipFile(apks_path) as apks:
+        for name in apks.namelist():
+            if name.endswith(".apk"):
+                digest = hashlib.sha256(apks.read(name)).hexdigest()
+                lines.append(f"{digest}  /data/app/fake/{os.path.basename(name)}")
+    os.makedirs(os.environ["FAKE_DEVICE_STATE"], exist_ok=True)
+    with open(os.path.join(os.environ["FAKE_DEVICE_STATE"], device_id), "w") as f:
+        f.write("\\n".join(lines) + "\\n")
+
+
+def signed_apk(payload):
+    # A zip with an APK Signature Scheme v2 block before its central directory, holding one fake certificate.
+    def prefixed(data):
+        return struct.pack("<I", len(data)) + data
+
+    signed_data = prefixed(b"") + prefixed(prefixed(b"fake certificate")) + prefixed(b"")
+    signers = prefixed(prefixed(prefixed(signed_data) + prefixed(b"") + prefixed(b"")))
+    pair = struct.pack("<QI", len(signers) + 4, 0x7109871A) + signers
+    block = struct.pack("<Q", len(pair) + 24) + pair + struct.pack("<Q", len(pair) + 24) + b"APK Sig Block 42"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as apk:
+        apk.writestr(zipfile.ZipInfo("classes.dex", (2020, 1, 1, 0, 0, 0)), payload)
+    data = buffer.getvalue()
+    eocd = data.rfind(b"PK\\x05\\x06")
+    central_directory = struct.unpack_from("<I", data, eocd + 16)[0]
+    return (data[:central_directory] + block + data[central_directory:eocd + 16]
+            + struct.pack("<I", central_directory + len(block)) + data[eocd + 20:])
+
+
+def bundletool(args):
+    command = args[0] if args else ""
+    if command == "build-apks":
+        with open(option(args, "bundle"), "rb") as f:
+            bundle_digest = hashlib.sha256(f.read()).digest()
+        splits = int(os.environ.get("FAKE_SPLITS", "2"))
+        split_bytes = int(os.environ.get("FAKE_APKS_BYTES", "0")) // (splits + 1)
+        # A --device-spec build only contains the one config split the device needs and takes that much less time.
+        targeted = any(arg.startswith("--device-spec=") for arg in args)
+        built = 1 if targeted else splits
+        time.sleep(float(os.environ.get("FAKE_BUILD_SECONDS", "0")) * (built + 1) / (splits + 1))
+        # Only the base split depends on the AAB contents, like a code-only change.
+        base = b"fake base apk " + bundle_digest + random.Random(bundle_digest).randbytes(split_bytes)
+        configs = [b"fake config split" + random.Random(index).randbytes(split_bytes) for index in range(built)]
+        with zipfile.ZipFile(option(args, "output"), "w") as apks:
+            apks.writestr("toc.pb", b"")
+            if "--mode=universal" in args:
+                apks.writestr("universal.apk", base + b"".join(configs))
+            else:
+                apks.writestr("splits/base-master.apk", signed_apk(base))
+                for index, config in enumerate(configs):
+                    apks.writestr(f"splits/base-config{index}.apk", config)
+    elif command == "extract-apks":
+        output_dir = option(args, "output-dir")
+        os.makedirs(output_dir, exist_ok=True)
+        with zipfile.ZipFile(option(args, "apks")) as apks:
+            for name in apks.namelist():
+                if name.endswith(".apk"):
+                    with open(os.path.join(output_dir, os.path.basename(name)), "wb") as f:
+                        f.write(apks.read(name))
+    elif command == "dump":
+        xpath = option(args, "xpath")
+        print(os.environ.get("FAKE_PACKAGE", "com.example.fake") if xpath.endswith("@package") else "1")
+    elif command == "get-device-spec":
+        device_id = option(args, "device-id")
+        variant = int(device_id.rsplit("-", 1)[-1]) // 2 % int(os.environ.get("FAKE_SPEC_VARIANTS", "1"))
+        with open(option(args, "output"), "w") as f:
+            json.dump({"supportedAbis": ["arm64-v8a"], "supportedLocales": ["en-US"],
+                       "screenDensity": 420 + variant, "sdkVersion": 33, "buildBrand": device_id}, f)
+    elif command == "install-apks":
+        time.sleep(float(os.environ.get("FAKE_INSTALL_SECONDS", "0")))
+        device_id = option(args, "device-id")
+        if device_id in os.environ.get("FAKE_HANG_DEVICES", "").split(","):
+            time.sleep(3600)
+        if device_id in os.environ.get("FAKE_FAIL_DEVICES", "").split(","):
+            sys.stderr.write(f"INSTALL_FAILED_INSUFFICIENT_STORAGE on {device_id}\\n")
+            return 1
+        if random.random() < float(os.environ.get("FAKE_INSTALL_FAIL_RATE", "0")):
+            sys.stderr.write(f"error: device offline ({device_id})\\n")
+            return 1
+        if os.environ.get("FAKE_DEVICE_STATE"):
+            record_install(option(args, "apks"), option(args, "device-id"))
+        print("The APKs have been extracted in the directory: /tmp/fake")
+    elif command == "version":
+        print("1.15.6")
+    else:
+        sys.stderr.write(f"fake bundletool: unsupported command {command!r}\\n")
+        return 1
+    return 0
+
+
+def worker():
+    # Same protocol as aab_installer/BundletoolWorker.java.
+    time.sleep(float(os.environ.get("FAKE_JVM_STARTUP_SECONDS", "0")))
+    protocol = sys.stdout.buffer
+    protocol.write(b"READY\\n")
+    protocol.flush()
+    bridge_closed = False
+    for line in sys.stdin.buffer:
+        args = line.decode("utf-8").rstrip("\\n").split("\\t")
+        out, err = io.StringIO(), io.StringIO()
+        # Like bundletool's DdmlibAdbServer singleton: closed after the first adb command of the JVM.
+        uses_adb = args[0] in ADB_COMMANDS or any(arg == "--connected-device" or arg.startswith("--device-id=")
+                                                 for arg in args[1:])
+        if uses_adb and bridge_closed:
+            err.write("Android Debug Bridge has been closed.\\n")
+            status = 1
+        else:
+            bridge_closed = bridge_closed or uses_adb
+            with redirect_stdout(out), redirect_stderr(err):
+                status = bundletool(args)
+        out, err = out.getvalue().encode(), err.getvalue().encode()
+        protocol.write(f"DONE {status} {len(out)} {len(err)}\\n".encode() + out + err)
+        protocol.flush()
+
+
+args = sys.argv[1:]
+if "-jar" in args:
+    time.sleep(float(os.environ.get("FAKE_JVM_STARTUP_SECONDS", "0")))
+    sys.exit(bundletool(args[args.index("-jar") + 2:]))
+elif args and args[-1].endswith("BundletoolWorker.java"):
+    worker()
+else:
+    sys.stderr.write(f"fake java: unsupported arguments {args!r}\\n")
+    sys.exit(1)
+'''
+
+def write_jks(path, alias, storepass, keypass):
+    """Write a JKS keystore with one private key entry, laid out as keytool does (the key is random bytes)."""
+    def der(tag, value):
+        length = len(value).to_bytes(2, "big")
+        return bytes([tag]) + (bytes([len(value)]) if len(value) < 0x80 else b"\x82" + length) + value
+
+    key = os.urandom(64)
+    salt, password = os.urandom(20), keypass.encode("utf-16-be")
+    stream, block = b"", salt
+    while len(stream) < len(key):
+        block = hashlib.sha1(password + block).digest()
+        stream += block
+    protected = salt + bytes(a ^ b for a, b in zip(key, stream)) + hashlib.sha1(password + key).digest()
+    # EncryptedPrivateKeyInfo with Sun's JKS key protector (OID 1.3.6.1.4.1.42.2.17.1.1)
+    key_info = der(0x30, bytes.fromhex("300e060a2b060104012a021101010500") + der(0x04, protected))
+    alias = alias.lower().encode("utf-8")
+    body = (struct.pack(">IIII", 0xFEEDFEED, 2, 1, 1) + struct.pack(">H", len(alias)) + alias
+            + struct.pack(">QI", int(time.time() * 1000), len(key_info)) + key_info + struct.pack(">I", 0))
+    with open(path, "wb") as f:
+        f.write(body + hashlib.sha1(storepass.encode("utf-16-be") + b"Mighty Aphrodite" + body).digest())
+    return path
+
+
+FAKE_KEYTOOL = '''\
+import hashlib
+import os
+import struct
+import sys
+import time
+
+
+''' + inspect.getsource(write_jks) + '''
+
+args = sys.argv[1:]
+time.sleep(float(os.environ.get("FAKE_KEYGEN_SECONDS", "0")))
+write_jks(*(args[args.index(option) + 1] for option in ("-keystore", "-alias", "-storepass", "-keypass")))
+'''
+
+
+def _proto_field(number, value):
+    """One length-delimited protobuf field (all the fake manifest needs)."""
+    value = value.encode("utf-8") if isinstance(value, str) else value
+    return bytes([number << 3 | 2, len(value)]) + value
+
+
+def _proto_manifest(package, version_code):
+    """A protobuf XmlNode <manifest package=... android:versionCode=...> like the ones aapt2 writes into AABs."""
+    attributes = b"".join(_proto_field(4, _proto_field(2, name) + _proto_field(3, value))
+                          for name, value in (("package", package), ("versionCode", str(version_code))))
+    return _proto_field(1, _proto_field(3, "manifest") + attributes)
+
+
+def make_synthetic_aab(path, size_bytes=1024 * 1024, seed=0):
+    """Write an AAB-shaped zip of roughly `size_bytes` (incompressible dex) and return its path."""
+    with zipfile.ZipFile(path, "w") as aab:
+        # BundleConfig { bundletool { version } }
+        aab.writestr("BundleConfig.pb", _proto_field(1, _proto_field(2, "1.15.6")))
+        aab.writestr("base/manifest/AndroidManifest.xml", _proto_manifest("com.example.fake", 1))
+        aab.writestr("base/dex/classes.dex", random.Random(seed).randbytes(size_bytes), zipfile.ZIP_STORED)
+    return path
+
+
+def _write_executable(directory, name, body):
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(f"#!{sys.executable}\n")
+        f.write(body)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def install_fake_tools(directory=None):
+    """Write fake `adb`, `java` and `keytool` into `directory` and return it."""
+    directory = directory or tempfile.mkdtemp(prefix="fake-android-tools-")
+    _write_executable(directory, "adb", FAKE_ADB)
+    _write_executable(directory, "java", FAKE_JAVA)
+    _write_executable(directory, "keytool", FAKE_KEYTOOL)
+    return directory
+
+
+def fake_env(directory, **settings):
+    """Return a copy of os.environ with the fakes first on PATH."""
+    env = os.environ.copy()
+    env["PATH"] = directory + os.pathsep + env.get("PATH", "")
+    for key, value in settings.items():
+        env[f"FAKE_{key.upper()}"] = str(value)
+    return env
@@ -7,89 +7,55 @@
 """
 import os
 import sys
-import subprocess
+import threading
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QFileDialog, QVBoxLayout,
-                             QPushButton, QLabel, QWidget, QLineEdit, QGridLayout)
-
-
-def get_connected_devices():
-    devices_raw = subprocess.check_output(["adb", "devices"])
-    device_ids = [
-        device.split("\t")[0]
-        for device in devices_raw.decode("utf-8").strip().split("\n")[1:]
-    ]
-    return device_ids
-
-
-def build_and_install_apks(bundletool_path, aab_path, keystore_path, alias, storepass, keypass):
-    apk_output = os.path.splitext(aab_path)[0] + ".apks"
-
-    previous_apk_output = apk_output.replace(".apks", "_previous.apks")
-
-    if os.path.exists(apk_output):
-        if os.path.exists(previous_apk_output):
-            os.remove(previous_apk_output)
-        os.rename(apk_output, previous_apk_output)
-
-    # 更改环境变量PATH
-    my_env = os.environ.copy()
-    bundletool_dir = os.path.dirname(bundletool_path)
-    my_env["PATH"] = my_env["PATH"] + f"{os.pathsep}{bundletool_dir}"
-
-    result = subprocess.run(
-        [
-            "java",
-            "-jar",
-            bundletool_path,
-            "build-apks",
-            f"--bundle={aab_path}",
-            f"--output={apk_output}",
-            f"--ks={keystore_path}",
-            f"--ks-pass=pass:{storepass}",
-            f"--ks-key-alias={alias}",
-            f"--key-pass=pass:{keypass}",
-        ],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        env=my_env  # 使用新环境变量
-    )
-
-    if result.returncode:
-        print(f"Error: Failed to generate APKS from AAB. Error: {result.stderr.decode('utf-8')}")
-        return False
-
-    print("APKS generated successfully!")
-    device_ids = get_connected_devices()
-    all_installed = True
-    for device_id in device_ids:
-        result = subprocess.run(
-            [
-                "java",
-                "-jar",
-                bundletool_path,
-                "install-apks",
-                f"--apks={apk_output}",
-                f"--device-id={device_id}",
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-
-        if result.returncode:
-            print(f"Error: Failed to install APKs on {device_id}. Error: {result.stderr.decode('utf-8')}")
-            all_installed = False
-        else:
-            print(f"APKs installed successfully on {device_id}!")
-
-    return all_installed
+                             QPushButton, QLabel, QWidget, QLineEdit, QGridLayout, QPlainTextEdit,
+                             QTableWidget, QTableWidgetItem)
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+from aab_installer.core import install_job_message, prepare_install, queue_install
+from aab_installer.jobs import COLUMNS as JOB_COLUMNS, JobScheduler
+from aab_installer.preflight import check_keystore
+from aab_installer.profiles import get_profile
+from aab_installer.taskgraph import TaskGraph
+from aab_installer.trace import get_tracer
+
+
+BUNDLETOOL_PATH = "/Users/edward/Downloads/bundletool-all-1.15.4.jar"
+# 同时安装的设备数量上限
+INSTALL_MAX_WORKERS = 4
+# 按设备配置（get-device-spec）分组构建，只生成设备需要的 split APK
+PER_DEVICE_SPEC_BUILDS = False
+# 构建配置："fast-dev"（只构建已连接设备需要的 split，--local-testing）、"default"、"universal"、"full-release"
+BUILD_PROFILE = "default"
+# 设备上已安装的应用签名不同时先卸载再安装（会清除应用数据）；False 时这些设备直接报错
+UNINSTALL_CONFLICTING_BUILDS = True
+# 安装完成后在每台设备上冷启动、热启动应用的次数，统计启动耗时（am start -W）；0 表示不启动
+LAUNCH_ITERATIONS = 0
+# 进度窗口最多保留的行数
+PROGRESS_MAX_LINES = 500
+TIMING_COLUMNS = ["Phase", "Device", "Seconds", "Exit", "APKS bytes"]
+# 任务列表刷新间隔（毫秒）
+JOB_REFRESH_MS = 1000
 
 
 class AABInstaller(QMainWindow):
+    # 设备（或 "build"）, 进度信息；可以从任意线程发出
+    progress_signal = pyqtSignal(str, str)
+    # 任务编号；任务排队、开始或结束时从任务线程发出
+    job_signal = pyqtSignal(int)
 
     def __init__(self):
         super().__init__()
+        # 每次点击安装都排入队列；使用相同设备的任务依次安装，互不相关的任务同时进行
+        self.scheduler = JobScheduler(on_change=lambda job: self.job_signal.emit(job.job_id))
 
         self.init_ui()
+        self.progress_signal.connect(self.on_progress)
+        self.job_signal.connect(self.on_job_changed)
+        self.job_timer = QTimer(self)
+        self.job_timer.timeout.connect(self.refresh_jobs)
+        self.job_timer.start(JOB_REFRESH_MS)
 
     def init_ui(self):
         self.setWindowTitle("AAB Installer")
@@ -137,12 +103,30 @@ class AABInstaller(QMainWindow):
         install_apks_btn.clicked.connect(self.install_apks)
         layout.addWidget(install_apks_btn)
 
+        cancel_btn = QPushButton("Cancel")
+        cancel_btn.clicked.connect(self.cancel)
+        layout.addWidget(cancel_btn)
+
         output_label = QLabel("Install Result:")
         layout.addWidget(output_label)
 
         self.status_label = QLabel("")
         layout.addWidget(self.status_label)
 
+        self.job_table = QTableWidget(0, len(JOB_COLUMNS))
+        self.job_table.setHorizontalHeaderLabels(JOB_COLUMNS)
+        self.job_table.setSelectionBehavior(QTableWidget.SelectRows)
+        layout.addWidget(self.job_table)
+
+        self.progress_view = QPlainTextEdit()
+        self.progress_view.setReadOnly(True)
+        self.progress_view.setMaximumBlockCount(PROGRESS_MAX_LINES)
+        layout.addWidget(self.progress_view)
+
+        self.timing_table = QTableWidget(0, len(TIMING_COLUMNS))
+        self.timing_table.setHorizontalHeaderLabels(TIMING_COLUMNS)
+        layout.addWidget(self.timing_table)
+
         self.setCentralWidget(central_widget)
 
     def open_aab(self):
@@ -166,15 +150,69 @@ class AABInstaller(QMainWindow):
         alias = self.alias_field.text()
 
         if aab_path and keystore_path and storepass and keypass and alias:
-            result = build_and_install_apks(BUNDLETOOL_PATH, aab_path, keystore_path, alias, storepass, keypass)
-
+            # 先在本地检查密钥库、别名和密码（不调用 keytool），有错误时不启动构建
+            keystore_check = check_keystore(keystore_path, alias, storepass, keypass)
+            keystore_check.print_problems()
+            if not keystore_check.ok:
+                self.status_label.setText(keystore_check.errors[0])
+                return
             # 获取 AAB 文件的前缀
             aab_prefix = os.path.splitext(os.path.basename(aab_path))[0]
-
-            if result:
-                self.status_label.setText(f"{aab_prefix} installed successfully")
-            else:
-                self.status_label.setText(f"Failed to install {aab_prefix}")
+            # 点击后立即开始构建；安装排队，等使用相同设备的任务结束后再推送
+            graph = TaskGraph()
+            graph.add_value("keystore", (keystore_path, alias))
+            cancel_event = threading.Event()
+            prepare_install(graph, BUNDLETOOL_PATH, aab_path, storepass, keypass, max_workers=INSTALL_MAX_WORKERS,
+                            per_device_spec=PER_DEVICE_SPEC_BUILDS,
+                            progress=lambda name, message: self.progress_signal.emit(f"{name} {aab_prefix}", message),
+                            cancel=cancel_event, profile=get_profile(BUILD_PROFILE))
+            job = queue_install(self.scheduler, aab_prefix, graph, BUNDLETOOL_PATH, cancel=cancel_event,
+                                progress=self.progress_signal.emit, max_workers=INSTALL_MAX_WORKERS,
+                                uninstall_conflicts=UNINSTALL_CONFLICTING_BUILDS, launch_iterations=LAUNCH_ITERATIONS)
+            self.status_label.setText(f"Install #{job.job_id} queued")
+
+    def show_timings(self, since):
+        # 本次运行各阶段耗时（keygen、构建、每台设备的安装）
+        rows = get_tracer().summary(since=since)
+        self.timing_table.setRowCount(len(rows))
+        for row, (phase, device, seconds, exit_code, apks_bytes) in enumerate(rows):
+            for column, value in enumerate((phase, device, f"{seconds:.2f}", str(exit_code), str(apks_bytes))):
+                self.timing_table.setItem(row, column, QTableWidgetItem(value))
+        self.timing_table.resizeColumnsToContents()
+
+    def on_progress(self, name, message):
+        self.progress_view.appendPlainText(f"[{name}] {message}")
+
+    def on_job_changed(self, job_id):
+        self.refresh_jobs()
+        job = self.scheduler.get(job_id)
+        if job.active:
+            return
+        self.status_label.setText(f"#{job.job_id} {job.name}: {install_job_message(job)}")
+        self.show_timings(job.submitted)
+
+    def refresh_jobs(self):
+        # 排队、运行中和已结束的任务；耗时对排队中的任务是已等待的时间
+        jobs = self.scheduler.jobs()
+        self.job_table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            for column, value in enumerate(job.row()):
+                item = self.job_table.item(row, column)
+                if item is None:
+                    self.job_table.setItem(row, column, QTableWidgetItem(value))
+                elif item.text() != value:
+                    item.setText(value)
+
+    def cancel(self):
+        # 在任务列表中选中任务时只取消选中的任务，否则取消所有未结束的任务
+        jobs = self.scheduler.jobs()
+        rows = {index.row() for index in self.job_table.selectedIndexes()}
+        for row in rows:
+            if row < len(jobs):
+                self.scheduler.cancel(jobs[row].job_id)
+        if not rows:
+            self.scheduler.cancel()
+        self.status_label.setText("Cancelling...")
 
 
 def main():
@@ -185,5 +223,4 @@ def main():
 
 
 if __name__ == '__main__':
-    BUNDLETOOL_PATH = "/Users/edward/Downloads/bundletool-all-1.15.4.jar"
     main()
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""DeviceMonitor against benchmarks.fake_adb_server.FakeAdbServer."""
+
+import threading
+import unittest
+
+from aab_installer.adb_monitor import DeviceMonitor, query_devices
+from benchmarks.fake_adb_server import FakeAdbServer
+
+
+TIMEOUT = 5.0
+
+
+class DeviceMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAdbServer({"emulator-5554": "device", "emulator-5556": "unauthorized"}).start()
+        self.monitor = DeviceMonitor(self.server.host, self.server.port, reconnect_delay=0.05)
+        self.changes = []
+        self.changed = threading.Condition()
+        self.monitor.add_listener(self.on_change)
+        self.monitor.start()
+        self.assertTrue(self.monitor.wait_ready(timeout=TIMEOUT))
+
+    def tearDown(self):
+        self.monitor.stop()
+        self.server.stop()
+
+    def on_change(self, serial, old_state, new_state):
+        with self.changed:
+            self.changes.append((serial, old_state, new_state))
+            self.changed.notify_all()
+
+    def wait_for_change(self, change):
+        with self.changed:
+            self.assertTrue(self.changed.wait_for(lambda: change in self.changes, TIMEOUT), self.changes)
+
+    def wait_for_table(self, table):
+        self.assertTrue(self.monitor.wait_for(lambda current: current == table, TIMEOUT), self.monitor.table())
+
+    def test_initial_snapshot(self):
+        self.wait_for_table({"emulator-5554": "device", "emulator-5556": "unauthorized"})
+        self.assertEqual(self.monitor.devices(), ["emulator-5554"])
+        self.assertEqual(self.monitor.devices("unauthorized"), ["emulator-5556"])
+        self.wait_for_change(("emulator-5554", None, "device"))
+        self.wait_for_change(("emulator-5556", None, "unauthorized"))
+        self.assertEqual(query_devices(self.server.host, self.server.port), self.monitor.table())
+
+    def test_device_added_and_removed(self):
+        self.server.set_devices({"emulator-5554": "device", "emulator-5556": "unauthorized",
+                                 "emulator-5558": "device"})
+        self.wait_for_change(("emulator-5558", None, "device"))
+        self.assertEqual(self.monitor.devices(), ["emulator-5554", "emulator-5558"])
+
+        self.server.set_devices({"emulator-5556": "unauthorized", "emulator-5558": "device"})
+        self.wait_for_change(("emulator-5554", "device", None))
+        self.assertEqual(self.monitor.devices(), ["emulator-5558"])
+
+    def test_state_change(self):
+        self.wait_for_table({"emulator-5554": "device", "emulator-5556": "unauthorized"})
+        self.server.set_devices({"emulator-5554": "offline", "emulator-5556": "device"})
+        self.wait_for_change(("emulator-5554", "device", "offline"))
+        self.wait_for_change(("emulator-5556", "unauthorized", "device"))
+        self.assertEqual(self.monitor.devices(), ["emulator-5556"])
+
+    def test_reconnects_after_the_server_drops(self):
+        self.wait_for_table({"emulator-5554": "device", "emulator-5556": "unauthorized"})
+        host, port = self.server.host, self.server.port
+        self.server.stop()
+        self.wait_for_change(("emulator-5554", "device", None))
+        self.wait_for_table({})
+        self.assertFalse(self.monitor.wait_ready(timeout=0))
+
+        self.server = FakeAdbServer({"emulator-5560": "device"}, host, port).start()
+        self.wait_for_table({"emulator-5560": "device"})
+        self.assertTrue(self.monitor.wait_ready(timeout=0))
+        self.wait_for_change(("emulator-5560", None, "device"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""aab_installer.archive: the protobuf and binary XML readers and the AAB / .apks metadata."""
+
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import unittest
+import zipfile
+
+from aab_installer.archive import (_read_varint, binary_manifest_attributes, proto_fields,
+                                   proto_manifest_attributes, read_aab, read_apks, read_signing_certificates)
+from benchmarks.fake_tools import _proto_manifest, fake_env, install_fake_tools, make_synthetic_aab
+
+
+TIMEOUT = 30
+
+
+def varint(value):
+    out = bytearray()
+    while True:
+        byte, value = value & 0x7F, value >> 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def field(number, value):
+    """A varint field for an int, a length-delimited one for bytes or str."""
+    if isinstance(value, int):
+        return varint(number << 3) + varint(value)
+    value = value.encode("utf-8") if isinstance(value, str) else value
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+
+def binary_manifest(package, version_code, version_name, min_sdk):
+    """A compiled AndroidManifest.xml with <manifest> and <uses-sdk> start elements, as aapt2 writes into APKs."""
+    strings = ["manifest", "package", "versionCode", "versionName", "uses-sdk", "minSdkVersion", package,
+               version_name]
+    encoded = b"".join(bytes([len(s), len(s)]) + s.encode("utf-8") + b"\0" for s in strings)
+    offsets, pos = [], 0
+    for s in strings:
+        offsets.append(pos)
+        pos += len(s) + 3
+    encoded += b"\0" * (-len(encoded) % 4)
+    header_size = 28
+    strings_start = header_size + 4 * len(strings)
+    pool = struct.pack("<HHIIIIII", 0x0001, header_size, strings_start + len(encoded), len(strings), 0, 1 << 8,
+                       strings_start, 0) + struct.pack(f"<{len(strings)}I", *offsets) + encoded
+
+    def element(name, attributes):
+        body = b"".join(struct.pack("<IIIHBBI", 0xFFFFFFFF, name_index, raw, 8, 0, data_type, value)
+                        for name_index, raw, data_type, value in attributes)
+        return struct.pack("<HHIIIIIHHHHHH", 0x0102, 16, 36 + len(body), 1, 0xFFFFFFFF, 0xFFFFFFFF, name, 20, 20,
+                           len(attributes), 0, 0, 0) + body
+
+    string, int_dec, no_raw = 0x03, 0x10, 0xFFFFFFFF
+    chunks = (pool + element(0, [(1, 6, string, 6), (2, no_raw, int_dec, version_code), (3, 7, string, 7)])
+              + element(4, [(5, no_raw, int_dec, min_sdk)]))
+    return struct.pack("<HHI", 0x0003, 8, 8 + len(chunks)) + chunks
+
+
+class ProtoReaderTest(unittest.TestCase):
+    def test_varints(self):
+        for value in (0, 1, 127, 128, 300, 2 ** 35):
+            with self.subTest(value):
+                self.assertEqual(_read_varint(varint(value) + b"\xff", 0), (value, len(varint(value))))
+
+    def test_wire_types(self):
+        data = (field(1, 150) + field(2, "hi") + varint(3 << 3 | 1) + struct.pack("<Q", 7)
+                + varint(4 << 3 | 5) + struct.pack("<I", 9))
+        self.assertEqual(list(proto_fields(data)), [(1, 150), (2, b"hi"), (3, 7), (4, 9)])
+        with self.assertRaises(ValueError):
+            list(proto_fields(varint(1 << 3 | 3)))
+
+    def test_proto_manifest(self):
+        self.assertEqual(proto_manifest_attributes(_proto_manifest("com.example.fake", 12)),
+                         {"manifest": {"package": "com.example.fake", "versionCode": 12}})
+
+    def test_proto_manifest_compiled_values(self):
+        # versionCode as a compiled primitive (Item.prim.int_decimal_value) and a nested <uses-sdk>
+        version = field(4, field(2, "versionCode") + field(6, field(7, field(6, 42))))
+        uses_sdk = field(5, field(1, field(3, "uses-sdk") + field(4, field(2, "minSdkVersion") + field(3, "21"))))
+        data = field(1, field(3, "manifest") + version + uses_sdk)
+        self.assertEqual(proto_manifest_attributes(data),
+                         {"manifest": {"versionCode": 42}, "uses-sdk": {"minSdkVersion": 21}})
+
+
+class BinaryManifestTest(unittest.TestCase):
+    def test_manifest_and_uses_sdk(self):
+        self.assertEqual(binary_manifest_attributes(binary_manifest("com.example.app", 42, "1.2", 24)), {
+            "manifest": {"package": "com.example.app", "versionCode": 42, "versionName": "1.2"},
+            "uses-sdk": {"minSdkVersion": 24},
+        })
+
+
+class ReadArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="archive-")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def test_read_aab(self):
+        info = read_aab(make_synthetic_aab(self.path("app.aab"), 2048))
+        self.assertEqual((info.package, info.version_code, info.modules), ("com.example.fake", 1, ["base"]))
+        self.assertEqual(info.size, os.path.getsize(self.path("app.aab")))
+
+    def test_read_apks_toc(self):
+        def description(path, split_id, master, targeting=b""):
+            return field(2, field(1, targeting) + field(2, path) + field(3, field(1, split_id) + field(2, master)))
+
+        arm64 = field(1, field(1, field(1, 3)))
+        apk_set = (field(1, field(1, "base") + field(6, 1)) + description("splits/base-master.apk", "", 1)
+                   + description("splits/base-arm64_v8a.apk", "config.arm64_v8a", 0, arm64))
+        toc = field(1, field(2, apk_set) + field(3, 0)) + field(4, "com.example.app")
+        with zipfile.ZipFile(self.path("app.apks"), "w") as apks:
+            apks.writestr("toc.pb", toc)
+            apks.writestr("splits/base-master.apk", self.base_apk(binary_manifest("com.example.app", 7, "2.0", 23)))
+            apks.writestr("splits/base-arm64_v8a.apk", b"abi")
+
+        info = read_apks(self.path("app.apks"))
+        self.assertEqual((info.package, info.version_code, info.version_name, info.min_sdk),
+                         ("com.example.app", 7, "2.0", 23))
+        self.assertEqual([(apk.path, apk.master, apk.abis) for apk in info.apks],
+                         [("splits/base-master.apk", True, []), ("splits/base-arm64_v8a.apk", False, ["arm64-v8a"])])
+        self.assertEqual(info.modules, {"base": "install-time"})
+        self.assertEqual(info.abis, ["arm64-v8a"])
+        self.assertEqual(read_signing_certificates(self.path("app.apks")), [])
+
+    def base_apk(self, manifest):
+        path = self.path("base.apk")
+        with zipfile.ZipFile(path, "w") as apk:
+            apk.writestr("AndroidManifest.xml", manifest)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_signing_certificates_of_a_built_apks(self):
+        tools = install_fake_tools()
+        try:
+            aab = make_synthetic_aab(self.path("app.aab"), 1024)
+            subprocess.run([os.path.join(tools, "java"), "-jar", "bundletool.jar", "build-apks", f"--bundle={aab}",
+                            f"--output={self.path('app.apks')}"], env=fake_env(tools), check=True, timeout=TIMEOUT)
+        finally:
+            shutil.rmtree(tools, ignore_errors=True)
+        self.assertEqual(read_signing_certificates(self.path("app.apks")), [b"fake certificate"])
+        # no toc entries, so every APK is listed as a base split
+        self.assertEqual(len(read_apks(self.path("app.apks")).apks), 3)
+
+    def test_unreadable_archives(self):
+        with open(self.path("broken.apks"), "wb") as f:
+            f.write(b"not a zip")
+        with self.assertRaises(ValueError):
+            read_apks(self.path("broken.apks"))
+        with zipfile.ZipFile(self.path("no-manifest.aab"), "w") as aab:
+            aab.writestr("BundleConfig.pb", b"")
+        with self.assertRaises(ValueError):
+            read_aab(self.path("no-manifest.aab"))
+
+
+if __name__ == "__main__":
+    unittest.main()
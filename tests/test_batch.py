@@ -0,0 +1,111 @@
+"""aab_installer.batch: AAB discovery and run_batch with stand-in builds and installs."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from aab_installer import batch, cache
+from aab_installer.parallel import DeviceResult
+from aab_installer.profiles import get_profile
+from benchmarks.fake_tools import make_synthetic_aab, write_jks
+
+
+DEVICES = ["emulator-5554", "emulator-5556"]
+
+
+class DiscoverAabsTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="batch-discover-")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_directory_and_manifests(self):
+        for name in ("b.aab", "a.AAB", "notes.txt"):
+            open(os.path.join(self.root, name), "w").close()
+        self.assertEqual(batch.discover_aabs(self.root),
+                         [os.path.join(self.root, "a.AAB"), os.path.join(self.root, "b.aab")])
+
+        manifest = os.path.join(self.root, "nightly.json")
+        with open(manifest, "w") as f:
+            json.dump(["apps/one.aab", {"aab": "/abs/two.aab"}], f)
+        self.assertEqual(batch.discover_aabs(manifest), [os.path.join(self.root, "apps/one.aab"), "/abs/two.aab"])
+
+        manifest = os.path.join(self.root, "nightly.txt")
+        with open(manifest, "w") as f:
+            f.write("# nightly\none.aab\n\n  two.aab  \n")
+        self.assertEqual(batch.discover_aabs(manifest),
+                         [os.path.join(self.root, "one.aab"), os.path.join(self.root, "two.aab")])
+
+
+class RunBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="batch-run-")
+        self.keystore = write_jks(os.path.join(self.root, "debug.jks"), "key0", "123456", "123456")
+        self.aabs = [make_synthetic_aab(os.path.join(self.root, f"app{index}.aab"), 4096, seed=index)
+                     for index in range(3)]
+        self.installs = []
+        self.lock = threading.Lock()
+        patches = [
+            mock.patch.object(batch, "get_connected_devices", lambda adb: list(DEVICES)),
+            mock.patch.object(batch, "build_apks", self.build_apks),
+            mock.patch.object(batch, "install_on_device", self.install),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def build_apks(self, bundletool_path, aab_path, keystore_path, alias, storepass, keypass, java="java",
+                   profile=None):
+        if aab_path.endswith("app1.aab"):
+            raise RuntimeError("bundletool crashed")
+        apks_path = aab_path[:-4] + ".apks"
+        with open(apks_path, "wb") as f:
+            f.write(b"apks")
+        # pinned like an ApksCache entry
+        return cache.pin(apks_path)
+
+    def install(self, bundletool_path, apks_path, device_id, java, progress=None, cancel=None):
+        with self.lock:
+            self.installs.append((os.path.basename(apks_path), device_id))
+        if (os.path.basename(apks_path), device_id) == ("app2.apks", DEVICES[1]):
+            raise OSError("adb went away")
+        now = time.monotonic()
+        return DeviceResult(device_id, 0, "", "", now, now, apks_path)
+
+    def run_batch(self, **options):
+        return batch.run_batch("bundletool.jar", self.aabs, self.keystore, "key0", "123456", "123456",
+                               build_workers=2, **options)
+
+    def test_a_raising_build_or_install_only_fails_its_cells(self):
+        report = self.run_batch()
+        app0, app1, app2 = self.aabs
+        self.assertFalse(report)
+        self.assertEqual(report.builds, {app0: app0[:-4] + ".apks", app1: None, app2: app2[:-4] + ".apks"})
+        self.assertTrue(all(report.results[app0][device_id].ok for device_id in DEVICES))
+        for device_id in DEVICES:
+            self.assertIn("bundletool crashed", report.results[app1][device_id].stderr)
+        self.assertTrue(report.results[app2][DEVICES[0]].ok)
+        failed = report.results[app2][DEVICES[1]]
+        self.assertEqual((failed.ok, failed.error, failed.stderr), (False, "unknown", "adb went away"))
+        self.assertEqual(sorted(self.installs), sorted((name, device_id) for name in ("app0.apks", "app2.apks")
+                                                       for device_id in DEVICES))
+        # every .apks was released once both devices had it
+        self.assertFalse(set(cache._pins) & {app0[:-4] + ".apks", app2[:-4] + ".apks"})
+
+    def test_per_device_spec_profile_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.run_batch(profile=get_profile("fast-dev"))
+        self.assertEqual(self.installs, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""aab_installer.bundletool runners against the fake java (a warm worker speaking the BundletoolWorker protocol)."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from aab_installer.bundletool import BundletoolRunner, BundletoolWorker, WorkerError, uses_adb
+from aab_installer.process import CANCELLED_RETURNCODE
+from benchmarks.fake_tools import install_fake_tools
+
+
+class UsesAdbTest(unittest.TestCase):
+    def test_adb_commands(self):
+        self.assertTrue(uses_adb(["install-apks", "--apks=app.apks"]))
+        self.assertTrue(uses_adb(["get-device-spec", "--output=spec.json"]))
+        self.assertTrue(uses_adb(["build-apks", "--bundle=app.aab", "--connected-device"]))
+        self.assertTrue(uses_adb(["build-apks", "--bundle=app.aab", "--device-id=emulator-5554"]))
+        self.assertFalse(uses_adb(["build-apks", "--bundle=app.aab", "--device-spec=spec.json"]))
+        self.assertFalse(uses_adb(["version"]))
+        self.assertFalse(uses_adb([]))
+
+
+class BundletoolRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.tools = install_fake_tools()
+        self.java = os.path.join(self.tools, "java")
+        self.work = tempfile.mkdtemp(prefix="bundletool-runner-")
+        self.jar = os.path.join(self.work, "bundletool.jar")
+        open(self.jar, "wb").close()
+        self.runner = BundletoolRunner(self.jar, self.java, pool_size=1)
+
+    def tearDown(self):
+        self.runner.close()
+        shutil.rmtree(self.tools, ignore_errors=True)
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def test_commands_reuse_one_worker(self):
+        lines = []
+        for _ in range(3):
+            result = self.runner.run(["version"], on_line=lambda stream, line: lines.append((stream, line)))
+            self.assertEqual((result.returncode, result.stdout), (0, b"1.15.6\n"))
+        self.assertEqual(lines, [("stdout", "1.15.6")] * 3)
+        self.assertEqual(self.runner._started, 1)
+        self.assertEqual(len(self.runner._idle), 1)
+
+    def test_adb_commands_skip_the_worker(self):
+        for device_id in ("emulator-5554", "emulator-5556"):
+            result = self.runner.run(["install-apks", "--apks=app.apks", f"--device-id={device_id}"])
+            # a worker would close its adb bridge after the first install
+            self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(self.runner._started, 0)
+
+    def test_arguments_the_worker_cannot_carry_use_a_subprocess(self):
+        result = self.runner.run(["version", "--comment=two\nlines"])
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, b"1.15.6\n")
+
+    def test_no_workers(self):
+        runner = BundletoolRunner(self.jar, self.java, pool_size=0)
+        self.assertEqual(runner.run(["version"]).stdout, b"1.15.6\n")
+        self.assertEqual(runner._started, 0)
+
+    def test_cancelled_before_start(self):
+        cancel = threading.Event()
+        cancel.set()
+        result = self.runner.run(["version"], cancel=cancel)
+        self.assertEqual((result.returncode, result.stderr), (CANCELLED_RETURNCODE, b"cancelled"))
+
+    def test_worker_that_cannot_start(self):
+        worker = BundletoolWorker(self.jar, os.path.join(self.work, "no-such-java"))
+        with self.assertRaises(WorkerError):
+            worker.start()
+        with self.assertRaises(WorkerError):
+            worker.run(["version"])
+
+
+if __name__ == "__main__":
+    unittest.main()
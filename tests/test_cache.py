@@ -0,0 +1,128 @@
+"""aab_installer.cache: keys, pinned entries and least-recently-used eviction."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from aab_installer import cache
+from aab_installer.cache import ApksCache, release
+
+
+ENTRY_BYTES = 1000
+
+
+class ApksCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="apks-cache-")
+        # room for three entries; the disk check never triggers
+        self.cache = ApksCache(self.root, max_bytes=3 * ENTRY_BYTES, min_free_bytes=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def add(self, key, age=0):
+        """Commit an entry of ENTRY_BYTES and release its pin; `age` seconds ago it was last used."""
+        built = self.cache.temp_path()
+        with open(built, "wb") as f:
+            f.write(b"x" * ENTRY_BYTES)
+        path = self.cache.commit(key, built)
+        release(path)
+        used = time.time() - age
+        os.utime(path, (used, used))
+        return path
+
+    def test_key_covers_inputs_and_flags(self):
+        paths = []
+        for name, content in (("app.aab", b"aab"), ("bundletool.jar", b"jar"), ("debug.jks", b"jks")):
+            paths.append(os.path.join(self.root, name))
+            with open(paths[-1], "wb") as f:
+                f.write(content)
+        key = self.cache.key(*paths, "key0")
+        self.assertEqual(key, self.cache.key(*paths, "key0"))
+        self.assertNotEqual(key, self.cache.key(*paths, "key1"))
+        self.assertEqual(self.cache.key(*paths, "key0", ["--mode=universal", "--local-testing"]),
+                         self.cache.key(*paths, "key0", ["--local-testing", "--mode=universal"]))
+        self.assertNotEqual(key, self.cache.key(*paths, "key0", ["--local-testing"]))
+
+    def test_get_pins_until_release(self):
+        self.assertIsNone(self.cache.get("missing"))
+        path = self.add("a")
+        self.assertNotIn(path, cache._pins)
+        self.assertEqual(self.cache.get("a"), path)
+        self.assertEqual(self.cache.get("a"), path)
+        self.assertEqual(cache._pins[path], 2)
+        release(path)
+        release(path)
+        self.assertNotIn(path, cache._pins)
+        release(None)
+
+    def test_evicts_least_recently_used(self):
+        oldest, middle, newest = self.add("a", age=30), self.add("b", age=20), self.add("c", age=10)
+        # a hit makes the oldest entry the most recent
+        release(self.cache.get("a"))
+        self.add("d")
+        self.assertTrue(os.path.exists(oldest))
+        self.assertFalse(os.path.exists(middle))
+        self.assertTrue(os.path.exists(newest))
+
+    def test_pinned_entries_are_kept_but_counted(self):
+        oldest = self.add("a")
+        pinned = self.cache.get("a")
+        try:
+            used = time.time() - 30
+            os.utime(oldest, (used, used))
+            middle = self.add("b", age=20)
+            self.add("c", age=10)
+            self.add("d")
+            self.assertTrue(os.path.exists(oldest))
+            self.assertFalse(os.path.exists(middle))
+        finally:
+            release(pinned)
+        self.add("e")
+        self.assertFalse(os.path.exists(oldest))
+
+    def test_make_room_evicts_for_the_space_a_build_needs(self):
+        # a 3500-byte disk holding only the cache
+        self.cache.max_bytes = 10 * ENTRY_BYTES
+        self.cache.free_bytes = lambda: 3500 - sum(size for _, size, _ in self.cache._entries())
+        oldest, middle, newest = self.add("a", age=30), self.add("b", age=20), self.add("c", age=10)
+        pinned = self.cache.get("b")
+        try:
+            self.assertTrue(self.cache.make_room(1200))
+            self.assertFalse(os.path.exists(oldest))
+            self.assertTrue(os.path.exists(middle) and os.path.exists(newest))
+            # the pinned entry stays even when that is not enough
+            self.assertFalse(self.cache.make_room(2600))
+            self.assertTrue(os.path.exists(middle))
+            self.assertFalse(os.path.exists(newest))
+        finally:
+            release(pinned)
+
+    def test_extracted_entries(self):
+        self.assertIsNone(self.cache.get_extracted("spec"))
+        built = self.cache.temp_dir()
+        with open(os.path.join(built, "base-master.apk"), "wb") as f:
+            f.write(b"apk")
+        path = self.cache.commit_extracted("spec", built)
+        self.assertTrue(os.path.isfile(os.path.join(path, "base-master.apk")))
+        self.assertEqual(self.cache.get_extracted("spec"), path)
+        self.assertEqual(cache._pins[path], 2)
+        release(path)
+        release(path)
+
+    def test_stale_tmp_files_are_removed(self):
+        stale = self.cache.temp_path()
+        open(stale, "wb").close()
+        old = time.time() - cache.STALE_SECONDS - 60
+        os.utime(stale, (old, old))
+        fresh = self.cache.temp_path()
+        open(fresh, "wb").close()
+        self.cache.evict()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""`python -m aab_installer` end to end with the fake adb, java and keytool."""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from benchmarks.fake_tools import fake_env, install_fake_tools, make_synthetic_aab, write_jks
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMEOUT = 60
+
+
+class CliTest(unittest.TestCase):
+    def setUp(self):
+        self.tools = install_fake_tools()
+        self.work = tempfile.mkdtemp(prefix="aab-installer-cli-")
+        self.aab = make_synthetic_aab(os.path.join(self.work, "app.aab"), 64 * 1024)
+        self.keystore = write_jks(os.path.join(self.work, "debug.jks"), "key0", "123456", "123456")
+        self.bundletool = os.path.join(self.work, "bundletool.jar")
+        open(self.bundletool, "wb").close()
+        self.env = fake_env(self.tools, adb_devices=2, device_state=os.path.join(self.work, "devices"))
+        self.env.update(PYTHONPATH=ROOT, HOME=self.work, ANDROID_ADB_SERVER_PORT="1",
+                        AAB_INSTALLER_CACHE=os.path.join(self.work, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tools, ignore_errors=True)
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def run_cli(self, *args):
+        return subprocess.run([sys.executable, "-m", "aab_installer", *args], env=self.env, cwd=self.work,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=TIMEOUT)
+
+    def install(self, *args):
+        result = self.run_cli("install", "--bundletool", self.bundletool, "--keystore", self.keystore,
+                              "--alias", "key0", "--json", *args, self.aab)
+        stdout = result.stdout.decode()
+        # the report is the last thing printed
+        return result.returncode, json.loads(stdout[stdout.rindex("\n{\n") + 1:])
+
+    def test_devices(self):
+        result = self.run_cli("devices")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.decode().split(), ["emulator-5554", "emulator-5556"])
+
+    def test_install_then_skip_up_to_date_devices(self):
+        returncode, report = self.install()
+        self.assertEqual(returncode, 0)
+        self.assertTrue(report["ok"])
+        self.assertEqual([device["device_id"] for device in report["devices"]], ["emulator-5554", "emulator-5556"])
+        self.assertFalse(any(device["skipped"] for device in report["devices"]))
+
+        returncode, again = self.install()
+        self.assertEqual(returncode, 0)
+        self.assertEqual(again["apks"], report["apks"])
+        self.assertTrue(all(device["skipped"] for device in again["devices"]))
+
+        returncode, forced = self.install("--reinstall")
+        self.assertEqual(returncode, 0)
+        self.assertFalse(any(device["skipped"] for device in forced["devices"]))
+
+    def test_missing_bundletool(self):
+        self.env.pop("BUNDLETOOL_PATH", None)
+        result = self.run_cli("install", self.aab)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn(b"--bundletool", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""InstallDaemon rebuild decisions, with stand-in preflight and builds."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from aab_installer import cache, daemon
+from aab_installer.preflight import PreflightReport
+from aab_installer.retry import RetryPolicy
+
+
+BACKOFF = 0.2
+
+
+class RebuildTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="install-daemon-")
+        self.aab = os.path.join(self.root, "app.aab")
+        self.write_aab(b"v1")
+        self.builds = []
+        self.build_ok = False
+        patches = [
+            mock.patch.object(daemon, "BUILD_RETRY", RetryPolicy(backoff=BACKOFF, max_backoff=BACKOFF * 4)),
+            mock.patch.object(daemon, "preflight", lambda *args: PreflightReport()),
+            mock.patch.object(daemon, "build_apks", self.build_apks),
+            mock.patch.object(daemon, "read_bundle_identity", lambda *args: ("com.example.fake", 1)),
+            mock.patch.object(daemon, "apks_digests", lambda apks_path: {}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.daemon = daemon.InstallDaemon("bundletool.jar", self.aab, "debug.jks", "key0", "123456", "123456",
+                                           monitor=object())
+
+    def tearDown(self):
+        self.daemon._pool.shutdown()
+        if self.daemon.build is not None:
+            cache.release(self.daemon.build["apks"])
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write_aab(self, content):
+        with open(self.aab, "wb") as f:
+            f.write(content)
+
+    def build_apks(self, *args, **kwargs):
+        self.builds.append(time.monotonic())
+        if not self.build_ok:
+            return None
+        apks_path = os.path.join(self.root, f"build{len(self.builds)}.apks")
+        open(apks_path, "wb").close()
+        return cache.pin(apks_path)
+
+    def test_builds_once_the_aab_is_stable(self):
+        self.build_ok = True
+        self.assertFalse(self.daemon._maybe_rebuild())
+        self.assertTrue(self.daemon._maybe_rebuild())
+        first = self.daemon.build["apks"]
+        self.assertFalse(self.daemon._maybe_rebuild())
+        self.assertEqual(len(self.builds), 1)
+
+        self.write_aab(b"v2, longer")
+        self.assertFalse(self.daemon._maybe_rebuild())
+        self.assertTrue(self.daemon._maybe_rebuild())
+        self.assertNotEqual(self.daemon.build["apks"], first)
+        # the replaced build is no longer pinned by the daemon
+        self.assertNotIn(first, cache._pins)
+
+    def test_failed_build_backs_off(self):
+        self.daemon._maybe_rebuild()
+        self.assertFalse(self.daemon._maybe_rebuild())
+        for _ in range(5):
+            self.assertFalse(self.daemon._maybe_rebuild())
+        self.assertEqual(len(self.builds), 1)
+
+        time.sleep(BACKOFF + 0.05)
+        self.daemon._maybe_rebuild()
+        self.assertEqual(len(self.builds), 2)
+        self.assertEqual(self.daemon._build_failures, 2)
+
+    def test_changed_aab_is_built_at_once(self):
+        self.daemon._maybe_rebuild()
+        self.daemon._maybe_rebuild()
+        self.assertEqual(len(self.builds), 1)
+
+        self.build_ok = True
+        self.write_aab(b"v2, longer")
+        self.assertFalse(self.daemon._maybe_rebuild())
+        self.assertTrue(self.daemon._maybe_rebuild())
+        self.assertEqual(len(self.builds), 2)
+        self.assertIsNone(self.daemon._failed_signature)
+
+
+if __name__ == "__main__":
+    unittest.main()
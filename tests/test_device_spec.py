@@ -0,0 +1,58 @@
+"""aab_installer.device_spec grouping, with the fake bundletool's get-device-spec."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from aab_installer.device_spec import group_devices_by_spec, normalize_spec, spec_digest
+from benchmarks.fake_tools import install_fake_tools
+
+
+SPEC = {"supportedAbis": ["arm64-v8a"], "supportedLocales": ["en-US"], "screenDensity": 420, "sdkVersion": 33}
+
+
+class SpecDigestTest(unittest.TestCase):
+    def test_only_matching_fields_count(self):
+        branded = dict(SPEC, buildBrand="pixel", buildApiLevelFull="33.0")
+        self.assertEqual(normalize_spec(branded), SPEC)
+        self.assertEqual(spec_digest(branded), spec_digest(SPEC))
+        self.assertEqual(spec_digest(dict(reversed(list(SPEC.items())))), spec_digest(SPEC))
+        self.assertNotEqual(spec_digest(dict(SPEC, screenDensity=480)), spec_digest(SPEC))
+
+
+class GroupDevicesTest(unittest.TestCase):
+    def setUp(self):
+        self.tools = install_fake_tools()
+        self.output = tempfile.mkdtemp(prefix="device-specs-")
+        self.bundletool = os.path.join(self.output, "bundletool.jar")
+        open(self.bundletool, "wb").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tools, ignore_errors=True)
+        shutil.rmtree(self.output, ignore_errors=True)
+
+    def test_devices_with_the_same_spec_share_a_group(self):
+        device_ids = ["emulator-5554", "emulator-5556", "emulator-5558"]
+        with mock.patch.dict(os.environ, FAKE_SPEC_VARIANTS="2"):
+            groups = group_devices_by_spec(self.bundletool, device_ids, self.output,
+                                           java=os.path.join(self.tools, "java"))
+        self.assertEqual(sorted(devices for _, _, devices in groups),
+                         [["emulator-5554", "emulator-5558"], ["emulator-5556"]])
+        for spec_path, digest, _ in groups:
+            self.assertTrue(os.path.isfile(spec_path))
+            self.assertIn(digest[:16], spec_path)
+
+    def test_unreadable_specs_go_last(self):
+        def fetch(bundletool_path, device_id, output_dir, java="java"):
+            return None if device_id == "offline" else SPEC
+
+        with mock.patch("aab_installer.device_spec.fetch_device_spec", fetch):
+            groups = group_devices_by_spec(self.bundletool, ["a", "offline", "b"], self.output)
+        self.assertEqual([devices for _, _, devices in groups], [["a", "b"], ["offline"]])
+        self.assertEqual(groups[-1][:2], (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
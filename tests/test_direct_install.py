@@ -0,0 +1,75 @@
+"""aab_installer.direct_install: the device spec from getprop / wm and the splits picked for it."""
+
+import unittest
+
+from aab_installer.archive import ApkEntry, ApksInfo
+from aab_installer.direct_install import parse_sections, select_apks, spec_from_sections
+
+
+SPEC = {"sdkVersion": 33, "supportedAbis": ["arm64-v8a", "armeabi-v7a"], "screenDensity": 420,
+        "supportedLocales": ["de-DE"]}
+
+
+def apk(path, module="base", abis=(), languages=(), densities=(), variant=0, variant_min_sdk=21, standalone=False):
+    return ApkEntry(path, module, "", not (abis or languages or densities), list(abis), list(languages),
+                    list(densities), None, 1, variant, variant_min_sdk, standalone)
+
+
+def info(apks, modules=None):
+    return ApksInfo("app.apks", "com.example.app", 1, "1.0", 21, apks, modules or {"base": "install-time"})
+
+
+def paths(apks):
+    return sorted(apk.path for apk in apks) if apks is not None else None
+
+
+class SelectApksTest(unittest.TestCase):
+    def test_master_abi_language_and_closest_density(self):
+        apks = [apk("base-master.apk"), apk("base-arm64_v8a.apk", abis=["arm64-v8a"]),
+                apk("base-armeabi_v7a.apk", abis=["armeabi-v7a"]), apk("base-de.apk", languages=["de"]),
+                apk("base-fr.apk", languages=["fr"]), apk("base-xhdpi.apk", densities=["xhdpi"]),
+                apk("base-xxhdpi.apk", densities=["xxhdpi"]), apk("base-xxxhdpi.apk", densities=["xxxhdpi"])]
+        self.assertEqual(paths(select_apks(info(apks), SPEC)),
+                         ["base-arm64_v8a.apk", "base-de.apk", "base-master.apk", "base-xxhdpi.apk"])
+
+    def test_density_falls_back_to_the_highest(self):
+        apks = [apk("base-master.apk"), apk("base-hdpi.apk", densities=["hdpi"]),
+                apk("base-xhdpi.apk", densities=["xhdpi"])]
+        self.assertEqual(paths(select_apks(info(apks), SPEC)), ["base-master.apk", "base-xhdpi.apk"])
+
+    def test_highest_supported_variant_and_install_time_modules(self):
+        apks = [apk("old/base-master.apk", variant=0, variant_min_sdk=21),
+                apk("new/base-master.apk", variant=1, variant_min_sdk=31),
+                apk("future/base-master.apk", variant=2, variant_min_sdk=34),
+                apk("new/feature-master.apk", module="feature", variant=1, variant_min_sdk=31),
+                apk("standalone.apk", variant=3, standalone=True)]
+        modules = {"base": "install-time", "feature": "on-demand"}
+        self.assertEqual(paths(select_apks(info(apks, modules), SPEC)), ["new/base-master.apk"])
+
+    def test_unsure(self):
+        cases = {
+            "no split variant": [apk("standalone.apk", standalone=True)],
+            "no matching ABI": [apk("base-master.apk"), apk("base-x86.apk", abis=["x86"])],
+            "unknown density": [apk("base-master.apk"), apk("base-odd.apk", densities=["unknown"])],
+        }
+        for name, apks in cases.items():
+            with self.subTest(name):
+                self.assertIsNone(select_apks(info(apks), SPEC))
+
+
+class DeviceSpecTest(unittest.TestCase):
+    def test_spec_from_the_probe_output(self):
+        output = ("@sdk\n33\n@abis\narm64-v8a,armeabi-v7a\n@density\nPhysical density: 440\n"
+                  "Override density: 400\n@locales\nen-US\n")
+        self.assertEqual(spec_from_sections(parse_sections(output)), {
+            "sdkVersion": 33, "supportedAbis": ["arm64-v8a", "armeabi-v7a"], "screenDensity": 400,
+            "supportedLocales": ["en-US"],
+        })
+
+    def test_incomplete_output(self):
+        self.assertIsNone(spec_from_sections(parse_sections("@sdk\n\n@density\nPhysical density: 440\n")))
+        self.assertIsNone(spec_from_sections(parse_sections("@sdk\n33\n@density\n")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""The benchmark fakes: `adb devices`, `bundletool build-apks` and the synthetic AAB."""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import zipfile
+
+from benchmarks.fake_tools import fake_env, install_fake_tools, make_synthetic_aab
+
+
+TIMEOUT = 30
+
+
+class FakeToolsTest(unittest.TestCase):
+    def setUp(self):
+        self.tools = install_fake_tools()
+        self.work = tempfile.mkdtemp(prefix="fake-tools-")
+        self.aab = make_synthetic_aab(os.path.join(self.work, "app.aab"), 4096, seed=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tools, ignore_errors=True)
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def run_tool(self, name, *args, **settings):
+        return subprocess.run([os.path.join(self.tools, name), *args], env=fake_env(self.tools, **settings),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=TIMEOUT)
+
+    def build(self, *args, **settings):
+        output = os.path.join(self.work, "app.apks")
+        result = self.run_tool("java", "-jar", "bundletool.jar", "build-apks", f"--bundle={self.aab}",
+                               f"--output={output}", *args, **settings)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with zipfile.ZipFile(output) as apks:
+            return sorted(apks.namelist())
+
+    def test_synthetic_aab(self):
+        with zipfile.ZipFile(self.aab) as aab:
+            self.assertEqual(sorted(aab.namelist()), ["BundleConfig.pb", "base/dex/classes.dex",
+                                                      "base/manifest/AndroidManifest.xml"])
+            self.assertEqual(len(aab.read("base/dex/classes.dex")), 4096)
+
+    def test_adb_devices(self):
+        result = self.run_tool("adb", "devices", adb_devices=3)
+        self.assertEqual(result.stdout.decode().split("\n")[1:4],
+                         ["emulator-5554\tdevice", "emulator-5556\tdevice", "emulator-5558\tdevice"])
+
+    def test_build_apks_layouts(self):
+        self.assertEqual(self.build(splits=3), ["splits/base-config0.apk", "splits/base-config1.apk",
+                                                "splits/base-config2.apk", "splits/base-master.apk", "toc.pb"])
+        self.assertEqual(self.build("--device-spec=spec.json", splits=3),
+                         ["splits/base-config0.apk", "splits/base-master.apk", "toc.pb"])
+        self.assertEqual(self.build("--mode=universal"), ["toc.pb", "universal.apk"])
+
+    def test_unsupported_command_fails(self):
+        result = self.run_tool("java", "-jar", "bundletool.jar", "no-such-command")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(b"unsupported command", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""aab_installer.farm endpoints and device discovery over two fake adb servers."""
+
+import unittest
+from unittest import mock
+
+from aab_installer import farm
+from aab_installer.adb_monitor import ADB_PORT
+from aab_installer.farm import AdbEndpoint, discover_devices, install_on_farm, split_device_name
+from aab_installer.parallel import DeviceResult
+from benchmarks.fake_adb_server import FakeAdbServer
+
+
+class AdbEndpointParseTest(unittest.TestCase):
+    def test_host_port_and_bandwidth(self):
+        endpoint = AdbEndpoint.parse("rack-2:5038@40")
+        self.assertEqual((endpoint.host, endpoint.port, endpoint.bandwidth), ("rack-2", 5038, 40.0))
+        self.assertFalse(endpoint.local)
+
+    def test_defaults(self):
+        endpoint = AdbEndpoint.parse("rack-2")
+        self.assertEqual((endpoint.host, endpoint.port, endpoint.bandwidth), ("rack-2", ADB_PORT, None))
+        self.assertEqual(AdbEndpoint.parse(":5038").host, "127.0.0.1")
+
+    def test_ipv6_in_brackets(self):
+        endpoint = AdbEndpoint.parse("[::1]:5038@20")
+        self.assertEqual((endpoint.host, endpoint.port, endpoint.bandwidth), ("::1", 5038, 20.0))
+        self.assertTrue(endpoint.local)
+        self.assertEqual(endpoint.name, "[::1]:5038")
+        self.assertEqual(split_device_name(f"{endpoint.name}/emulator-5554"), ("[::1]:5038", "emulator-5554"))
+        self.assertEqual(AdbEndpoint.parse("[fe80::2]").port, ADB_PORT)
+
+    def test_rejects_bad_addresses(self):
+        for text in ("::1", "fe80::2:5037", "[::1", "[::1]5037", "rack-2:port", "rack-2:5037@fast"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                AdbEndpoint.parse(text)
+
+
+class DiscoverDevicesTest(unittest.TestCase):
+    def setUp(self):
+        self.servers = [
+            FakeAdbServer({"emulator-5554": "device", "emulator-5556": "offline"}).start(),
+            FakeAdbServer({"emulator-5554": "device", "R58M123": "device"}).start(),
+        ]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def test_devices_of_both_servers(self):
+        first, second = (AdbEndpoint.parse(f"127.0.0.1:{server.port}") for server in self.servers)
+        self.assertNotEqual(first.port, second.port)
+        self.assertEqual(discover_devices([first, second]), [
+            f"127.0.0.1:{first.port}/emulator-5554",
+            f"127.0.0.1:{second.port}/R58M123",
+            f"127.0.0.1:{second.port}/emulator-5554",
+        ])
+
+    def test_unreachable_server_is_skipped(self):
+        endpoint = AdbEndpoint.parse(f"127.0.0.1:{self.servers[0].port}")
+        self.servers[1].stop()
+        unreachable = AdbEndpoint.parse(f"127.0.0.1:{self.servers[1].port}")
+        self.assertEqual(discover_devices([endpoint, unreachable]), [f"127.0.0.1:{endpoint.port}/emulator-5554"])
+
+
+class InstallOnFarmTest(unittest.TestCase):
+    def setUp(self):
+        self.endpoints = [AdbEndpoint.parse("rack-1:5037@60"), AdbEndpoint.parse("rack-2:5037")]
+        self.device_ids = ["rack-1:5037/a", "rack-2:5037/b", "rack-1:5037/c"]
+        patch = mock.patch.object(farm, "install_on_devices", self.install_on_devices)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.pools = {}
+
+    def install_on_devices(self, bundletool_path, apks_path, device_ids, max_workers, java, install, progress,
+                           cancel, retry):
+        self.pools[split_device_name(device_ids[0])[0]] = (device_ids, max_workers)
+        return farm.InstallReport(apks_path, [DeviceResult(device_id, 0, "", "", 0.0, 1.0, apks_path)
+                                              for device_id in device_ids], 1.0, max_workers)
+
+    def test_devices_go_to_their_host_with_its_pool_size(self):
+        report = install_on_farm("bundletool.jar", "app.apks", self.device_ids, self.endpoints, max_workers=4)
+        self.assertTrue(report)
+        self.assertEqual(self.pools, {"rack-1:5037": (["rack-1:5037/a", "rack-1:5037/c"], 2),
+                                      "rack-2:5037": (["rack-2:5037/b"], 4)})
+        self.assertEqual(sorted(device.device_id for device in report.results), sorted(self.device_ids))
+
+    def test_a_raising_host_only_fails_its_devices(self):
+        real_install_on_host = farm.install_on_host
+
+        def install_on_host(bundletool_path, apks_path, endpoint, serials, *args):
+            if endpoint.host == "rack-2":
+                raise ConnectionRefusedError("adb server gone")
+            return real_install_on_host(bundletool_path, apks_path, endpoint, serials, *args)
+
+        with mock.patch.object(farm, "install_on_host", install_on_host):
+            report = install_on_farm("bundletool.jar", "app.apks", self.device_ids, self.endpoints, max_workers=4)
+        results = {device.device_id: device for device in report.results}
+        self.assertTrue(results["rack-1:5037/a"].ok and results["rack-1:5037/c"].ok)
+        failed = results["rack-2:5037/b"]
+        self.assertEqual((failed.ok, failed.error, failed.stderr), (False, "unknown", "adb server gone"))
+
+
+if __name__ == "__main__":
+    unittest.main()
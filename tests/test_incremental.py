@@ -0,0 +1,83 @@
+"""aab_installer.incremental: choosing the changed splits and extracting them through the cache."""
+
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from aab_installer import cache, incremental
+from aab_installer.cache import ApksCache
+from aab_installer.incremental import changed_apks, extract_device_apks
+from benchmarks.fake_tools import install_fake_tools
+
+
+class ChangedApksTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="changed-apks-")
+        self.paths = []
+        for name, data in (("base-master.apk", b"base v2"), ("base-xxhdpi.apk", b"dpi")):
+            self.paths.append(os.path.join(self.root, name))
+            with open(self.paths[-1], "wb") as f:
+                f.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def installed(self, *contents):
+        return {"version_code": 1, "apks": {hashlib.sha256(data).hexdigest() for data in contents}}
+
+    def test_only_changed_splits(self):
+        self.assertEqual(changed_apks(self.paths, self.installed(b"base v1", b"dpi")), [self.paths[0]])
+        self.assertEqual(changed_apks(self.paths, self.installed(b"base v2", b"dpi")), [])
+
+    def test_split_set_changed(self):
+        self.assertIsNone(changed_apks(self.paths, self.installed(b"base v1")))
+        self.assertIsNone(changed_apks(self.paths, self.installed(b"base v1", b"dpi", b"abi")))
+        self.assertIsNone(changed_apks(self.paths, self.installed()))
+
+
+class ExtractDeviceApksTest(unittest.TestCase):
+    def setUp(self):
+        self.tools = install_fake_tools()
+        self.root = tempfile.mkdtemp(prefix="extract-apks-")
+        self.bundletool = os.path.join(self.root, "bundletool.jar")
+        open(self.bundletool, "wb").close()
+        self.apks = os.path.join(self.root, "app.apks")
+        with zipfile.ZipFile(self.apks, "w") as apks:
+            apks.writestr("toc.pb", b"")
+            apks.writestr("splits/base-master.apk", b"base")
+            apks.writestr("splits/base-config0.apk", b"config")
+        patch = mock.patch.object(incremental, "ApksCache",
+                                  functools.partial(ApksCache, os.path.join(self.root, "cache")))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tools, ignore_errors=True)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def extract(self, device_id):
+        output_dir = os.path.join(self.root, device_id)
+        os.mkdir(output_dir)
+        return extract_device_apks(self.bundletool, self.apks, device_id, output_dir,
+                                   java=os.path.join(self.tools, "java"))
+
+    def test_devices_with_one_spec_share_the_extraction(self):
+        first = self.extract("emulator-5554")
+        second = self.extract("emulator-5556")
+        self.assertEqual([os.path.basename(path) for path in first], ["base-config0.apk", "base-master.apk"])
+        self.assertEqual([os.path.basename(path) for path in second], ["base-config0.apk", "base-master.apk"])
+        with open(second[1], "rb") as f:
+            self.assertEqual(f.read(), b"base")
+        extracted = os.listdir(os.path.join(self.root, "cache", "extracted"))
+        self.assertEqual(len(extracted), 1)
+        # the links are made, so the extraction may be evicted
+        self.assertNotIn(os.path.join(self.root, "cache", "extracted", extracted[0]), cache._pins)
+
+
+if __name__ == "__main__":
+    unittest.main()
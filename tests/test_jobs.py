@@ -0,0 +1,73 @@
+"""aab_installer.jobs.JobScheduler ordering, cancellation and cleanup."""
+
+import threading
+import unittest
+
+from aab_installer.jobs import CANCELLED, DONE, FAILED, JobScheduler
+
+
+TIMEOUT = 5.0
+
+
+class JobSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.ended = threading.Condition()
+        self.cleaned = []
+        self.scheduler = JobScheduler()
+
+    def cleanup(self, job):
+        with self.ended:
+            self.cleaned.append(job.job_id)
+            self.ended.notify_all()
+
+    def wait_cleaned(self, *job_ids):
+        with self.ended:
+            self.assertTrue(self.ended.wait_for(lambda: set(job_ids) <= set(self.cleaned), TIMEOUT), self.cleaned)
+
+    def test_jobs_on_the_same_device_run_in_order(self):
+        release = threading.Event()
+        order = []
+
+        def run(name):
+            def work(job):
+                order.append(name)
+                if name == "first":
+                    release.wait(TIMEOUT)
+                return True
+            return work
+
+        first = self.scheduler.submit("first", run("first"), devices=["emulator-5554"], cleanup=self.cleanup)
+        second = self.scheduler.submit("second", run("second"), devices=["emulator-5554"], cleanup=self.cleanup)
+        other = self.scheduler.submit("other", run("other"), devices=["emulator-5556"], cleanup=self.cleanup)
+        self.wait_cleaned(other.job_id)
+        self.assertNotIn("second", order)
+        release.set()
+        self.wait_cleaned(first.job_id, second.job_id)
+        self.assertLess(order.index("first"), order.index("second"))
+        self.assertEqual([first.state, second.state, other.state], [DONE, DONE, DONE])
+
+    def test_cleanup_runs_for_a_job_cancelled_while_queued(self):
+        release = threading.Event()
+        ran = []
+        blocker = self.scheduler.submit("blocker", lambda job: release.wait(TIMEOUT), devices=["emulator-5554"],
+                                        cleanup=self.cleanup)
+        queued = self.scheduler.submit("queued", lambda job: ran.append(job), devices=["emulator-5554"],
+                                       cleanup=self.cleanup)
+        self.scheduler.cancel(queued.job_id)
+        self.wait_cleaned(queued.job_id)
+        self.assertEqual(queued.state, CANCELLED)
+        self.assertEqual(ran, [])
+        release.set()
+        self.wait_cleaned(blocker.job_id)
+
+    def test_cleanup_runs_after_a_failure(self):
+        def fail(job):
+            raise RuntimeError("boom")
+
+        job = self.scheduler.submit("failing", fail, devices=[], cleanup=self.cleanup)
+        self.wait_cleaned(job.job_id)
+        self.assertEqual((job.state, job.error), (FAILED, "boom"))
+
+
+if __name__ == "__main__":
+    unittest.main()
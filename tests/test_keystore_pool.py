@@ -0,0 +1,77 @@
+"""aab_installer.keystore_pool with the fake keytool, across threads and processes."""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from aab_installer import keystore_pool
+from aab_installer.keystore_pool import KeystorePool
+from benchmarks.fake_tools import install_fake_tools
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CURRENT_SCRIPT = "import sys; from aab_installer.keystore_pool import KeystorePool; " \
+                 "print(KeystorePool(sys.argv[1], keytool=sys.argv[2]).current(prefill=False)[0])"
+
+
+class KeystorePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tools = install_fake_tools()
+        self.keytool = os.path.join(self.tools, "keytool")
+        self.root = tempfile.mkdtemp(prefix="keystore-pool-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tools, ignore_errors=True)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def pool(self):
+        return KeystorePool(self.root, keytool=self.keytool)
+
+    def test_threads_with_their_own_pools_share_one_key(self):
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            keys = list(executor.map(lambda _: self.pool().current(prefill=False), range(6)))
+        self.assertEqual(len(set(keys)), 1)
+        index = self.pool()._load()
+        self.assertEqual(index["current"]["path"], keys[0][0])
+        # keys generated by the losers of the race are kept as spares
+        self.assertTrue(all(os.path.exists(key["path"]) for key in index["spares"]))
+
+    def test_processes_share_one_key(self):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        processes = [subprocess.Popen([sys.executable, "-c", CURRENT_SCRIPT, self.root, self.keytool], env=env,
+                                      stdout=subprocess.PIPE) for _ in range(4)]
+        paths = {process.communicate()[0].decode().strip() for process in processes}
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(self.pool()._load()["current"]["path"], paths.pop())
+
+    def test_rotated_key_is_deleted_after_the_grace_period(self):
+        pool = self.pool()
+        old_path, _ = pool.current(prefill=False)
+        new_path, _ = pool.rotate(prefill=False)
+        self.assertNotEqual(old_path, new_path)
+        # a build that started before the rotation can still read it
+        self.assertTrue(os.path.exists(old_path))
+        self.assertEqual(pool.current(prefill=False)[0], new_path)
+        self.assertTrue(os.path.exists(old_path))
+
+        with mock.patch.object(keystore_pool, "RETIRED_GRACE", -1):
+            self.assertEqual(pool.current(prefill=False)[0], new_path)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(pool._load()["retired"], [])
+
+    def test_prefill_tops_up_spares(self):
+        pool = KeystorePool(self.root, spares=2, keytool=self.keytool)
+        pool.current(prefill=False)
+        pool.prefill()
+        spares = pool._load()["spares"]
+        self.assertEqual(len(spares), 2)
+        self.assertEqual(pool.rotate(prefill=False)[0], spares[0]["path"])
+
+
+if __name__ == "__main__":
+    unittest.main()
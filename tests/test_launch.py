@@ -0,0 +1,78 @@
+"""aab_installer.launch: `am start -W` parsing and the cold / hot start samples of a device."""
+
+import unittest
+from unittest import mock
+
+from aab_installer import launch
+from aab_installer.launch import measure_device, measure_startup, parse_start
+
+
+COMPONENT = "com.example.app/.MainActivity"
+
+
+def start(total, wait, state=None):
+    lines = ["Status: ok", f"Activity: {COMPONENT}", f"TotalTime: {total}", f"WaitTime: {wait}", "Complete"]
+    if state:
+        lines.insert(2, f"LaunchState: {state}")
+    return "\n".join(lines)
+
+
+def iteration(cold, hot):
+    return f"@cold\n{cold}\n@hot\n{hot}\n"
+
+
+class ParseStartTest(unittest.TestCase):
+    def test_times_and_launch_state(self):
+        self.assertEqual(parse_start(start(612, 630, "COLD").splitlines()), (612, 630, "COLD"))
+        self.assertEqual(parse_start(start(95, 101).splitlines()), (95, 101, None))
+        # Android 9 and older print ThisTime as well; some builds print no WaitTime
+        self.assertEqual(parse_start(["ThisTime: 80", "Status: ok"]), (80, None, None))
+
+    def test_not_started(self):
+        self.assertIsNone(parse_start(["Error: Activity class {com.example.app/.Gone} does not exist."]))
+        self.assertIsNone(parse_start([]))
+
+
+class MeasureDeviceTest(unittest.TestCase):
+    def measure(self, *outputs, iterations=None):
+        with mock.patch.object(launch, "_shell", side_effect=[(0, output) for output in outputs]) as shell:
+            stats = measure_device("emulator-5554", "com.example.app", iterations or len(outputs) - 1)
+        return stats, shell
+
+    def test_cold_and_hot_samples(self):
+        stats, shell = self.measure(COMPONENT + "\n", iteration(start(600, 620, "COLD"), start(90, 95, "HOT")),
+                                    iteration(start(640, 650, "COLD"), start(100, 104, "HOT")))
+        self.assertTrue(stats.ok)
+        self.assertEqual(stats.component, COMPONENT)
+        self.assertEqual(stats.summary("cold"), {"runs": 2, "median_ms": 620.0, "min_ms": 600, "max_ms": 640,
+                                                 "wait_median_ms": 635.0, "launch_state": "COLD"})
+        self.assertEqual(stats.summary("hot")["median_ms"], 95.0)
+        self.assertEqual(stats.format(), "cold 620 ms (600-640), hot 95 ms (90-100), 2 runs")
+        self.assertIn(f"-n {COMPONENT}", shell.call_args[0][2])
+
+    def test_mismatched_launch_states_are_dropped(self):
+        # the second "hot" start found its activity destroyed, the system called it WARM
+        stats, _ = self.measure(COMPONENT, iteration(start(600, 620, "COLD"), start(90, 95, "HOT")),
+                                iteration(start(610, 630, "COLD"), start(300, 310, "WARM")))
+        self.assertEqual((len(stats.samples["cold"]), len(stats.samples["hot"]), stats.dropped), (2, 1, 1))
+        self.assertEqual(stats.to_dict()["dropped"], 1)
+        self.assertTrue(stats.format().endswith("2 runs, 1 dropped (LaunchState mismatch)"))
+
+    def test_failed_start_stops_the_device(self):
+        error = "Error: Activity not started, unable to resolve Intent"
+        stats, shell = self.measure(COMPONENT, iteration(error, error), iterations=3)
+        self.assertFalse(stats.ok)
+        self.assertEqual(stats.error, error)
+        self.assertEqual(shell.call_count, 2)
+        self.assertEqual(stats.format(), f"no startup time ({error})")
+
+    def test_no_launcher_activity(self):
+        stats, _ = self.measure("No activity found", iterations=1)
+        self.assertEqual((stats.component, stats.error), (None, "no launcher activity"))
+
+    def test_no_iterations(self):
+        self.assertEqual(measure_startup(["emulator-5554"], "com.example.app", 0), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
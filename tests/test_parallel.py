@@ -0,0 +1,86 @@
+"""aab_installer.parallel reports and install_on_devices with a stand-in install function."""
+
+import threading
+import time
+import unittest
+
+from aab_installer.parallel import (DeviceResult, InstallReport, failed_results, install_on_devices,
+                                    skipped_results)
+from aab_installer.retry import CircuitBreaker, RetryPolicy
+
+
+def result(device_id, returncode=0, error=None):
+    return DeviceResult(device_id, returncode, "", "" if returncode == 0 else "boom", 1.0, 3.5, "app.apks",
+                        error=error)
+
+
+class InstallReportTest(unittest.TestCase):
+    def test_merge_keeps_results_in_order(self):
+        first = InstallReport("app.apks", [result("a"), result("b")], 2.0, 2)
+        second = InstallReport("app.apks", [result("c", 1, "device-offline")], 1.0, 4)
+        merged = InstallReport.merge([first, second], 5.0)
+        self.assertEqual([device.device_id for device in merged.results], ["a", "b", "c"])
+        self.assertEqual((merged.apks_path, merged.elapsed, merged.max_workers), ("app.apks", 5.0, 4))
+        self.assertFalse(merged)
+        self.assertEqual(merged.failed_devices, ["c"])
+        self.assertEqual(merged.format_failures(), "c (device-offline)")
+
+    def test_merge_of_several_apks_has_no_single_path(self):
+        merged = InstallReport.merge([InstallReport("a.apks", [], 0.0, 1), InstallReport("b.apks", [], 0.0, 1)], 1.0)
+        self.assertIsNone(merged.apks_path)
+        self.assertTrue(merged)
+        self.assertEqual(InstallReport.merge([], 0.0).max_workers, 0)
+
+    def test_to_dict(self):
+        report = InstallReport.merge([skipped_results("app.apks", ["a"]),
+                                      failed_results("app.apks", ["b"], "build failed", error="build")], 1.23456)
+        data = report.to_dict()
+        self.assertEqual((data["apks"], data["ok"], data["elapsed"]), ("app.apks", False, 1.235))
+        skipped, failed = data["devices"]
+        self.assertEqual((skipped["device_id"], skipped["ok"], skipped["skipped"]), ("a", True, True))
+        self.assertEqual((failed["ok"], failed["returncode"], failed["error"], failed["stderr"]),
+                         (False, None, "build", "build failed"))
+        self.assertEqual(result("c").to_dict()["duration"], 2.5)
+
+
+class InstallOnDevicesTest(unittest.TestCase):
+    def test_results_follow_device_order_and_worker_limit(self):
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def install(bundletool_path, apks_path, device_id, java, progress=None, cancel=None):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            # later devices finish first
+            time.sleep(0.05 * (5 - int(device_id[-1])))
+            with lock:
+                running[0] -= 1
+            return result(device_id)
+
+        device_ids = [f"device-{index}" for index in range(5)]
+        report = install_on_devices("bundletool.jar", "app.apks", device_ids, max_workers=2, install=install,
+                                    breaker=CircuitBreaker())
+        self.assertTrue(report)
+        self.assertEqual([device.device_id for device in report.results], device_ids)
+        self.assertEqual(report.max_workers, 2)
+        self.assertLessEqual(peak[0], 2)
+
+    def test_exception_on_one_device_keeps_the_others(self):
+        progress = []
+
+        def install(bundletool_path, apks_path, device_id, java, progress=None, cancel=None):
+            if device_id == "b":
+                raise RuntimeError("adb vanished")
+            return result(device_id)
+
+        report = install_on_devices("bundletool.jar", "app.apks", ["a", "b", "c"], install=install,
+                                    progress=lambda device_id, message: progress.append((device_id, message)),
+                                    retry=RetryPolicy(attempts=1), breaker=CircuitBreaker())
+        self.assertEqual([device.ok for device in report.results], [True, False, True])
+        failed = report.results[1]
+        self.assertEqual((failed.stderr, failed.error, failed.apks_path), ("adb vanished", "unknown", "app.apks"))
+        self.assertIn(("b", "Failed"), progress)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""aab_installer.preflight: keystore passwords and aliases, and AAB structure, checked before a build."""
+
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import unittest
+import zipfile
+
+from aab_installer.preflight import check_aab, check_keystore
+from benchmarks.fake_tools import make_synthetic_aab, write_jks
+
+
+TIMEOUT = 30
+
+
+class PreflightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="preflight-")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def assertError(self, report, text):
+        self.assertFalse(report.ok)
+        self.assertTrue(any(text in error for error in report.errors), report.errors)
+
+
+class JksTest(PreflightTestCase):
+    def setUp(self):
+        super().setUp()
+        self.keystore = write_jks(self.path("debug.jks"), "key0", "storepass", "keypass")
+
+    def test_ok(self):
+        report = check_keystore(self.keystore, "key0", "storepass", "keypass")
+        self.assertEqual((report.errors, report.warnings), ([], []))
+        # JKS aliases are case-insensitive
+        self.assertTrue(check_keystore(self.keystore, "KEY0", "storepass", "keypass").ok)
+
+    def test_wrong_passwords_and_alias(self):
+        self.assertError(check_keystore(self.keystore, "key0", "wrong", "keypass"), "wrong keystore password")
+        self.assertError(check_keystore(self.keystore, "key0", "storepass", "wrong"), "wrong key password for alias")
+        self.assertError(check_keystore(self.keystore, "release", "storepass", "keypass"),
+                         "alias 'release' not found in the keystore (has key0)")
+
+    def test_corrupt_keystore_fails_the_integrity_digest(self):
+        with open(self.keystore, "rb") as f:
+            data = bytearray(f.read())
+        data[40] ^= 0xFF
+        with open(self.keystore, "wb") as f:
+            f.write(data)
+        self.assertError(check_keystore(self.keystore, "key0", "storepass", "keypass"), "wrong keystore password")
+
+    def test_not_a_keystore(self):
+        with open(self.path("notes.txt"), "w") as f:
+            f.write("storepass=storepass\n")
+        self.assertError(check_keystore(self.path("notes.txt"), "key0", "storepass", "keypass"),
+                         "is not a JKS, JCEKS or PKCS12 keystore")
+        self.assertError(check_keystore(self.path("missing.jks"), "key0", "storepass", "keypass"),
+                         "cannot read keystore")
+
+
+@unittest.skipUnless(shutil.which("openssl"), "openssl is needed to write PKCS12 keystores")
+class Pkcs12Test(PreflightTestCase):
+    def write_pkcs12(self, *options):
+        key, cert, keystore = self.path("key.pem"), self.path("cert.pem"), self.path("release.p12")
+        for command in (["req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:P-256", "-nodes",
+                         "-keyout", key, "-out", cert, "-subj", "/CN=test", "-days", "1"],
+                        ["pkcs12", "-export", "-inkey", key, "-in", cert, "-name", "upload", "-passout",
+                         "pass:secret", "-out", keystore, *options]):
+            subprocess.run(["openssl", *command], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True,
+                           timeout=TIMEOUT)
+        return keystore
+
+    def test_sha256_mac(self):
+        keystore = self.write_pkcs12()
+        report = check_keystore(keystore, "upload", "secret", "secret")
+        self.assertEqual((report.errors, report.warnings), ([], []))
+        self.assertError(check_keystore(keystore, "upload", "wrong", "wrong"), "wrong keystore password")
+        self.assertError(check_keystore(keystore, "key0", "secret", "secret"), "alias 'key0' not found")
+
+    def test_sha1_mac_and_a_separate_key_password(self):
+        keystore = self.write_pkcs12("-macalg", "sha1")
+        self.assertError(check_keystore(keystore, "upload", "wrong", "secret"), "wrong keystore password")
+        report = check_keystore(keystore, "upload", "secret", "other")
+        self.assertTrue(report.ok)
+        self.assertEqual(len(report.warnings), 1)
+        self.assertIn("key password was not checked", report.warnings[0])
+
+
+class CheckAabTest(PreflightTestCase):
+    def test_ok(self):
+        aab = make_synthetic_aab(self.path("app.aab"), 2048)
+        report = check_aab(aab)
+        self.assertEqual(report.errors, [])
+        with open(aab, "rb") as f:
+            self.assertEqual(report.digest, hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual((report.info.package, report.info.version_code), ("com.example.fake", 1))
+
+    def test_not_an_aab(self):
+        open(self.path("empty.aab"), "wb").close()
+        self.assertError(check_aab(self.path("empty.aab")), "is empty")
+        with open(self.path("text.aab"), "w") as f:
+            f.write("not a zip")
+        self.assertError(check_aab(self.path("text.aab")), "is not a valid zip archive")
+        with zipfile.ZipFile(self.path("plain.zip"), "w") as archive:
+            archive.writestr("BundleConfig.pb", b"")
+        self.assertError(check_aab(self.path("plain.zip")),
+                         "is not an Android App Bundle: base/manifest/AndroidManifest.xml is missing")
+
+    def test_broken_entries(self):
+        aab = make_synthetic_aab(self.path("app.aab"), 2048)
+        with zipfile.ZipFile(aab, "a") as archive:
+            archive.writestr("../evil.so", b"x")
+        self.assertError(check_aab(aab), "unsafe entry path ../evil.so")
+
+        # a central directory that claims more data than the archive holds
+        aab = make_synthetic_aab(self.path("truncated.aab"), 2048)
+        with open(aab, "rb") as f:
+            data = bytearray(f.read())
+        entry = data.find(b"PK\x01\x02")
+        while data[entry + 46:entry + 46 + 20] != b"base/dex/classes.dex":
+            entry = data.find(b"PK\x01\x02", entry + 4)
+        struct.pack_into("<I", data, entry + 20, 1 << 20)
+        with open(aab, "wb") as f:
+            f.write(data)
+        self.assertError(check_aab(aab), "entry base/dex/classes.dex runs past the end of the archive")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""aab_installer.prewarm: parsing the probe output and holding back devices that are not ready."""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from aab_installer import prewarm
+from aab_installer.prewarm import DeviceReadiness, java_hash, parse_readiness, settle_devices
+from benchmarks.fake_tools import fake_env, install_fake_tools, make_synthetic_aab
+
+
+TIMEOUT = 30
+FAKE_CERTIFICATE_HASH = java_hash(b"fake certificate")
+
+
+class ParseReadinessTest(unittest.TestCase):
+    def test_java_hash(self):
+        # Arrays.hashCode(new byte[0]) == 1, Arrays.hashCode(new byte[]{-1}) == 30
+        self.assertEqual((java_hash(b""), java_hash(b"\xff")), ("1", "1e"))
+        # negative results print as their unsigned 32-bit value, like Integer.toHexString
+        self.assertEqual(len(java_hash(bytes(range(128, 256)))), 8)
+
+    def test_probe_output(self):
+        output = ("@free\n/dev/block/dm-5  115609024 28459920 87018704  25% /data\n"
+                  "@signatures\n    signatures=PackageSignatures{9fbd1cf version:2, signatures:[a1b2c3d4], "
+                  "past signatures:[]}\n@power\n  mWakefulness=Awake\n"
+                  "@sdk\n34\n@abis\narm64-v8a\n@density\nPhysical density: 420\n@locales\nen-US\n")
+        readiness = parse_readiness("emulator-5554", output)
+        self.assertEqual(readiness.free_bytes, 87018704 * 1024)
+        self.assertEqual(readiness.signatures, ["a1b2c3d4"])
+        self.assertTrue(readiness.awake)
+        self.assertEqual(readiness.spec["screenDensity"], 420)
+
+    def test_older_android_and_missing_package(self):
+        readiness = parse_readiness("a", "@free\n@signatures\n    signatures=PackageSignatures{41d3a0 [1a2b3c]}\n"
+                                         "@power\n  mWakefulness=Asleep\n")
+        self.assertEqual((readiness.free_bytes, readiness.signatures, readiness.awake), (None, ["1a2b3c"], False))
+        readiness = parse_readiness("a", "@free\nFilesystem 1K-blocks Used Available\n@signatures\n@power\n")
+        self.assertEqual((readiness.free_bytes, readiness.signatures, readiness.awake), (None, [], None))
+
+
+class SettleDevicesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="prewarm-")
+        tools = install_fake_tools()
+        try:
+            aab = make_synthetic_aab(os.path.join(self.root, "app.aab"), 1024)
+            self.apks = os.path.join(self.root, "app.apks")
+            subprocess.run([os.path.join(tools, "java"), "-jar", "bundletool.jar", "build-apks", f"--bundle={aab}",
+                            f"--output={self.apks}"], env=fake_env(tools, apks_bytes=3 * 2 ** 20), check=True,
+                           timeout=TIMEOUT)
+        finally:
+            shutil.rmtree(tools, ignore_errors=True)
+        self.readiness = {
+            "roomy": DeviceReadiness("roomy", 2 ** 30, [FAKE_CERTIFICATE_HASH], True),
+            "full": DeviceReadiness("full", 2 ** 20, [], True),
+            "other-key": DeviceReadiness("other-key", 2 ** 30, ["deadbeef"], True),
+            "unknown": DeviceReadiness("unknown"),
+        }
+        self.device_ids = ["roomy", "full", "other-key", "unknown", "not-probed"]
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def settle(self, uninstall_result=(True, "Success"), **options):
+        with mock.patch.object(prewarm, "uninstall", return_value=uninstall_result) as uninstall, \
+                mock.patch("sys.stdout"):
+            ready, report = settle_devices(self.apks, self.device_ids, self.readiness, "com.example.fake",
+                                           **options)
+        return ready, {device.device_id: device.error for device in report.results}, uninstall
+
+    def test_conflicting_signatures_are_uninstalled(self):
+        ready, errors, uninstall = self.settle()
+        self.assertEqual(ready, ["roomy", "other-key", "unknown", "not-probed"])
+        self.assertEqual(errors, {"full": "insufficient-storage"})
+        uninstall.assert_called_once_with("other-key", "com.example.fake", "adb")
+
+    def test_conflicts_fail_without_uninstall_or_when_it_fails(self):
+        ready, errors, uninstall = self.settle(uninstall_conflicts=False)
+        self.assertEqual(errors["other-key"], "signature-mismatch")
+        uninstall.assert_not_called()
+        ready, errors, _ = self.settle(uninstall_result=(False, "Failure [DELETE_FAILED_INTERNAL_ERROR]"))
+        self.assertNotIn("other-key", ready)
+        self.assertEqual(errors["other-key"], "signature-mismatch")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""aab_installer.probe: the installed-build check and the parsing of the probe output."""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from aab_installer import probe
+from aab_installer.probe import apks_digests, matches_build, probe_installed, read_bundle_identity
+from benchmarks.fake_tools import make_synthetic_aab
+
+
+SPLITS = {"splits/base-master.apk": b"base", "splits/base-arm64_v8a.apk": b"abi", "splits/base-xxhdpi.apk": b"dpi"}
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class MatchesBuildTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="probe-")
+        self.apks = os.path.join(self.root, "app.apks")
+        with zipfile.ZipFile(self.apks, "w") as apks:
+            apks.writestr("toc.pb", b"")
+            for name, data in SPLITS.items():
+                apks.writestr(name, data)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_apks_digests(self):
+        self.assertEqual(apks_digests(self.apks), {sha256(data) for data in SPLITS.values()})
+
+    def test_installed_subset_of_the_build_matches(self):
+        installed = {"version_code": 7, "apks": {sha256(b"base"), sha256(b"abi")}}
+        self.assertTrue(matches_build(installed, 7, self.apks))
+
+    def test_mismatches(self):
+        cases = {
+            "not installed": None,
+            "other versionCode": {"version_code": 6, "apks": {sha256(b"base")}},
+            "no APKs listed": {"version_code": 7, "apks": set()},
+            "changed split": {"version_code": 7, "apks": {sha256(b"base"), sha256(b"abi v2")}},
+        }
+        for name, installed in cases.items():
+            with self.subTest(name):
+                self.assertFalse(matches_build(installed, 7, self.apks))
+
+
+class ProbeInstalledTest(unittest.TestCase):
+    def probe(self, output):
+        completed = subprocess.CompletedProcess([], 0, output.encode(), b"")
+        with mock.patch.object(probe.subprocess, "run", return_value=completed) as run:
+            result = probe_installed("emulator-5554", "com.example.app", adb="adb")
+        self.assertEqual(run.call_args[0][0][:4], ["adb", "-s", "emulator-5554", "shell"])
+        return result
+
+    def test_installed(self):
+        digest = sha256(b"base")
+        output = (f"@version\n    versionCode=42 minSdk=21 targetSdk=34\n@paths\n"
+                  f"{digest}  /data/app/~~x==/com.example.app-y==/base.apk\n")
+        self.assertEqual(self.probe(output), {"version_code": 42, "apks": {digest}})
+
+    def test_not_installed(self):
+        self.assertEqual(self.probe("@version\n@paths\n"), {"version_code": None, "apks": set()})
+
+
+class BundleIdentityTest(unittest.TestCase):
+    def test_read_from_the_manifest(self):
+        root = tempfile.mkdtemp(prefix="probe-identity-")
+        try:
+            aab = make_synthetic_aab(os.path.join(root, "app.aab"), 1024)
+            self.assertEqual(read_bundle_identity("bundletool.jar", aab), ("com.example.fake", 1))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""aab_installer.process.run_streaming with small Python child processes."""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from aab_installer.process import CANCELLED_RETURNCODE, run_streaming
+
+
+TIMEOUT = 5.0
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+class RunStreamingTest(unittest.TestCase):
+    def test_lines_and_tails(self):
+        lines = []
+        code = "import sys\nfor i in range(10): print(i)\nsys.stderr.write('oops\\n')\nsys.exit(3)"
+        result = run_streaming(python(code), lambda stream, line: lines.append((stream, line)), tail_lines=3)
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stdout, b"7\n8\n9\n")
+        self.assertEqual(result.stderr, b"oops\n")
+        self.assertEqual([line for stream, line in lines if stream == "stdout"], [str(i) for i in range(10)])
+        self.assertIn(("stderr", "oops"), lines)
+
+    @unittest.skipUnless(os.name == "posix", "process groups are POSIX only")
+    def test_cancel_stops_the_child_and_its_children(self):
+        cancel = threading.Event()
+        # the child starts a grandchild that would keep stdout open for a minute
+        code = ("import subprocess, sys, time\n"
+                "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+                "print('started', flush=True)\ntime.sleep(60)")
+
+        def on_line(stream, line):
+            if line == "started":
+                cancel.set()
+
+        started = time.monotonic()
+        result = run_streaming(python(code), on_line, cancel)
+        self.assertEqual(result.returncode, CANCELLED_RETURNCODE)
+        self.assertLess(time.monotonic() - started, TIMEOUT)
+
+    def test_timeout(self):
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            run_streaming(python("import time; time.sleep(60)"), timeout=0.3)
+        self.assertLess(time.monotonic() - started, TIMEOUT)
+
+
+if __name__ == "__main__":
+    unittest.main()
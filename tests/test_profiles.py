@@ -0,0 +1,65 @@
+"""aab_installer.profiles and how a profile reaches the APKS cache key."""
+
+import functools
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from aab_installer import cache, core
+from aab_installer.cache import ApksCache
+from aab_installer.profiles import BUILD_PROFILES, get_profile
+from benchmarks.fake_tools import fake_env, install_fake_tools, make_synthetic_aab, write_jks
+
+
+class BuildProfileTest(unittest.TestCase):
+    def test_get_profile(self):
+        self.assertIs(get_profile("fast-dev"), BUILD_PROFILES["fast-dev"])
+        self.assertTrue(get_profile("fast-dev").per_device_spec)
+        self.assertEqual(get_profile("universal").build_args, ["--mode=universal"])
+        with self.assertRaisesRegex(ValueError, "unknown build profile 'release'"):
+            get_profile("release")
+
+    def test_with_cpus_replaces_the_processor_count(self):
+        profile = get_profile("full-release").with_cpus(4)
+        self.assertEqual(profile.jvm_options, ["-Xmx4g", "-XX:+UseParallelGC", "-XX:ActiveProcessorCount=4"])
+        self.assertEqual(profile.with_cpus(2).jvm_options[-1], "-XX:ActiveProcessorCount=2")
+        self.assertEqual(len(profile.with_cpus(2).jvm_options), 3)
+        # the shared profile is left alone
+        self.assertEqual(get_profile("full-release").jvm_options, ["-Xmx4g", "-XX:+UseParallelGC"])
+        self.assertEqual((profile.name, profile.build_args), ("full-release", []))
+
+
+class ProfileCacheKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.tools = install_fake_tools()
+        self.root = tempfile.mkdtemp(prefix="profiles-")
+        self.bundletool = os.path.join(self.root, "bundletool.jar")
+        open(self.bundletool, "wb").close()
+        self.aab = make_synthetic_aab(os.path.join(self.root, "app.aab"), 1024)
+        self.keystore = write_jks(os.path.join(self.root, "debug.jks"), "key0", "storepass", "keypass")
+        for patch in (mock.patch.object(core, "ApksCache", functools.partial(ApksCache, os.path.join(self.root, "c"))),
+                      mock.patch.dict(os.environ, fake_env(self.tools))):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tools, ignore_errors=True)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def build(self, profile):
+        apks = core.build_apks(self.bundletool, self.aab, self.keystore, "key0", "storepass", "keypass",
+                               java=os.path.join(self.tools, "java"), profile=profile)
+        self.assertIsNotNone(apks)
+        cache.release(apks)
+        return apks
+
+    def test_build_flags_are_cached_apart_but_jvm_options_are_not(self):
+        default = self.build(get_profile("default"))
+        self.assertEqual(self.build(get_profile("full-release").with_cpus(2)), default)
+        self.assertNotEqual(self.build(get_profile("universal")), default)
+
+
+if __name__ == "__main__":
+    unittest.main()
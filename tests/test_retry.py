@@ -0,0 +1,131 @@
+"""aab_installer.retry and install_with_retry: failure classes, backoff, deadlines and the circuit breaker."""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from aab_installer import retry
+from aab_installer.parallel import DeviceResult, install_with_retry
+from aab_installer.retry import CircuitBreaker, Deadline, RetryPolicy, classify_failure
+
+
+class ClassifyFailureTest(unittest.TestCase):
+    def test_classes(self):
+        cases = {
+            "error: device 'emulator-5554' not found": "device-offline",
+            "adb: device unauthorized.": "unauthorized",
+            "com.android.ddmlib.ShellCommandUnresponsiveException": "connection-lost",
+            "Failure [INSTALL_FAILED_INSUFFICIENT_STORAGE]": "insufficient-storage",
+            "Failure [INSTALL_FAILED_UPDATE_INCOMPATIBLE: signatures do not match]": "signature-mismatch",
+            "Failure [INSTALL_FAILED_VERSION_DOWNGRADE]": "version-downgrade",
+            "Failure [INSTALL_FAILED_NO_MATCHING_ABIS]": "incompatible-device",
+            "Failure [INSTALL_FAILED_INVALID_APK]": "install-failed",
+            "something else": "unknown",
+        }
+        for output, code in cases.items():
+            with self.subTest(output):
+                self.assertEqual(classify_failure(output), code)
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_delay_is_jittered_exponential_and_capped(self):
+        policy = RetryPolicy(backoff=2.0, max_backoff=5.0)
+        for attempt, ceiling in ((1, 2.0), (2, 4.0), (3, 5.0), (10, 5.0)):
+            for _ in range(20):
+                self.assertTrue(ceiling / 2 <= policy.delay(attempt) <= ceiling)
+        self.assertEqual(RetryPolicy(attempts=0).attempts, 1)
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_timeout_and_cancel(self):
+        deadline = Deadline(0.05)
+        self.assertFalse(deadline.is_set())
+        time.sleep(0.1)
+        self.assertTrue(deadline.expired and deadline.is_set())
+
+        cancel = threading.Event()
+        deadline = Deadline(None, cancel)
+        self.assertFalse(deadline.is_set())
+        cancel.set()
+        self.assertTrue(deadline.is_set())
+        self.assertFalse(deadline.expired)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_threshold_device_failures(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=60)
+        breaker.record("a", False, "install-failed")  # the build's fault, not the device's
+        breaker.record("a", False, "device-offline")
+        self.assertTrue(breaker.allow("a"))
+        breaker.record("a", False, "timeout")
+        self.assertFalse(breaker.allow("a"))
+        self.assertEqual(breaker.open_devices(), ["a"])
+        breaker.reset("a")
+        self.assertTrue(breaker.allow("a"))
+
+    def test_half_open_after_cooldown(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=10)
+        with mock.patch.object(retry.time, "monotonic", return_value=100.0):
+            breaker.record("a", False, "connection-lost")
+            self.assertFalse(breaker.allow("a"))
+        with mock.patch.object(retry.time, "monotonic", return_value=110.0):
+            self.assertTrue(breaker.allow("a"))
+        breaker.record("a", True)
+        self.assertEqual(breaker.open_devices(), [])
+
+
+class InstallWithRetryTest(unittest.TestCase):
+    def run_install(self, outcomes, policy=None, breaker=None, cancel=None):
+        """install_with_retry over an install returning (returncode, stderr) from `outcomes` in turn."""
+        calls, progress = [], []
+
+        def install(bundletool_path, apks_path, device_id, java, progress=None, cancel=None):
+            returncode, stderr = outcomes[len(calls)]
+            calls.append(cancel)
+            return DeviceResult(device_id, returncode, "", stderr, 0.0, 0.0, apks_path)
+
+        result = install_with_retry(install, "bundletool.jar", "app.apks", "a", cancel=cancel,
+                                    progress=lambda device_id, message: progress.append(message),
+                                    retry=policy or RetryPolicy(attempts=3, backoff=0.0),
+                                    breaker=breaker or CircuitBreaker())
+        return result, calls, progress
+
+    def test_transient_failures_are_retried(self):
+        result, calls, progress = self.run_install([(1, "error: device offline"), (0, "")])
+        self.assertTrue(result.ok)
+        self.assertEqual((result.attempts, len(calls)), (2, 2))
+        self.assertTrue(all(isinstance(deadline, Deadline) for deadline in calls))
+        self.assertTrue(progress[0].startswith("device-offline, retrying in"))
+
+    def test_build_failures_are_not_retried(self):
+        result, calls, _ = self.run_install([(1, "Failure [INSTALL_FAILED_VERSION_DOWNGRADE]")])
+        self.assertEqual((result.error, len(calls)), ("version-downgrade", 1))
+
+    def test_gives_up_after_the_last_attempt_and_opens_the_breaker(self):
+        breaker = CircuitBreaker(threshold=1)
+        result, calls, _ = self.run_install([(1, "error: closed")] * 3, breaker=breaker)
+        self.assertEqual((result.error, result.attempts, len(calls)), ("connection-lost", 3, 3))
+        self.assertEqual(breaker.open_devices(), ["a"])
+        result, calls, _ = self.run_install([], breaker=breaker)
+        self.assertEqual((result.error, calls), ("circuit-open", []))
+
+    def test_timed_out_attempt(self):
+        def install(bundletool_path, apks_path, device_id, java, progress=None, cancel=None):
+            while not cancel.is_set():
+                time.sleep(0.01)
+            return DeviceResult(device_id, 1, "", "cancelled", 0.0, 0.0, apks_path)
+
+        result = install_with_retry(install, "bundletool.jar", "app.apks", "a",
+                                    retry=RetryPolicy(attempts=1, timeout=0.05), breaker=CircuitBreaker())
+        self.assertEqual((result.error, result.stderr), ("timeout", "timed out after 0.05s"))
+
+    def test_cancel_is_not_retried(self):
+        cancel = threading.Event()
+        cancel.set()
+        result, calls, _ = self.run_install([(1, "error: device offline")] * 3, cancel=cancel)
+        self.assertEqual((result.error, len(calls)), ("cancelled", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
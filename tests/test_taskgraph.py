@@ -0,0 +1,63 @@
+"""aab_installer.taskgraph.TaskGraph ordering, failures and cancellation."""
+
+import threading
+import unittest
+
+from aab_installer.taskgraph import TaskGraph
+
+
+TIMEOUT = 5.0
+
+
+class TaskGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = TaskGraph(max_workers=2)
+
+    def tearDown(self):
+        self.graph.shutdown()
+
+    def test_dependency_results_are_passed_in_order(self):
+        self.graph.add_value("a", 2)
+        self.graph.add("b", lambda: 3)
+        self.graph.add("sum", lambda offset, a, b: offset + a * 10 + b, deps=["a", "b"], args=(100,))
+        self.assertEqual(self.graph.result("sum", TIMEOUT), 123)
+
+    def test_failure_reaches_dependents(self):
+        def fail():
+            raise RuntimeError("boom")
+
+        self.graph.add("a", fail)
+        self.graph.add("b", lambda a: a, deps=["a"])
+        with self.assertRaisesRegex(RuntimeError, "boom"):
+            self.graph.result("b", TIMEOUT)
+
+    def test_shutdown_cancels_pending_tasks_and_their_dependents(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocking():
+            started.set()
+            release.wait(TIMEOUT)
+            return "done"
+
+        self.graph.add("running", blocking)
+        self.graph.add("queued", lambda: "never")
+        self.graph.add("other", blocking)
+        self.graph.add("after-running", lambda value: value, deps=["running"])
+        self.graph.add("after-queued", lambda value: value, deps=["queued"])
+        self.assertTrue(started.wait(TIMEOUT))
+
+        self.graph.shutdown(wait=False)
+        release.set()
+        self.assertEqual(self.graph.result("running", TIMEOUT), "done")
+        for name in ("after-running", "after-queued"):
+            self.assertTrue(self.graph.future(name).cancelled(), name)
+        self.assertTrue(self.graph.future("queued").cancelled() or self.graph.result("queued", TIMEOUT) == "never")
+
+    def test_tasks_added_after_shutdown_are_cancelled(self):
+        self.graph.shutdown()
+        self.assertTrue(self.graph.add("late", lambda: 1).cancelled())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""aab_installer.trace spans, JSON lines, Chrome trace and summary table."""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from aab_installer.trace import Tracer
+
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="trace-")
+        self.jsonl = os.path.join(self.root, "trace.jsonl")
+        self.tracer = Tracer(self.jsonl, max_spans=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_spans_record_attributes_and_errors(self):
+        with self.tracer.span("build-apks", aab="app.aab") as s:
+            s.set(exit_code=0, apks_bytes=1234)
+        with self.assertRaises(KeyError), self.tracer.span("install-apks", device="emulator-5554"):
+            raise KeyError("boom")
+
+        build, install = self.tracer.spans()
+        self.assertEqual(build.attrs, {"aab": "app.aab", "exit_code": 0, "apks_bytes": 1234})
+        self.assertEqual(install.attrs["error"], "KeyError")
+        self.assertGreaterEqual(build.duration, 0.0)
+        with open(self.jsonl) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["name"] for line in lines], ["build-apks", "install-apks"])
+        self.assertEqual({line["run"] for line in lines}, {self.tracer.run_id})
+
+    def test_keeps_the_last_spans_and_filters_by_start(self):
+        for index in range(4):
+            with self.tracer.span(f"phase-{index}"):
+                pass
+        self.assertEqual([span.name for span in self.tracer.spans()], ["phase-1", "phase-2", "phase-3"])
+        since = time.time()
+        with self.tracer.span("later"):
+            pass
+        self.assertEqual([span.name for span in self.tracer.spans(since)], ["later"])
+
+    def test_chrome_trace_and_summary(self):
+        with self.tracer.span("install-apks", device="emulator-5554") as s:
+            s.set(exit_code=1, apks_bytes=10)
+        path = os.path.join(self.root, "trace.json")
+        self.tracer.write_chrome_trace(path)
+        with open(path) as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual([event["ph"] for event in events], ["M", "X"])
+        self.assertEqual(events[1]["args"]["device"], "emulator-5554")
+
+        (row,) = self.tracer.summary()
+        self.assertEqual((row[0], row[1], row[3], row[4]), ("install-apks", "emulator-5554", 1, 10))
+        header, line = self.tracer.format_summary().splitlines()
+        self.assertTrue(header.startswith("phase"))
+        self.assertTrue(line.startswith("install-apks  emulator-5554"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""aab_installer.workspace: scratch directories, artifact placement and exports."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from aab_installer import workspace
+from aab_installer.workspace import export_artifacts, free_bytes, place_artifact, scratch_root
+
+
+class WorkspaceTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="workspace-")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def path(self, *names):
+        return os.path.join(self.root, *names)
+
+    def write(self, name, data):
+        with open(self.path(name), "wb") as f:
+            f.write(data)
+        return self.path(name)
+
+    def read(self, *names):
+        with open(self.path(*names), "rb") as f:
+            return f.read()
+
+    def test_place_artifact_replaces_the_destination(self):
+        source = self.write("cached.apks", b"new build")
+        self.write("app.apks", b"old build")
+        self.assertIn(place_artifact(source, self.path("app.apks")), ("reflink", "hardlink", "copy"))
+        self.assertEqual(self.read("app.apks"), b"new build")
+        self.assertEqual(sorted(os.listdir(self.root)), ["app.apks", "cached.apks"])
+
+    def test_place_artifact_falls_back_to_a_copy(self):
+        source = self.write("cached.apks", b"build")
+        with mock.patch.object(workspace, "_reflink", side_effect=OSError("not supported")), \
+                mock.patch.object(workspace.os, "link", side_effect=OSError("cross-device link")):
+            self.assertEqual(place_artifact(source, self.path("out", "app.apks")), "copy")
+        self.assertEqual(self.read("out", "app.apks"), b"build")
+
+    def test_export_names(self):
+        one = self.write("one.apks", b"one")
+        two = self.write("two.apks", b"two")
+        builds = [("/bundles/app.aab", one), ("/bundles/game.aab", two), ("/bundles/app.aab", two)]
+        self.assertTrue(export_artifacts(self.path("out"), builds))
+        self.assertEqual(sorted(os.listdir(self.path("out"))), ["app-1.apks", "app-2.apks", "game.apks"])
+        self.assertEqual(self.read("out", "app-2.apks"), b"two")
+
+    def test_export_of_a_missing_artifact_fails_but_exports_the_rest(self):
+        one = self.write("one.apks", b"one")
+        with mock.patch("sys.stdout"):
+            ok = export_artifacts(self.path("out"), [("app.aab", self.path("gone.apks")), ("game.aab", one)])
+        self.assertFalse(ok)
+        self.assertEqual(os.listdir(self.path("out")), ["game.apks"])
+
+    def test_scratch_root_and_free_bytes(self):
+        with mock.patch.dict(os.environ, {"AAB_INSTALLER_SCRATCH": self.root}):
+            self.assertEqual(scratch_root(10 ** 12), self.path("aab_installer"))
+        with mock.patch.dict(os.environ), mock.patch.object(workspace, "_tmpfs_fits", return_value=False):
+            os.environ.pop("AAB_INSTALLER_SCRATCH", None)
+            self.assertEqual(scratch_root(10 ** 12), os.path.join(workspace.DEFAULT_CACHE_DIR, "tmp"))
+        # the nearest existing parent is measured
+        with mock.patch.object(workspace.shutil, "disk_usage", return_value=mock.Mock(free=5)) as usage:
+            self.assertEqual(free_bytes(self.path("not", "there", "yet")), 5)
+        usage.assert_called_once_with(self.root)
+
+
+if __name__ == "__main__":
+    unittest.main()
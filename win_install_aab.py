@@ -9,166 +9,98 @@ Description: This is an AAB installation on an Android device.
 
 import os
 import sys
-import subprocess
-import time
-import uuid
-from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QFileDialog, QVBoxLayout,
-                             QPushButton, QLabel, QWidget, QPlainTextEdit)
-from PyQt5.QtCore import QThread, pyqtSignal
-
-
-def get_connected_devices():
-    devices_raw = subprocess.check_output(["adb", "devices"])
-    device_ids = [
-        device.split("\t")[0]
-        for device in devices_raw.decode("utf-8").strip().split("\n")[1:]
-    ]
-    return device_ids
-
-
-def generate_keystore(keystore_path, alias, storepass, keypass):
-    keytool_command = [
-            "C:\\Program Files\\Java\\jdk-20\\bin\\keytool.exe", # 改为你自己本地的
-            "-genkey",
-            "-v",
-            "-keystore",
-            keystore_path,
-            "-alias",
-            alias,
-            "-storepass",
-            storepass,
-            "-keypass",
-            keypass,
-            "-keyalg",
-            "RSA",
-            "-keysize",
-            "2048",
-            "-validity",
-            "10000",
-            "-dname",
-            "CN=china, OU=YourOrgUnit, O=YourOrg, L=beijing, S=guangzhou, C=china",
-    ]
-
-    try:
-        result = subprocess.run(keytool_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return keystore_path
-
-    except subprocess.CalledProcessError as e:
-        print(f"Error while generating keystore: {e}, {e.stderr}, {e.stdout}")
-        return None
-
-def build_and_install_apks(bundletool_path, aab_path, keystore_path, alias, storepass, keypass):
-    apk_output = os.path.splitext(aab_path)[0] + ".apks"
-    if os.path.exists(apk_output):
-        os.remove(apk_output)
-
-    result = subprocess.run(
-        [
-            "java",
-            "-jar",
-            bundletool_path,
-            "build-apks",
-            f"--bundle={aab_path}",
-            f"--output={apk_output}",
-            f"--ks={keystore_path}",
-            f"--ks-pass=pass:{storepass}",
-            f"--ks-key-alias={alias}",
-            f"--key-pass=pass:{keypass}",
-        ],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-
-    if result.returncode:
-        print(f"Error: Failed to generate APKS from AAB. Error: {result.stderr.decode('utf-8')}")
-        return
-
-    print("APKS generated successfully!")
-
-    device_ids = get_connected_devices()
-
-    failed_install_count = 0  # 添加初始化 failed_install_count 为 0 的代码
-
-    for device_id in device_ids:
-        result = subprocess.run(
-            [
-                "java",
-                "-jar",
-                bundletool_path,
-                "install-apks",
-                f"--apks={apk_output}",
-                f"--device-id={device_id}",
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-
-        if result.returncode:
-            print(f"Error: Failed to install APKs on {device_id}. Error: {result.stderr.decode('utf-8')}")
-            failed_install_count += 1  # 如果失败，则递增失败计数
-        else:
-            print(f"APKs installed successfully on {device_id}!")
-
-    if failed_install_count == 0:  # 在此添加代码段
-        return "success"
-    else:
-        return "Error: Failed to install APKs on devices"
-
-
-def generate_alias():
-    current_time = datetime.now().strftime("%Y%m%d%H%M%S")
-    alias = f"my-key-alias-{current_time}"
-    return alias
-
-
-class GenerateKeystoreThread(QThread):
-    result_signal = pyqtSignal(str, str)
-
-    def __init__(self, keystore_path, alias, storepass, keypass):
+                             QPushButton, QLabel, QWidget, QPlainTextEdit,
+                             QTableWidget, QTableWidgetItem)
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+
+from aab_installer.archive import read_apks
+from aab_installer.core import PreparedInstall, install_job_message
+from aab_installer.jobs import COLUMNS as JOB_COLUMNS, JobScheduler
+from aab_installer.keystore_pool import KeystorePool
+from aab_installer.profiles import get_profile
+from aab_installer.trace import get_tracer
+
+
+KEYSTORE_STOREPASS = "123456"
+KEYSTORE_KEYPASS = "123456"
+BUNDLETOOL_PATH = r"C:\Users\****\Desktop\budletool-all-1.15.1.jar" # 改为你自己的本地路径
+KEYTOOL_PATH = "C:\\Program Files\\Java\\jdk-20\\bin\\keytool.exe" # 改为你自己本地的
+# 同时安装的设备数量上限
+INSTALL_MAX_WORKERS = 4
+# 按设备配置（get-device-spec）分组构建，只生成设备需要的 split APK
+PER_DEVICE_SPEC_BUILDS = False
+# 构建配置："fast-dev"（只构建已连接设备需要的 split，--local-testing）、"default"、"universal"、"full-release"
+BUILD_PROFILE = "default"
+# 设备上已安装的应用签名不同时先卸载再安装（会清除应用数据）；False 时这些设备直接报错
+UNINSTALL_CONFLICTING_BUILDS = True
+# 安装完成后在每台设备上冷启动、热启动应用的次数，统计启动耗时（am start -W）；0 表示不启动
+LAUNCH_ITERATIONS = 0
+# 不经过 bundletool install-apks，直接把匹配设备的 split 并行写入 pm 安装会话
+DIRECT_INSTALL = False
+# 进度窗口最多保留的行数
+PROGRESS_MAX_LINES = 500
+TIMING_COLUMNS = ["Phase", "Device", "Seconds", "Exit", "APKS bytes"]
+# 任务列表刷新间隔（毫秒）
+JOB_REFRESH_MS = 1000
+
+# 调试签名密钥在多次运行之间复用，备用密钥在后台预先生成
+KEYSTORE_POOL = KeystorePool(storepass=KEYSTORE_STOREPASS, keypass=KEYSTORE_KEYPASS, keytool=KEYTOOL_PATH)
+
+
+class PrepareWatchThread(QThread):
+    """Reports tasks of the install graph to the window as they finish."""
+    task_signal = pyqtSignal(str, str)  # 任务名, 错误信息（成功时为空）
+
+    def __init__(self, graph, names):
         super().__init__()
-        self.keystore_path = keystore_path
-        self.alias = f"my-key-alias-{int(time.time())}"
-        self.storepass = storepass
-        self.keypass = keypass
+        self.graph = graph
+        self.names = names
 
     def run(self):
-        print("Starting generate_keystore thread...")  # 使用 print 函数添加调试输出
-        res = generate_keystore(self.keystore_path, self.alias, self.storepass, self.keypass)
-        if res:
-            print(f"Finished generate_keystore, keystore_path: {res}")
-        else:
-            print(f"Failed generate_keystore")
-        self.result_signal.emit(res, self.alias)
+        for name in self.names:
+            try:
+                self.graph.result(name)
+                self.task_signal.emit(name, "")
+            except Exception as e:
+                print(f"Failed {name}: {e}")
+                self.task_signal.emit(name, str(e) or type(e).__name__)
 
 
-class InstallApksThread(QThread):
+class RotateKeystoreThread(QThread):
     result_signal = pyqtSignal(str)
 
-    def __init__(self, bundletool_path, aab_path, keystore_path, alias, storepass, keypass):
-        super().__init__()
-        self.bundletool_path = bundletool_path
-        self.aab_path = aab_path
-        self.keystore_path = keystore_path
-        self.alias = alias
-        self.storepass = storepass
-        self.keypass = keypass
-
     def run(self):
-        # 更改：在调用 build_and_install_apks() 时将 storepass 设置为 KEYSTORE_STOREPASS
-        res = build_and_install_apks(self.bundletool_path, self.aab_path, self.keystore_path, self.alias, self.storepass, self.keypass)
-        print(f"Finished installing APKs, result: {res}")
-        self.result_signal.emit(res)
-
+        try:
+            _, alias = KEYSTORE_POOL.rotate()
+            self.result_signal.emit(f"Signing key rotated, now using {alias}")
+        except RuntimeError as e:
+            self.result_signal.emit(f"Error: {e}")
 
 
 class AABInstaller(QMainWindow):
+    # 设备（或 "build"）, 进度信息；可以从任意线程发出
+    progress_signal = pyqtSignal(str, str)
+    # 任务编号；任务排队、开始或结束时从任务线程发出
+    job_signal = pyqtSignal(int)
+
     def __init__(self):
         super().__init__()
-        self.generated_alias = ''
+        # 选择 AAB 后开始的构建（aab_installer.core.PreparedInstall），排队安装后归任务所有
+        self.prepared = None
+        self.prepare_thread = None
+        # 每次点击安装都排入队列；使用相同设备的任务依次安装，互不相关的任务同时进行
+        self.scheduler = JobScheduler(on_change=lambda job: self.job_signal.emit(job.job_id))
+        # 任务编号 -> 它的构建开始的时间，用于耗时统计
+        self.job_run_started = {}
+        self.rotate_keystore_thread = None
         self.init_ui()
-        jks_filename = f"auto_generated-{uuid.uuid4().hex[:8]}.jks"
-        self.keystore_path = os.path.join(os.path.expanduser("~"), "Downloads", jks_filename)
+        self.progress_signal.connect(self.on_progress)
+        self.job_signal.connect(self.on_job_changed)
+        self.job_timer = QTimer(self)
+        self.job_timer.timeout.connect(self.refresh_jobs)
+        self.job_timer.start(JOB_REFRESH_MS)
+        KEYSTORE_POOL.start_prefill()
 
     def init_ui(self):
         self.setWindowTitle("AAB Installer")
@@ -189,46 +121,157 @@ class AABInstaller(QMainWindow):
         install_apks_btn.clicked.connect(self.install_apks)
         layout.addWidget(install_apks_btn)
 
+        cancel_btn = QPushButton("Cancel")
+        cancel_btn.clicked.connect(self.cancel)
+        layout.addWidget(cancel_btn)
+
+        rotate_key_btn = QPushButton("Rotate signing key")
+        rotate_key_btn.clicked.connect(self.rotate_keystore)
+        layout.addWidget(rotate_key_btn)
+
+        self.job_table = QTableWidget(0, len(JOB_COLUMNS))
+        self.job_table.setHorizontalHeaderLabels(JOB_COLUMNS)
+        self.job_table.setSelectionBehavior(QTableWidget.SelectRows)
+        layout.addWidget(self.job_table)
+
+        self.progress_view = QPlainTextEdit()
+        self.progress_view.setReadOnly(True)
+        self.progress_view.setMaximumBlockCount(PROGRESS_MAX_LINES)
+        layout.addWidget(self.progress_view)
+
+        self.timing_table = QTableWidget(0, len(TIMING_COLUMNS))
+        self.timing_table.setHorizontalHeaderLabels(TIMING_COLUMNS)
+        layout.addWidget(self.timing_table)
+
         self.setCentralWidget(central_widget)
 
     def open_aab(self):
         aab_path, _ = QFileDialog.getOpenFileName(None, "Select AAB file", "", "AAB files (*.aab)")
         self.aab_text_edit.setPlainText(aab_path)
-
-        self.keystore_path = os.path.join(os.path.dirname(aab_path), "auto_generated.jks")
-        new_alias = generate_alias()
-        self.generate_keystore_thread = GenerateKeystoreThread(self.keystore_path, new_alias, KEYSTORE_STOREPASS,
-                                                               KEYSTORE_KEYPASS)
-        self.generate_keystore_thread.result_signal.connect(self.on_generate_keystore_finished)
-        self.generate_keystore_thread.start()
-
-    def on_generate_keystore_finished(self, keystore_path, alias):
-        if keystore_path:
-            self.status_label.setText("Keystore generated successfully!")
-            self.generated_alias = alias
-        else:
-            self.status_label.setText("Error: Failed to generate keystore")
+        if aab_path:
+            self.start_prepare(aab_path)
+
+    def start_prepare(self, aab_path):
+        # 选择 AAB 后立即取签名密钥并构建 APKS，点击安装时才查询设备，之后连接的设备也会安装
+        self.discard_prepared()
+        self.progress_view.clear()
+        self.prepared = PreparedInstall(BUNDLETOOL_PATH, aab_path, KEYSTORE_POOL.current, KEYSTORE_STOREPASS,
+                                        KEYSTORE_KEYPASS, progress=self.progress_signal.emit,
+                                        max_workers=INSTALL_MAX_WORKERS, per_device_spec=PER_DEVICE_SPEC_BUILDS,
+                                        profile=get_profile(BUILD_PROFILE))
+
+        # 按设备配置构建时，构建要等点击安装、知道设备后才开始
+        names = [name for name in ("keystore", "build") if name in self.prepared.graph.names()]
+        self.prepare_thread = PrepareWatchThread(self.prepared.graph, names)
+        self.prepare_thread.task_signal.connect(self.on_prepare_task_finished)
+        self.prepare_thread.start()
+        self.status_label.setText("Preparing signing key...")
+
+    def discard_prepared(self):
+        # 旧 AAB 的构建不再需要
+        if self.prepare_thread is not None:
+            self.prepare_thread.task_signal.disconnect()
+        if self.prepared is not None:
+            self.prepared.discard()
+        self.prepared = self.prepare_thread = None
+
+    def on_prepare_task_finished(self, name, error):
+        if self.prepared is None or self.scheduler.active():
+            return
+        if name == "keystore":
+            if error:
+                self.status_label.setText("Error: Failed to generate keystore")
+            elif "build" in self.prepared.graph.names():
+                self.status_label.setText("Signing key ready! Building APKS...")
+            else:
+                self.status_label.setText("Signing key ready, click Install to build for the devices.")
+        elif name == "build" and not error:
+            apks_path = self.prepared.graph.result("build")
+            if apks_path is None:
+                return
+            self.status_label.setText("APKS ready, click Install to push to devices.")
+            # 直接读取 .apks 的 toc.pb 和 manifest，展示包名、版本和拆分信息
+            try:
+                self.on_progress("apks", read_apks(apks_path).summary())
+            except (OSError, ValueError) as e:
+                self.on_progress("apks", f"Cannot read {apks_path}: {e}")
+
+    def show_timings(self, since):
+        # 本次运行各阶段耗时（keygen、构建、每台设备的安装）
+        rows = get_tracer().summary(since=since)
+        self.timing_table.setRowCount(len(rows))
+        for row, (phase, device, seconds, exit_code, apks_bytes) in enumerate(rows):
+            for column, value in enumerate((phase, device, f"{seconds:.2f}", str(exit_code), str(apks_bytes))):
+                self.timing_table.setItem(row, column, QTableWidgetItem(value))
+        self.timing_table.resizeColumnsToContents()
+
+    def on_progress(self, name, message):
+        self.progress_view.appendPlainText(f"[{name}] {message}")
+
+    def cancel(self):
+        # 在任务列表中选中任务时只取消选中的任务，否则取消正在准备的构建和所有未结束的任务
+        jobs = self.scheduler.jobs()
+        rows = {index.row() for index in self.job_table.selectedIndexes()}
+        for row in rows:
+            if row < len(jobs):
+                self.scheduler.cancel(jobs[row].job_id)
+        if not rows:
+            self.scheduler.cancel()
+            # 已取消的构建不能再用，下次安装时重新准备
+            self.discard_prepared()
+        self.status_label.setText("Cancelling...")
+
+    def rotate_keystore(self):
+        self.rotate_keystore_thread = RotateKeystoreThread()
+        self.rotate_keystore_thread.result_signal.connect(self.on_rotate_keystore_finished)
+        self.rotate_keystore_thread.start()
+        self.status_label.setText("Rotating signing key...")
+
+    def on_rotate_keystore_finished(self, message):
+        self.status_label.setText(message)
+        # 已经开始的构建使用的是旧密钥，重新准备
+        if self.prepared is not None and not message.startswith("Error") and not self.scheduler.active():
+            self.start_prepare(self.prepared.aab_path)
 
     def install_apks(self):
         aab_path = self.aab_text_edit.toPlainText()
 
-        if aab_path and self.generated_alias:
-            self.install_apks_thread = InstallApksThread(BUNDLETOOL_PATH, aab_path, self.keystore_path,
-                                                         self.generated_alias, KEYSTORE_STOREPASS, KEYSTORE_KEYPASS)
-            self.install_apks_thread.result_signal.connect(self.on_install_apks_finished)
-            self.install_apks_thread.start()
-            self.status_label.setText("Installing APKs...")
-        elif not aab_path:
+        if not aab_path:
             self.status_label.setText("Please select an AAB file.")
-        else:
-            self.status_label.setText("Please wait for the keystore to be generated.")
-
-    def on_install_apks_finished(self, result):
-        if result == "success":
-            self.status_label.setText("Done!")
-        else:
-            self.status_label.setText("Error: Failed to install APKs on devices")
-
+            return
+        if self.prepared is None or aab_path != self.prepared.aab_path:
+            self.start_prepare(aab_path)
+
+        # 构建在选择 AAB 时已经开始；现在查询设备，安装排队，等使用相同设备的任务结束后再推送
+        job = self.prepared.queue(self.scheduler, os.path.basename(aab_path), max_workers=INSTALL_MAX_WORKERS,
+                                  direct=DIRECT_INSTALL, uninstall_conflicts=UNINSTALL_CONFLICTING_BUILDS,
+                                  launch_iterations=LAUNCH_ITERATIONS)
+        self.job_run_started[job.job_id] = self.prepared.started
+        # 这次的构建归任务所有，之后选择 AAB 或再次安装时重新准备
+        self.prepare_thread.task_signal.disconnect()
+        self.prepared = self.prepare_thread = None
+        self.status_label.setText(f"Install #{job.job_id} queued")
+
+    def on_job_changed(self, job_id):
+        self.refresh_jobs()
+        job = self.scheduler.get(job_id)
+        if job.active:
+            return
+        print(f"Finished job #{job.job_id} ({job.name}): {job.state}, result: {job.result}")
+        self.status_label.setText(f"#{job.job_id} {job.name}: {install_job_message(job)}")
+        self.show_timings(self.job_run_started.get(job_id, job.submitted))
+
+    def refresh_jobs(self):
+        # 排队、运行中和已结束的任务；耗时对排队中的任务是已等待的时间
+        jobs = self.scheduler.jobs()
+        self.job_table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            for column, value in enumerate(job.row()):
+                item = self.job_table.item(row, column)
+                if item is None:
+                    self.job_table.setItem(row, column, QTableWidgetItem(value))
+                elif item.text() != value:
+                    item.setText(value)
 
 
 def main():
@@ -239,7 +282,4 @@ def main():
 
 
 if __name__ == '__main__':
-    KEYSTORE_STOREPASS = "123456"
-    KEYSTORE_KEYPASS = "123456"
-    BUNDLETOOL_PATH = r"C:\Users\****\Desktop\budletool-all-1.15.1.jar" # 改为你自己的本地路径
     main()